@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+### synthetic brainlife.io project generator for benchmarking
+## datatypes written for every subject / session, with the filename collect_data is asked to load for each
+DATATYPES = {
+    'neuro/tractmeasures': 'tractmeasures.csv',
+    'neuro/parc-stats': 'cortex.tsv',
+    'neuro/network': 'network.json.gz',
+}
+
+TRACT_MEASURES = ['ad','fa','md','rd']
+CORTEX_MEASURES = ['thickness','volume','surface_area']
+CLASSES = {'control': '#1f77b4', 'patient': '#d62728'}
+
+## builds one warehouse listing object, in the same shape as https://brainlife.io/api/warehouse/secondary/list/<project>
+def build_listing_object(datatype,subject,session,path,finish_date,tags,datatype_tags):
+
+    return {
+        'datatype': {'name': datatype},
+        'path': path,
+        'finish_date': finish_date,
+        'output': {
+            'meta': {'subject': subject, 'session': session},
+            'tags': tags,
+            'datatype_tags': datatype_tags,
+        },
+    }
+
+## tract profiles: one row per structure and node
+def write_tractmeasures(path,structures,n_nodes,rng):
+
+    nodes = np.arange(1,n_nodes+1)
+    profile = np.sin(np.linspace(0,np.pi,n_nodes))
+    data = pd.DataFrame({'structureID': np.repeat(structures,n_nodes), 'nodeID': np.tile(nodes,len(structures))})
+    for i, m in enumerate(TRACT_MEASURES):
+        data[m] = (0.3 + 0.1*i) + 0.1*np.tile(profile,len(structures)) + rng.normal(scale=0.02,size=len(data))
+
+    data.to_csv(path,index=False)
+
+## cortex parcellation stats: one row per roi
+def write_cortex(path,n_rois,rng):
+
+    data = pd.DataFrame({'structureID': [ 'roi_%03d' %f for f in range(n_rois) ]})
+    data['thickness'] = rng.normal(2.5,0.2,n_rois)
+    data['volume'] = rng.normal(8000,1000,n_rois)
+    data['surface_area'] = rng.normal(2500,300,n_rois)
+
+    data.to_csv(path,sep='\t',index=False)
+
+## weighted, fully connected network with local and global measures, saved as gzipped jgf
+def write_network(path,n_network_nodes,rng):
+
+    import igraph
+    import jgf
+
+    graph = igraph.Graph.Full(n_network_nodes)
+    graph.es['weight'] = rng.random(graph.ecount()).tolist()
+    graph.vs['name'] = [ 'node_%03d' %f for f in range(n_network_nodes) ]
+    graph.vs['degree'] = graph.degree()
+    graph.vs['strength'] = graph.strength(weights='weight')
+    graph['density'] = graph.density()
+    graph['mean_weight'] = float(np.mean(graph.es['weight']))
+
+    jgf.igraph.save(graph,path,compressed=True)
+
+## this function fabricates a project under outDir: a warehouse listing (listing.json), an input/ tree with one file per object, and
+## input/participants.json. every subject also gets a tractmeasures object with unrelated datatype tags, so the tag filtering in
+## collect_data gets exercised. returns the listing
+def generate_project(outDir,n_subjects=20,n_sessions=1,n_structures=10,n_nodes=100,n_rois=50,n_network_nodes=50,seed=0):
+
+    rng = np.random.default_rng(seed)
+    structures = [ 'tract_%03d' %f for f in range(n_structures) ]
+    input_dir = os.path.join(outDir,'input')
+    if not os.path.exists(input_dir):
+        os.makedirs(input_dir)
+
+    listing = []
+    participants = []
+    for s in range(n_subjects):
+        subject = 'sub-%04d' %(s+1)
+        participants.append({'subjectID': subject, 'classID': list(CLASSES.keys())[s % len(CLASSES)], 'age': int(rng.integers(18,80))})
+        for ses in range(n_sessions):
+            session = str(ses+1)
+            for datatype, filename in DATATYPES.items():
+                path = '%s/ses-%s/%s' %(subject,session,datatype.split('/')[1])
+                os.makedirs(os.path.join(input_dir,path),exist_ok=True)
+                if filename.endswith('.csv'):
+                    write_tractmeasures(os.path.join(input_dir,path,filename),structures,n_nodes,rng)
+                elif filename.endswith('.tsv'):
+                    write_cortex(os.path.join(input_dir,path,filename),n_rois,rng)
+                else:
+                    write_network(os.path.join(input_dir,path,filename),n_network_nodes,rng)
+                listing.append(build_listing_object(datatype,subject,session,path,'2023-06-01T00:00:00.000Z',['benchmark'],['cleaned']))
+
+            # tractmeasures object that should be filtered out by datatype tags
+            listing.append(build_listing_object('neuro/tractmeasures',subject,session,'%s/ses-%s/tractmeasures' %(subject,session),'2023-01-01T00:00:00.000Z',['benchmark'],['raw']))
+
+    with open(os.path.join(outDir,'listing.json'),'w') as listing_f:
+        json.dump(listing,listing_f)
+
+    with open(os.path.join(input_dir,'participants.json'),'w') as participants_f:
+        json.dump(participants,participants_f)
+
+    return listing
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='generate a synthetic brainlife.io project for benchmarking')
+    parser.add_argument('outDir')
+    parser.add_argument('--subjects',type=int,default=20)
+    parser.add_argument('--sessions',type=int,default=1)
+    parser.add_argument('--structures',type=int,default=10)
+    parser.add_argument('--nodes',type=int,default=100)
+    parser.add_argument('--rois',type=int,default=50)
+    parser.add_argument('--network-nodes',type=int,default=50)
+    parser.add_argument('--seed',type=int,default=0)
+    args = parser.parse_args()
+
+    listing = generate_project(args.outDir,args.subjects,args.sessions,args.structures,args.nodes,args.rois,args.network_nodes,args.seed)
+    print('wrote %d objects to %s' %(len(listing),args.outDir))
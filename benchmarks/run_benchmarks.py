@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+from unittest import mock
+
+# make the working tree importable when run as a script
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from generate_project import generate_project, TRACT_MEASURES
+
+### benchmark harness for pybrainlife
+## collect_data fetches the warehouse listing over http. this stands in for requests.get and serves the generated listing instead
+class ListingResponse:
+
+    def __init__(self,listing):
+        self.listing = listing
+
+    def json(self):
+        return self.listing
+
+## each benchmark takes the shared context dictionary and returns the number of rows / items it produced. setup work that the
+## benchmark depends on (i.e. collected data) is stored on the context by earlier benchmarks
+def bench_collect_data(context):
+
+    from pybrainlife.data.collect import collect_data
+
+    data, obj_tags, obj_datatype_tags = collect_data('neuro/tractmeasures',['cleaned'],['benchmark'],'tractmeasures.csv','',duplicates=True,overwrite=True)
+    participants = pd.read_json('input/participants.json',dtype=False)
+    data = pd.merge(data,participants[['subjectID','classID']],on='subjectID')
+    data['colors'] = data['classID'].map({'control': '#1f77b4', 'patient': '#d62728'})
+    context['tractmeasures'] = data
+
+    return len(data)
+
+def bench_outlier_detection(context):
+
+    from pybrainlife.data.manipulate import outlier_detection
+
+    data = context['tractmeasures']
+    structures = data['structureID'].unique().tolist()
+    out = outlier_detection(data,structures,'nodeID',TRACT_MEASURES,95,'euclidean',True,True,100,'benchmark',context['out_dir'],'reference')
+
+    return len(out[0])
+
+def bench_parse_networks(context):
+
+    from pybrainlife.data.collect import collect_data
+    from pybrainlife.data.manipulate import parse_networks
+
+    networks = collect_data('neuro/network',[],['benchmark'],'network.json.gz','',overwrite=True)[0]
+    connectivity, global_measures, local_measures = parse_networks(networks)
+    context['connectivity'] = connectivity
+
+    return len(networks)
+
+def bench_threshold_matrices(context):
+
+    from pybrainlife.data.manipulate import binarize_matrices, threshold_matrices
+
+    # one adjacency matrix per subject / session, in the dictionary layout the network functions expect
+    matrices = {}
+    for (subject,session), g in context['connectivity'].groupby(['subjectID','sessionID'],sort=False):
+        matrices['%s_sess%s' %(subject,session)] = g.drop(columns=['subjectID','sessionID','tags','datatype_tags']).values.astype(float)
+    bin_data = binarize_matrices(matrices)
+    data = threshold_matrices(matrices,bin_data,0.5)
+
+    return len(data)
+
+def bench_plot_profiles(context):
+
+    from pybrainlife.vis.plots import batch_plot_profiles
+
+    data = context['tractmeasures']
+    structures = data['structureID'].unique().tolist()[:context['plot_structures']]
+    img_names = batch_plot_profiles(structures,data,TRACT_MEASURES,'mean','sem',os.path.join(context['out_dir'],'profiles'),'profiles',n_procs=context['n_procs'])
+
+    return len(img_names)
+
+BENCHMARKS = [
+    ('collect_data', bench_collect_data),
+    ('outlier_detection', bench_outlier_detection),
+    ('parse_networks', bench_parse_networks),
+    ('threshold_matrices', bench_threshold_matrices),
+    ('plot_profiles', bench_plot_profiles),
+]
+
+## runs a benchmark repeat times for wall time, then once more under tracemalloc for peak python/numpy memory. tracemalloc slows
+## allocation-heavy code down, so it is kept out of the timed runs
+def run_benchmark(func,context,repeat):
+
+    times = []
+    for r in range(repeat):
+        start = time.perf_counter()
+        items = func(context)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(context)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'items': items, 'wall_time_min': min(times), 'wall_time_median': float(np.median(times)), 'peak_memory_mb': peak / 1024**2}
+
+## current git commit of the working tree, if available
+def current_commit():
+
+    try:
+        return subprocess.run(['git','rev-parse','--short','HEAD'],cwd=os.path.dirname(os.path.abspath(__file__)),capture_output=True,text=True,check=True).stdout.strip()
+    except (OSError,subprocess.CalledProcessError):
+        return ''
+
+## prints each benchmark next to the same benchmark from the last run in history with the same scale
+def print_results(results,previous):
+
+    print('%-20s %8s %12s %12s %12s' %('benchmark','items','time (s)','peak (MB)','vs last'))
+    for name, result in results.items():
+        change = ''
+        if previous and name in previous['results']:
+            change = '%+.1f%%' %(100 * (result['wall_time_min'] / previous['results'][name]['wall_time_min'] - 1))
+        print('%-20s %8d %12.3f %12.1f %12s' %(name,result['items'],result['wall_time_min'],result['peak_memory_mb'],change))
+
+def main():
+
+    parser = argparse.ArgumentParser(description='time pybrainlife pipelines on a synthetic project')
+    parser.add_argument('--subjects',type=int,default=20)
+    parser.add_argument('--sessions',type=int,default=1)
+    parser.add_argument('--structures',type=int,default=10)
+    parser.add_argument('--nodes',type=int,default=100)
+    parser.add_argument('--rois',type=int,default=50)
+    parser.add_argument('--network-nodes',type=int,default=50)
+    parser.add_argument('--plot-structures',type=int,default=2,help='number of structures to plot')
+    parser.add_argument('--procs',type=int,default=1,help='worker processes for plot rendering')
+    parser.add_argument('--repeat',type=int,default=3)
+    parser.add_argument('--only',nargs='*',default=[],help='benchmarks to run (dependencies are run too)')
+    parser.add_argument('--project-dir',default='',help='reuse (or create) the synthetic project here instead of a temporary directory')
+    parser.add_argument('--history',default=os.path.join(os.path.dirname(os.path.abspath(__file__)),'history.jsonl'),help='json lines file results are appended to')
+    args = parser.parse_args()
+
+    scale = {'subjects': args.subjects, 'sessions': args.sessions, 'structures': args.structures, 'nodes': args.nodes, 'rois': args.rois, 'network_nodes': args.network_nodes}
+
+    tmp_dir = tempfile.TemporaryDirectory()
+    project_dir = os.path.abspath(args.project_dir) if args.project_dir else tmp_dir.name
+    if not os.path.exists(os.path.join(project_dir,'listing.json')):
+        generate_project(project_dir,args.subjects,args.sessions,args.structures,args.nodes,args.rois,args.network_nodes)
+    with open(os.path.join(project_dir,'listing.json')) as listing_f:
+        listing = json.load(listing_f)
+
+    # collect_data resolves input/ relative to the working directory
+    cwd = os.getcwd()
+    os.chdir(project_dir)
+    os.environ['PROJECT_ID'] = 'benchmark'
+    out_dir = os.path.join(project_dir,'output')
+    os.makedirs(out_dir,exist_ok=True)
+    context = {'out_dir': out_dir, 'plot_structures': args.plot_structures, 'n_procs': args.procs}
+
+    # benchmarks depend on the ones before them, so run everything up to the last requested one
+    names = [ f[0] for f in BENCHMARKS ]
+    last = max([ names.index(f) for f in args.only ]) if args.only else len(names) - 1
+
+    results = {}
+    try:
+        with mock.patch('requests.get',return_value=ListingResponse(listing)):
+            for name, func in BENCHMARKS[:last+1]:
+                if args.only and name not in args.only:
+                    func(context)
+                    continue
+                results[name] = run_benchmark(func,context,args.repeat)
+    finally:
+        os.chdir(cwd)
+        tmp_dir.cleanup()
+
+    # compare against the last run at the same scale, then append this one
+    previous = None
+    if os.path.exists(args.history):
+        with open(args.history) as history_f:
+            runs = [ json.loads(f) for f in history_f if f.strip() ]
+        runs = [ f for f in runs if f['scale'] == scale ]
+        previous = runs[-1] if runs else None
+
+    print_results(results,previous)
+
+    with open(args.history,'a') as history_f:
+        history_f.write(json.dumps({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': current_commit(), 'scale': scale, 'results': results})+'\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import importlib
+import numpy as np
+import pandas as pd
+
+### optional arrow / polars engines for tabular work
+## 'pandas' is the default everywhere. 'pyarrow' and 'polars' read csv / tsv with their multithreaded parsers and run groupbys on all cores.
+## neither is a dependency of pybrainlife; install pyarrow (and polars, which needs pyarrow to hand data back) to use them. every function here
+## takes and returns pandas dataframes
+BACKENDS = ['pandas','pyarrow','polars']
+
+## raises a ValueError for an unknown backend and an ImportError if its package isn't installed
+def check_backend(backend):
+
+    if backend not in BACKENDS:
+        raise ValueError('unknown backend %s. choose one of %s' %(backend,', '.join(BACKENDS)))
+
+    packages = {'pandas': [], 'pyarrow': ['pyarrow'], 'polars': ['polars','pyarrow']}
+    for package in packages[backend]:
+        try:
+            importlib.import_module(package)
+        except ImportError:
+            raise ImportError('the %s backend needs %s installed: pip install %s' %(backend,package,package))
+
+## reads a csv / tsv file. the arrow / polars engines are given pandas' default missing value strings, and polars string columns that only hold
+## whitespace-padded numbers are parsed as numbers, so every backend returns the same dataframe as pd.read_csv
+def read_table(path,sep=',',backend='pandas'):
+
+    from pandas._libs.parsers import STR_NA_VALUES
+
+    null_values = sorted(STR_NA_VALUES)
+    if backend == 'pyarrow':
+        from pyarrow import csv
+        return csv.read_csv(path,parse_options=csv.ParseOptions(delimiter=sep),
+                            convert_options=csv.ConvertOptions(null_values=null_values,strings_can_be_null=True)).to_pandas()
+    elif backend == 'polars':
+        import polars as pl
+        frame = pl.read_csv(path,separator=sep,infer_schema_length=None,null_values=null_values)
+        for column in [ f for f in frame.columns if frame[f].dtype == pl.Utf8 ]:
+            stripped = frame[column].str.strip_chars()
+            for dtype in [pl.Int64,pl.Float64]:
+                parsed = stripped.cast(dtype,strict=False)
+                if parsed.null_count() == stripped.null_count():
+                    frame = frame.with_columns(parsed.alias(column))
+                    break
+        return frame.to_pandas()
+
+    return pd.read_csv(path,sep=sep)
+
+## numeric columns of data that aren't grouping keys. like pandas' groupby().mean() these are the columns that get aggregated
+def numeric_columns(data,keys):
+
+    return [ f for f in data.columns if f not in keys and pd.api.types.is_numeric_dtype(data[f]) and not pd.api.types.is_bool_dtype(data[f]) ]
+
+## groups data by keys and aggregates every numeric column with agg ('mean' or 'std', i.e. sample standard deviation as in pandas). returns a
+## dataframe with the keys as columns, sorted by the keys like pandas' groupby
+def groupby_aggregate(data,keys,agg,backend='pandas'):
+
+    keys = [keys] if isinstance(keys,str) else list(keys)
+    columns = numeric_columns(data,keys)
+
+    if backend == 'pyarrow':
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        table = pa.Table.from_pandas(data[keys+columns],preserve_index=False)
+        if agg == 'std':
+            function = 'stddev'
+            aggregations = [ (f,function,pc.VarianceOptions(ddof=1)) for f in columns ]
+        else:
+            function = agg
+            aggregations = [ (f,function) for f in columns ]
+        out = table.group_by(keys).aggregate(aggregations).to_pandas()
+        out = out.rename(columns={ f+'_'+function: f for f in columns }).sort_values(keys)
+    elif backend == 'polars':
+        import polars as pl
+        frame = pl.from_pandas(data[keys+columns])
+        if agg == 'std':
+            aggregations = [ pl.col(f).std() for f in columns ]
+        else:
+            aggregations = [ getattr(pl.col(f),agg)() for f in columns ]
+        out = frame.group_by(keys).agg(aggregations).sort(keys).to_pandas()
+    else:
+        # pandas keeps its own handling of non-numeric columns
+        return getattr(data.groupby(keys),agg)().reset_index()
+
+    return out[keys+columns].reset_index(drop=True)
+
+## replaces cells that only hold whitespace with nans, as data.replace(r'^\s+$',np.nan,regex=True). the arrow / polars engines only run the
+## regex over string columns, with their vectorized string kernels
+def replace_blank_strings(data,backend='pandas'):
+
+    if backend == 'pandas':
+        return data.replace(r'^\s+$', np.nan, regex=True)
+
+    data = data.copy(deep=False)
+    for c in data.columns[data.dtypes == object]:
+        if pd.api.types.infer_dtype(data[c],skipna=True) != 'string':
+            # lists (i.e. tags) and mixed columns go through pandas
+            data[c] = data[c].replace(r'^\s+$', np.nan, regex=True)
+            continue
+
+        values = data[c].to_numpy()
+        if backend == 'pyarrow':
+            import pyarrow as pa
+            import pyarrow.compute as pc
+            blank = pc.match_substring_regex(pa.array(values,from_pandas=True),r'^\s+$').to_numpy(zero_copy_only=False)
+        else:
+            import polars as pl
+            blank = pl.Series(values,dtype=pl.Utf8).str.contains(r'^\s+$').to_numpy()
+        blank = np.asarray(blank,dtype=object)
+        blank = np.where(pd.isnull(blank),False,blank).astype(bool)
+        if blank.any():
+            data[c] = data[c].mask(blank)
+
+    return data
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from pybrainlife.data.instrument import stage
+
+### bootstrap confidence bands
+## memory allowed for one chunk of replicates (the replicate x subject index and weight matrices and the replicate x node products)
+DEFAULT_CHUNK_BYTES = 256 * 1024**2
+
+## resampling of subjects for n_boot replicates: row b holds the subjects drawn (with replacement) for replicate b
+def bootstrap_indices(n_subjects,n_boot,seed=0):
+
+    return np.random.default_rng(seed).integers(0,n_subjects,size=(n_boot,n_subjects))
+
+## bootstrap_indices drawn chunk replicates at a time, so the full n_boot x subjects matrix is never held. yields the first replicate of every
+## chunk and its indices, the same rows bootstrap_indices returns for seed
+def bootstrap_index_chunks(n_subjects,n_boot,chunk,seed=0):
+
+    rng = np.random.default_rng(seed)
+    for start in range(0,n_boot,chunk):
+        yield start, rng.integers(0,n_subjects,size=(min(chunk,n_boot-start),n_subjects))
+
+## how many times each subject is drawn in each replicate of indices. replicate means are then weight matrix products
+def bootstrap_weights(indices,n_subjects):
+
+    n_boot = indices.shape[0]
+    offsets = (np.arange(n_boot) * n_subjects)[:,None]
+
+    return np.bincount((indices + offsets).ravel(),minlength=n_boot*n_subjects).reshape(n_boot,n_subjects).astype(float)
+
+## this function computes the mean of values (subjects x nodes, or subjects x anything) for n_boot bootstrap resamplings of the subjects. nans
+## are skipped, as in np.nanmean. replicates are processed in chunks small enough for chunk_bytes. returns an n_boot x nodes array
+def bootstrap_means(values,n_boot=2000,seed=0,chunk_bytes=DEFAULT_CHUNK_BYTES):
+
+    values = np.asarray(values,dtype=float)
+    n_subjects = values.shape[0]
+    flat = values.reshape(n_subjects,-1)
+    valid = ~np.isnan(flat)
+    filled = np.where(valid,flat,0)
+    valid = valid.astype(float)
+
+    chunk = max(1,int(chunk_bytes / (8 * (2 * n_subjects + 2 * flat.shape[1]))))
+
+    means = np.empty((n_boot,flat.shape[1]))
+    with stage('bootstrap',rows=n_boot) as record:
+        for start, indices in bootstrap_index_chunks(n_subjects,n_boot,chunk,seed):
+            weights = bootstrap_weights(indices,n_subjects)
+            with np.errstate(divide='ignore',invalid='ignore'):
+                means[start:start+chunk] = (weights @ filled) / (weights @ valid)
+        record['chunks'] = int(np.ceil(n_boot / chunk))
+
+    return means.reshape((n_boot,)+values.shape[1:])
+
+## percentile bootstrap confidence band of the mean of values (subjects x nodes). returns the lower and upper bounds of the ci percent interval
+def bootstrap_mean_ci(values,n_boot=2000,ci=95,seed=0,chunk_bytes=DEFAULT_CHUNK_BYTES):
+
+    means = bootstrap_means(values,n_boot,seed,chunk_bytes)
+    with np.errstate(all='ignore'):
+        lower, upper = np.nanpercentile(means,[(100-ci)/2,100-(100-ci)/2],axis=0)
+
+    return lower, upper
+
+## this function pivots the profiles of one measure into a subjects x nodes array. sessions of the same subject are averaged, so the bootstrap
+## resamples subjects. without a nodeID column, every subject is a single node. returns the array and its nodeIDs
+def subject_node_array(data,measure):
+
+    if 'nodeID' not in data.columns:
+        values = data.groupby('subjectID')[measure].mean()
+        return values.to_numpy()[:,None], np.array([1])
+
+    table = data.groupby(['subjectID','nodeID'])[measure].mean().unstack('nodeID')
+
+    return table.to_numpy(dtype=float), table.columns.to_numpy()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import os
+import pickle
+import hashlib
+import tempfile
+import threading
+
+### on-disk caches
+## default size limit for a cache directory
+DEFAULT_CACHE_BYTES = 2 * 1024**3
+
+## size-bounded, least recently used cache of pickled values in a directory. entries are content addressed by a hex key and spread over
+## subdirectories by the first two characters of the key. reading an entry touches its mtime, and once the directory grows past max_bytes
+## the entries with the oldest mtime are removed first
+class DiskCache:
+
+    def __init__(self,cacheDir,max_bytes=DEFAULT_CACHE_BYTES):
+
+        self.cacheDir = cacheDir
+        self.max_bytes = max_bytes
+        self._sizes = None
+        self._lock = threading.Lock()
+        if not os.path.exists(cacheDir):
+            os.makedirs(cacheDir)
+
+    def _file(self,key):
+        return os.path.join(self.cacheDir,key[:2],key+'.pkl')
+
+    ## sizes of the entries on disk, scanned once and then kept up to date by put and evict
+    def _entry_sizes(self):
+
+        if self._sizes is None:
+            self._sizes = {}
+            for root, dirs, files in os.walk(self.cacheDir):
+                for f in files:
+                    if f.endswith('.pkl'):
+                        self._sizes[os.path.join(root,f)] = os.path.getsize(os.path.join(root,f))
+
+        return self._sizes
+
+    def __contains__(self,key):
+        return os.path.exists(self._file(key))
+
+    ## returns the cached value for key, or default if it isn't cached
+    def get(self,key,default=None):
+
+        path = self._file(key)
+        try:
+            with open(path,'rb') as cache_f:
+                value = pickle.load(cache_f)
+        except (OSError,EOFError,pickle.UnpicklingError):
+            return default
+
+        # mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return value
+
+    ## stores value under key, then evicts least recently used entries if the cache is over its size limit
+    def put(self,key,value):
+
+        path = self._file(key)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path),exist_ok=True)
+
+        # write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),suffix='.tmp')
+        with os.fdopen(fd,'wb') as cache_f:
+            pickle.dump(value,cache_f,protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path,path)
+
+        with self._lock:
+            self._entry_sizes()[path] = os.path.getsize(path)
+            self.evict()
+
+    ## removes least recently used entries until the cache fits in max_bytes
+    def evict(self):
+
+        sizes = self._entry_sizes()
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return
+
+        entries = []
+        for path in list(sizes.keys()):
+            try:
+                entries.append((os.path.getmtime(path),path))
+            except OSError:
+                del sizes[path]
+        for mtime, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            total = total - sizes.pop(path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    ## removes every entry
+    def clear(self):
+
+        with self._lock:
+            for path in list(self._entry_sizes().keys()):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._sizes = {}
+
+## key for a parsed warehouse object file. path is the input/<path>/<filename> path collect_data loads; a new finish_date means a new key
+def parse_cache_key(path,finish_date):
+
+    return hashlib.sha1(repr((path,str(finish_date))).encode()).hexdigest()
+
+## content hash of a dataframe: its columns, dtypes and the per-row hashes of pd.util.hash_pandas_object (the index is ignored). object
+## columns holding unhashable values (i.e. tag lists, arrays, graphs) are hashed cell by cell from their pickled bytes
+def hash_frame(data):
+
+    import pandas as pd
+
+    out = hashlib.sha1(repr(([ str(f) for f in data.columns ],[ str(f) for f in data.dtypes ])).encode())
+    try:
+        out.update(pd.util.hash_pandas_object(data,index=False).to_numpy().tobytes())
+    except TypeError:
+        for i in range(data.shape[1]):
+            column = data.iloc[:,i]
+            try:
+                out.update(pd.util.hash_pandas_object(column,index=False).to_numpy().tobytes())
+            except TypeError:
+                for f in column:
+                    out.update(hash_cell(f))
+
+    return out.hexdigest()
+
+## digest of the pickled bytes of an unhashable frame cell
+def hash_cell(value):
+
+    try:
+        return hashlib.sha1(pickle.dumps(value,protocol=4)).digest()
+    except (pickle.PicklingError,TypeError,AttributeError):
+        raise TypeError('cannot hash %s' %type(value).__name__)
@@ -1,21 +1,15 @@
 #!/usr/bin/env python3
 
-import os,sys,glob
-import requests
-from matplotlib import colors as mcolors
+import os
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
-import json
-import seaborn as sns
-from itertools import combinations
-from sklearn.metrics import mean_squared_error
-from scipy import stats
-import bct
-import jgf
-from scipy.signal import resample
-import requests
-import igraph
+from pybrainlife.data.instrument import stage
+from pybrainlife.data.cache import DiskCache, parse_cache_key
+from pybrainlife.data.backend import check_backend, read_table, replace_blank_strings
+from pybrainlife.data.network import load_network_records
+
+## heavy dependencies (matplotlib, seaborn, sklearn, scipy, bct, jgf, igraph, requests) are imported inside the functions that use them,
+## so importing this module stays cheap for short-lived workers and scripts
 
 ## this will add tags and datatype tags to the data
 def add_tags_dtags(tags,dtags,data):
@@ -70,33 +64,101 @@ def append_data(subjects,sessions,paths,finish_dates,obj,filename,obj_tags,obj_d
     
     return finish_dates, subjects, sessions, paths, obj_tags, obj_datatype_tags
 
-## this function will call add_subjects_sessions to add the appropriate columns and will append the object data to a study-wide dataframe
-def compile_data(paths,subjects,sessions,data,dtags,tags,finish_dates):
-    # loops through all paths
-    for i in range(len(paths)):
-        # if network, use igraph and pandas. if not, use just pandas
-        if 'network.json.gz' in paths[i]:
-            # tmpdata = pd.read_json(paths[i],orient='index').reset_index(drop=True)
-            tmpdata = pd.DataFrame()
-            tmpdata['igraph'] = jgf.igraph.load(paths[i],compressed=True)
-            # tmpdata = add_subjects_sessions(subjects[i],sessions[i],paths[i],tmpdata)
-            # tmpdata = add_tags_dtags(tags[i],dtags[i],tmpdata) # added 4/12/2023
+## this function loads a single warehouse object file. if network, uses igraph and pandas; with network_records, the 'igraph' column holds
+## pybrainlife.data.network.NetworkRecords instead of igraph.Graphs. if not, reads the table with backend (see pybrainlife.data.backend)
+def load_object_file(path,backend='pandas',network_records=False):
+
+    if 'network.json.gz' in path:
+        # tmpdata = pd.read_json(path,orient='index').reset_index(drop=True)
+        tmpdata = pd.DataFrame()
+        if network_records:
+            tmpdata['igraph'] = load_network_records(path,compressed=True)
+        else:
+            import jgf
+            tmpdata['igraph'] = jgf.igraph.load(path,compressed=True)
+    else:
+        if '.tsv' in path:
+            sep = '\t'
+        else:
+            sep = ','
+        tmpdata = read_table(path,sep,backend)
+
+    return tmpdata
+
+## this function parses the files in paths. if cache (a pybrainlife.data.cache.DiskCache) is set, parsed files are looked up there by path and
+## finish date before being read, and stored there after. with n_threads > 1 files are read in a thread pool; pandas and zlib release the gil
+## while parsing, so the reads overlap. returns a dictionary of path to parsed data
+def load_object_files(paths,finish_dates,cache=None,n_threads=1,backend='pandas',network_records=False):
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    def load(i):
+        if cache:
+            # records and igraph networks of the same file are cached separately
+            key = parse_cache_key(paths[i]+('#records' if network_records and 'network.json.gz' in paths[i] else ''),finish_dates[i])
+            tmpdata = cache.get(key)
+            if tmpdata is not None:
+                return tmpdata, True
+
+        tmpdata = load_object_file(paths[i],backend,network_records)
+        if cache:
+            cache.put(key,tmpdata)
+
+        return tmpdata, False
+
+    # a path listed twice is only read once
+    unique = list({ paths[f]: f for f in range(len(paths)) }.values())
+
+    with stage('file load') as record:
+        if n_threads > 1 and len(unique) > 1:
+            with ThreadPoolExecutor(max_workers=n_threads) as executor:
+                results = list(executor.map(load,unique))
         else:
-            if '.tsv' in paths[i]:
-                sep = '\t'
+            results = [ load(f) for f in unique ]
+
+        loaded = {}
+        record['cached'] = 0
+        for i, (tmpdata, cached) in zip(unique,results):
+            loaded[paths[i]] = tmpdata
+            record['rows'] = record['rows'] + len(tmpdata)
+            if cached:
+                record['cached'] = record['cached'] + 1
             else:
-                sep = ','
-            tmpdata = pd.read_csv(paths[i],sep=sep)
+                record['files'] = record['files'] + 1
+                record['bytes'] = record['bytes'] + os.path.getsize(paths[i])
+
+    return loaded
+
+## this function will call add_subjects_sessions to add the appropriate columns and will append the object data to a study-wide dataframe.
+## files are parsed with load_object_files (see there for cache and n_threads), unless loaded already holds them. backend picks the engine files
+## are read and cleaned up with ('pandas', 'pyarrow' or 'polars'); the output is a pandas dataframe either way. its subject / session index
+## (pybrainlife.data.index.SubjectIndex) is built and attached to data.attrs on first use: call pybrainlife.data.index.get_subject_index(data)
+## (join_participants does). network_records is passed on to load_object_file
+def compile_data(paths,subjects,sessions,data,dtags,tags,finish_dates,cache=None,loaded=None,n_threads=1,backend='pandas',network_records=False):
+
+    check_backend(backend)
+    if loaded is None:
+        loaded = load_object_files(paths,finish_dates,cache,n_threads,backend,network_records)
+
+    # loops through all paths. the parsed data may be shared with other selections, so columns are added to a shallow copy
+    frames = []
+    for i in range(len(paths)):
+        tmpdata = loaded[paths[i]].copy(deep=False)
         tmpdata = add_subjects_sessions(subjects[i],sessions[i],tmpdata)
         tmpdata = add_tags_dtags(tags[i],dtags[i],tmpdata)
         tmpdata = add_finish_dates(finish_dates[i],tmpdata)
 
-        #data = data.append(tmpdata,ignore_index=True)
-        data = pd.concat([data,tmpdata])
+        frames.append(tmpdata)
+
+    # concatenate once at the end instead of once per file
+    with stage('concat') as record:
+        data = pd.concat([data]+frames)
+        record['rows'] = len(data)
 
     # replace empty spaces with nans
-    data = data.replace(r'^\s+$', np.nan, regex=True)
-    
+    with stage('cleanup',rows=len(data)):
+        data = replace_blank_strings(data,backend)
+
     return data
 
 # NO LONGER NECESSARY
@@ -195,9 +257,98 @@ def check_tags_dtags(tags,obj,tagOrDatatypeTag):
     
     return ctr
 
+## this function checks whether a warehouse object matches the datatype, datatype_tags, and tags. can include drop tags ('!'). this logic could probably be simplified
+def check_object_filters(obj,datatype,datatype_tags,tags):
+
+    if obj['datatype']['name'] != datatype:
+        return False
+
+    # if datatype_tags is set, identify data using this info. if not, just use tag data. if no tags either, just append if meets datatype criteria. will check for filter with a not tag (!)
+    if datatype_tags:
+        # if the input datatype_tags are included in the object's datatype_tags, look for appropriate tags. if no tags, just append
+        if 'datatype_tags' in list(obj['output'].keys()) and len(obj['output']['datatype_tags']) != 0:
+            ctr=0
+            if '!' in str(datatype_tags):
+                datatype_tags_to_drop = [ f for f in datatype_tags if '!' in str(f) ]
+                datatype_tag_keep = [ f for f in datatype_tags if f not in datatype_tags_to_drop ]
+
+                ctr = check_tags_dtags(datatype_tag_keep,obj,'datatype_tags')
+                if ctr > 0:
+                    datatype_tag_checks = check_for_filter_tags(datatype_tags_to_drop,obj,'datatype_tags')
+                    if datatype_tag_checks == len(datatype_tags_to_drop):
+                        datatype_tag_filter = True
+                    else:
+                        datatype_tag_filter = False
+                else:
+                    datatype_tag_filter = False
+            else:
+                ctr = check_tags_dtags(datatype_tags,obj,'datatype_tags')
+                if ctr > 0:
+                    datatype_tag_filter = True
+                else:
+                    datatype_tag_filter = False
+        else:
+            datatype_tag_filter = False
+    else:
+        datatype_tag_filter = True
+
+    if tags:
+        if 'tags' in list(obj['output'].keys()) and len(obj['output']['tags']) != 0:
+            ctr = 0
+            if '!' in str(tags):
+                tags_drop = [ f for f in tags if '!' in str(f) ]
+                tags_keep = [ f for f in tags if f not in tags_drop ]
+                ctr = check_tags_dtags(tags_keep,obj,'tags')
+                if ctr > 0:
+                    tag_checks = check_for_filter_tags(tags_drop,obj,'tags')
+                    if tag_checks == len(tags_drop):
+                        tag_filter = True
+                    else:
+                        tag_filter = False
+                else:
+                    tag_filter = False
+            else:
+                ctr = check_tags_dtags(tags,obj,'tags')
+                if ctr > 0:
+                    tag_filter = True
+                else:
+                    tag_filter = False
+        else:
+            tag_filter = False
+    else:
+        tag_filter = True
+
+    return datatype_tag_filter == True and tag_filter == True
+
+## this function returns the warehouse objects matching the datatype, datatype_tags, and tags (i.e. to stage them with pybrainlife.data.download)
+def filter_objects(objects,datatype,datatype_tags,tags):
+
+    return [ f for f in objects if check_object_filters(f,datatype,datatype_tags,tags) ]
+
+## this function loops through the warehouse objects and collects the subjects, sessions, paths, finish dates, tags and datatype tags of the objects matching
+## the datatype, datatype_tags, and tags
+def select_objects(objects,datatype,datatype_tags,tags,filename,duplicates):
+
+    # subjects and paths
+    subjects = []
+    sessions = []
+    paths = []
+    finish_dates = []
+    obj_datatype_tags = []
+    obj_tags = []
+
+    for obj in objects:
+        if check_object_filters(obj,datatype,datatype_tags,tags):
+            finish_dates, subjects, sessions, paths, obj_tags, obj_datatype_tags = append_data(subjects,sessions,paths,finish_dates,obj,filename,obj_tags,obj_datatype_tags,duplicates)
+
+    return subjects, sessions, paths, finish_dates, obj_tags, obj_datatype_tags
+
 ## this function is the wrapper function that calls all the prevouis functions to generate a dataframe for the entire project of the appropriate datatype
 # def collect_data(datatype,datatype_tags,tags,filename,outPath,net_adj): # net_adj no longer necessary
-def collect_data(datatype,datatype_tags,tags,filename,outPath,duplicates=False,overwrite=False):
+## if cacheDir is set, parsed object files are cached there (see compile_data), so collecting again with a different selection only parses new objects
+def collect_data(datatype,datatype_tags,tags,filename,outPath,duplicates=False,overwrite=False,cacheDir='',backend='pandas',network_records=False):
+
+    import requests
 
     # if already computed, just load it
     if outPath and os.path.exists(outPath) and not overwrite:
@@ -209,79 +360,18 @@ def collect_data(datatype,datatype_tags,tags,filename,outPath,duplicates=False,o
         obj_datatype_tags = ['example_data']
     else:
         # grab path and data objects
-        objects = requests.get('https://brainlife.io/api/warehouse/secondary/list/%s'%os.environ['PROJECT_ID']).json()
-
-        # subjects and paths
-        subjects = []
-        sessions = []
-        paths = []
-        finish_dates = []
-        obj_datatype_tags = []
-        obj_tags = []
+        with stage('listing fetch') as record:
+            objects = requests.get('https://brainlife.io/api/warehouse/secondary/list/%s'%os.environ['PROJECT_ID']).json()
+            record['rows'] = len(objects)
 
         # set up output
         data = pd.DataFrame()
 
-        # loop through objects and find appropriate objects based on datatype, datatype_tags, and tags. can include drop tags ('!'). this logic could probably be simplified
-        for obj in objects:
-            if obj['datatype']['name'] == datatype:
-                # if datatype_tags is set, identify data using this info. if not, just use tag data. if no tags either, just append if meets datatype criteria. will check for filter with a not tag (!)
-                if datatype_tags:
-                    # if the input datatype_tags are included in the object's datatype_tags, look for appropriate tags. if no tags, just append
-                    if 'datatype_tags' in list(obj['output'].keys()) and len(obj['output']['datatype_tags']) != 0:
-                        ctr=0
-                        if '!' in str(datatype_tags):
-                            datatype_tags_to_drop = [ f for f in datatype_tags if '!' in str(f) ]
-                            datatype_tag_keep = [ f for f in datatype_tags if f not in datatype_tags_to_drop ]
-
-                            ctr = check_tags_dtags(datatype_tag_keep,obj,'datatype_tags')
-                            if ctr > 0:
-                                datatype_tag_checks = check_for_filter_tags(datatype_tags_to_drop,obj,'datatype_tags')
-                                if datatype_tag_checks == len(datatype_tags_to_drop):
-                                    datatype_tag_filter = True
-                                else:
-                                    datatype_tag_filter = False
-                            else:
-                                datatype_tag_filter = False
-                        else:
-                            ctr = check_tags_dtags(datatype_tags,obj,'datatype_tags')
-                            if ctr > 0:
-                                datatype_tag_filter = True
-                            else:
-                                datatype_tag_filter = False
-                    else:
-                        datatype_tag_filter = False
-                else:
-                    datatype_tag_filter = True
+        # find appropriate objects based on datatype, datatype_tags, and tags
+        with stage('selection',rows=len(objects)) as record:
+            subjects, sessions, paths, finish_dates, obj_tags, obj_datatype_tags = select_objects(objects,datatype,datatype_tags,tags,filename,duplicates)
+            record['selected'] = len(paths)
 
-                if tags:
-                    if 'tags' in list(obj['output'].keys()) and len(obj['output']['tags']) != 0:
-                        ctr = 0
-                        if '!' in str(tags):
-                            tags_drop = [ f for f in tags if '!' in str(f) ]
-                            tags_keep = [ f for f in tags if f not in tags_drop ]
-                            ctr = check_tags_dtags(tags_keep,obj,'tags')
-                            if ctr > 0:
-                                tag_checks = check_for_filter_tags(tags_drop,obj,'tags')
-                                if tag_checks == len(tags_drop):
-                                    tag_filter = True
-                                else:
-                                    tag_filter = False
-                            else:
-                                tag_filter = False
-                        else:
-                            ctr = check_tags_dtags(tags,obj,'tags')
-                            if ctr > 0:
-                                tag_filter = True
-                            else:
-                                tag_filter = False
-                    else:
-                        tag_filter = False
-                else:
-                    tag_filter = True
-
-                if datatype_tag_filter == True & tag_filter == True:
-                    finish_dates, subjects, sessions, paths, obj_tags, obj_datatype_tags = append_data(subjects,sessions,paths,finish_dates,obj,filename,obj_tags,obj_datatype_tags,duplicates)
         # check if tab separated or comma separated by looking at input filename
         if '.tsv' in filename:
             sep = '\t'
@@ -295,7 +385,8 @@ def collect_data(datatype,datatype_tags,tags,filename,outPath,duplicates=False,o
         #     if outPath:
         #         np.save(outPath,data)
         # else:
-        data = compile_data(paths,subjects,sessions,data,obj_datatype_tags,obj_tags,finish_dates)
+        cache = DiskCache(cacheDir) if cacheDir else None
+        data = compile_data(paths,subjects,sessions,data,obj_datatype_tags,obj_tags,finish_dates,cache,backend=backend,network_records=network_records)
 
         # output data structure for records and any further analyses
         if outPath:
@@ -303,6 +394,52 @@ def collect_data(datatype,datatype_tags,tags,filename,outPath,duplicates=False,o
 
     return data, obj_tags, obj_datatype_tags
 
+## this function is collect_data for several datatypes at once. specs is a dictionary of name to (datatype,datatype_tags,tags,filename), i.e.
+## {'tractmeasures': ('neuro/tractmeasures',['cleaned'],[],'tractmeasures.csv'), 'network': ('neuro/network',[],[],'network.json.gz')}.
+## the warehouse listing is fetched once and every object is routed to each spec it matches in a single pass. the selected files of all
+## specs are then read through one pool of n_threads threads. returns a dictionary of name to (data, obj_tags, obj_datatype_tags), as collect_data
+def collect_data_multi(specs,duplicates=False,cacheDir='',n_threads=8,backend='pandas',network_records=False):
+
+    import requests
+
+    # grab path and data objects
+    with stage('listing fetch') as record:
+        objects = requests.get('https://brainlife.io/api/warehouse/secondary/list/%s'%os.environ['PROJECT_ID']).json()
+        record['rows'] = len(objects)
+
+    # specs by datatype, so each object is only checked against the specs that could match it
+    specs_by_datatype = {}
+    for name, (datatype, datatype_tags, tags, filename) in specs.items():
+        specs_by_datatype.setdefault(datatype,[]).append(name)
+
+    selections = { f: ([],[],[],[],[],[]) for f in specs.keys() }
+    with stage('selection',rows=len(objects)) as record:
+        for obj in objects:
+            for name in specs_by_datatype.get(obj['datatype']['name'],[]):
+                datatype, datatype_tags, tags, filename = specs[name]
+                if check_object_filters(obj,datatype,datatype_tags,tags):
+                    subjects, sessions, paths, finish_dates, obj_tags, obj_datatype_tags = selections[name]
+                    finish_dates, subjects, sessions, paths, obj_tags, obj_datatype_tags = append_data(subjects,sessions,paths,finish_dates,obj,filename,obj_tags,obj_datatype_tags,duplicates)
+                    selections[name] = (subjects, sessions, paths, finish_dates, obj_tags, obj_datatype_tags)
+        record['selected'] = sum([ len(f[2]) for f in selections.values() ])
+
+    # read every selected file through one pool
+    all_paths = []
+    all_finish_dates = []
+    for subjects, sessions, paths, finish_dates, obj_tags, obj_datatype_tags in selections.values():
+        all_paths = all_paths + list(paths)
+        all_finish_dates = all_finish_dates + list(finish_dates)
+    cache = DiskCache(cacheDir) if cacheDir else None
+    check_backend(backend)
+    loaded = load_object_files(all_paths,all_finish_dates,cache,n_threads,backend,network_records)
+
+    out = {}
+    for name, (subjects, sessions, paths, finish_dates, obj_tags, obj_datatype_tags) in selections.items():
+        data = compile_data(paths,subjects,sessions,pd.DataFrame(),obj_datatype_tags,obj_tags,finish_dates,loaded=loaded,backend=backend)
+        out[name] = (data, obj_tags, obj_datatype_tags)
+
+    return out
+
 # ## this function is the wrapper function that calls all the prevouis functions to generate a dataframe for the entire project of the appropriate datatype
 # def collect_data(datatype,datatype_tags=[],tags=[],filename='',outPath='',net_adj=False):
 
@@ -420,6 +557,8 @@ def collect_subject_data(dataPath=""):
 ## this will create a subject-specific color for each subject in the subjects dataframe
 def create_color_dictionary(data,measure,colorPalette):
 
+    import seaborn as sns
+
     # Create subject keys and color values
     keys = data[measure].unique()
     values = sns.color_palette(colorPalette,len(keys))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pybrainlife.data.instrument import stage, report_progress
+
+### concurrent download of warehouse objects into input/
+## requests sessions are not thread safe, so each download thread keeps its own
+_sessions = threading.local()
+
+def get_session():
+
+    import requests
+
+    if not hasattr(_sessions,'session'):
+        _sessions.session = requests.Session()
+
+    return _sessions.session
+
+## this function downloads a single file to dest. data is streamed into dest+'.part'; if a .part file is already there (i.e. from an interrupted run),
+## the download resumes from where it stopped with a range request (a .part file that doesn't match the size the server reports is downloaded
+## again). the size is checked against the size reported by the server and, if expected_checksum is set, the hash_name digest of the whole file
+## is checked too. the .part file only replaces dest once it verifies.
+## blocking: runs in a worker thread
+def download_file(url,dest,headers=None,expected_checksum='',hash_name='md5',chunk_size=1024*1024):
+
+    part = dest+'.part'
+    request_headers = headers
+    headers = dict(headers) if headers else {}
+    hasher = hashlib.new(hash_name)
+
+    # pick up a partial download. hash what is already there so the checksum covers the whole file
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    if offset:
+        with open(part,'rb') as part_f:
+            for chunk in iter(lambda: part_f.read(chunk_size),b''):
+                hasher.update(chunk)
+        headers['Range'] = 'bytes=%d-' %offset
+
+    with get_session().get(url,headers=headers,stream=True,timeout=60) as response:
+        if response.status_code == 416 and offset:
+            # the .part file only holds the whole file if the server says so (content-range: bytes */<size>). anything else (i.e. a .part file
+            # longer than the file) is thrown away and downloaded again
+            total = re.match(r'bytes \*/(\d+)$',response.headers.get('Content-Range','').strip())
+            if total is None or int(total.group(1)) != offset:
+                response.close()
+                os.remove(part)
+                return download_file(url,dest,request_headers,expected_checksum,hash_name,chunk_size)
+            expected_size = offset
+            status = 'resumed'
+        else:
+            response.raise_for_status()
+            if offset and response.status_code != 206:
+                # server ignored the range request; start over
+                offset = 0
+                hasher = hashlib.new(hash_name)
+
+            mode = 'ab' if offset else 'wb'
+            status = 'resumed' if offset else 'downloaded'
+            length = response.headers.get('Content-Length')
+            expected_size = offset + int(length) if length is not None else None
+
+            with open(part,mode) as part_f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    part_f.write(chunk)
+                    hasher.update(chunk)
+
+    size = os.path.getsize(part)
+    if expected_size is not None and size != expected_size:
+        raise IOError('%s: expected %d bytes, got %d' %(dest,expected_size,size))
+    if expected_checksum and hasher.hexdigest() != expected_checksum:
+        os.remove(part)
+        raise IOError('%s: %s checksum mismatch' %(dest,hash_name))
+
+    os.replace(part,dest)
+
+    return {'path': dest, 'status': status, 'bytes': size}
+
+## this function downloads filename for every object in objects (i.e. the objects selected by filter_objects) from base_url+obj['path']+'/'+filename
+## to outDir/obj['path']/filename, which is where collect_data looks for it. at most max_concurrency downloads run at a time. files that already
+## exist are skipped. checksums is an optional dictionary of obj['path']+'/'+filename to hex digests. headers are sent with every request
+## (i.e. an authorization header). failed downloads are retried; anything still failing is raised as an IOError once the rest have finished
+async def download_objects_async(objects,filename,base_url,outDir='input',max_concurrency=8,headers=None,checksums=None,hash_name='md5',retries=2):
+
+    checksums = checksums if checksums else {}
+    semaphore = asyncio.Semaphore(max_concurrency)
+    loop = asyncio.get_running_loop()
+
+    async def fetch(obj,executor):
+        relative_path = obj['path']+'/'+filename
+        dest = os.path.join(outDir,obj['path'],filename)
+        if os.path.exists(dest):
+            return {'path': dest, 'status': 'skipped', 'bytes': 0}
+
+        os.makedirs(os.path.dirname(dest),exist_ok=True)
+        async with semaphore:
+            for attempt in range(retries+1):
+                try:
+                    result = await loop.run_in_executor(executor,download_file,base_url.rstrip('/')+'/'+relative_path,dest,headers,checksums.get(relative_path,''),hash_name)
+                    report_progress('%s %s' %(result['status'],dest))
+                    return result
+                except Exception as e:
+                    error = e
+
+        return {'path': dest, 'status': 'failed', 'bytes': 0, 'error': str(error)}
+
+    with stage('download',rows=len(objects)) as record:
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            results = await asyncio.gather(*[ fetch(f,executor) for f in objects ])
+        record['files'] = len([ f for f in results if f['status'] in ['downloaded','resumed'] ])
+        record['bytes'] = sum([ f['bytes'] for f in results ])
+
+    failed = [ f for f in results if f['status'] == 'failed' ]
+    if failed:
+        raise IOError('failed to download %d files: %s' %(len(failed),'; '.join([ '%s (%s)' %(f['path'],f['error']) for f in failed ])))
+
+    return results
+
+## blocking wrapper around download_objects_async for scripts. inside a running event loop (i.e. a jupyter notebook), await download_objects_async instead
+def download_objects(objects,filename,base_url,outDir='input',max_concurrency=8,headers=None,checksums=None,hash_name='md5',retries=2):
+
+    return asyncio.run(download_objects_async(objects,filename,base_url,outDir,max_concurrency,headers,checksums,hash_name,retries))
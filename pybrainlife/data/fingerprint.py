@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+from pybrainlife.data.instrument import stage
+from pybrainlife.data.index import parse_matrix_key
+from pybrainlife.data.harmonize import features_matrix
+
+### connectome / profile fingerprinting
+## subject x subject similarity of connectomes (their upper-triangle edge vectors) or profiles (their structure x node x measure vectors),
+## computed as blocked matrix products in float32 by default so cohorts of thousands of subjects fit in memory, and the identification
+## accuracy (finn et al. 2015) and differential identifiability (amico & goni 2018) of test-retest sessions
+
+## memory allowed for one block of rows (the normalized rows and their similarities)
+DEFAULT_CHUNK_BYTES = 256 * 1024**2
+
+## this function stacks the upper triangle (without the diagonal) of every matrix in matrices, a dictionary of key to node x node array keyed
+## as in build_connectivity_matrix_dictionary or threshold_matrices. returns the keys x edges array and a frame of the subjectID and sessionID
+## of every key
+def edge_vectors(matrices,dtype=np.float32):
+
+    keys = list(matrices.keys())
+    n_nodes = np.asarray(matrices[keys[0]]).shape[0]
+    sources, targets = np.triu_indices(n_nodes,k=1)
+
+    values = np.empty((len(keys),len(sources)),dtype=dtype)
+    for i, key in enumerate(keys):
+        values[i] = np.asarray(matrices[key])[sources,targets]
+
+    return values, pd.DataFrame([ parse_matrix_key(f) for f in keys ],columns=['subjectID','sessionID'])
+
+## this function builds one vector per subjectID / sessionID of the measures of a collected profile or cortex table (see features_matrix), in
+## dtype. returns the array and a frame of the subjectID and sessionID of every row
+def profile_vectors(data,measures,feature_columns=['structureID','nodeID'],dtype=np.float32,chunk_bytes=DEFAULT_CHUNK_BYTES):
+
+    matrix, row_codes, _, _ = features_matrix(data,measures,feature_columns,dtype,chunk_bytes)
+    ids = data.iloc[np.unique(row_codes,return_index=True)[1]]
+    sessions = ids['sessionID'].astype(str).to_numpy() if 'sessionID' in ids.columns else '1'
+
+    return matrix, pd.DataFrame({'subjectID': ids['subjectID'].astype(str).to_numpy(), 'sessionID': sessions})
+
+## rows of values prepared for a metric: centered and scaled to unit norm for 'correlation', scaled to unit norm for 'cosine'. missing
+## values are filled with their row's mean (they then add nothing to a correlation)
+def normalize_rows(values,metric,dtype=np.float32,chunk_bytes=DEFAULT_CHUNK_BYTES):
+
+    out = np.empty(values.shape,dtype=dtype)
+    block = max(1,int(chunk_bytes / (8 * max(1,values.shape[1]))))
+    for start in range(0,len(values),block):
+        rows = np.asarray(values[start:start+block],dtype=np.float64)
+        with np.errstate(invalid='ignore',divide='ignore'):
+            means = np.nanmean(rows,axis=1,keepdims=True)
+            rows = np.where(np.isnan(rows),means,rows)
+            if metric == 'correlation':
+                rows = rows - means
+            if metric in ['correlation','cosine']:
+                rows = rows / np.linalg.norm(rows,axis=1,keepdims=True)
+        out[start:start+block] = rows
+
+    return out
+
+## this function computes the similarity of every row of x with every row of y (default: x itself), in blocks of rows small enough for
+## chunk_bytes. metric is 'correlation' (pearson), 'cosine' or 'euclidean' (a distance). outPath is an optional .npy path the result is
+## written to as a memory map (for cohorts whose similarity matrix shouldn't be held in memory). returns the rows x rows array
+def similarity_matrix(x,y=None,metric='correlation',dtype=np.float32,chunk_bytes=DEFAULT_CHUNK_BYTES,outPath=''):
+
+    if metric not in ['correlation','cosine','euclidean']:
+        raise ValueError('unknown metric %s. choose from correlation, cosine, euclidean' %metric)
+
+    a = normalize_rows(x,metric,dtype,chunk_bytes)
+    b = a if y is None else normalize_rows(y,metric,dtype,chunk_bytes)
+    if metric == 'euclidean':
+        a_norms = np.einsum('ij,ij->i',a,a)
+        b_norms = a_norms if y is None else np.einsum('ij,ij->i',b,b)
+
+    if outPath:
+        out = np.lib.format.open_memmap(outPath,mode='w+',dtype=dtype,shape=(len(a),len(b)))
+    else:
+        out = np.empty((len(a),len(b)),dtype=dtype)
+
+    block = max(1,int(chunk_bytes / (np.dtype(dtype).itemsize * (a.shape[1] + len(b)))))
+    with stage('similarity',rows=len(a)) as record:
+        for start in range(0,len(a),block):
+            products = a[start:start+block] @ b.T
+            if metric == 'euclidean':
+                products = np.sqrt(np.maximum(a_norms[start:start+block,None] + b_norms[None,:] - 2 * products,0))
+            out[start:start+block] = products
+        record['chunks'] = int(np.ceil(len(a) / block))
+
+    if outPath:
+        out.flush()
+
+    return out
+
+## identification statistics of a similarity matrix between the same subjects in two sessions (row i and column i are the same subject).
+## accuracy is the fraction of subjects whose most similar (least distant, for distances) subject in the other session is themselves, from
+## rows to columns and columns to rows. i_self is the mean similarity of subjects to themselves, i_others to everyone else, and i_diff their
+## difference in percent (differential identifiability)
+def identification_statistics(similarity,distance=False):
+
+    similarity = np.asarray(similarity)
+    n = len(similarity)
+    best = np.argmin if distance else np.argmax
+    subjects = np.arange(n)
+    i_self = float(np.trace(similarity,dtype=np.float64) / n)
+    i_others = float((np.sum(similarity,dtype=np.float64) - i_self * n) / (n * n - n)) if n > 1 else np.nan
+
+    return {'accuracy_rows': float(np.mean(best(similarity,axis=1) == subjects)), 'accuracy_columns': float(np.mean(best(similarity,axis=0) == subjects)),
+            'i_self': i_self, 'i_others': i_others, 'i_diff': (i_self - i_others) * 100}
+
+## this function fingerprints subjects across two sessions: the vectors of session_a and session_b (with ids, their subjectID / sessionID frame,
+## i.e. from edge_vectors or profile_vectors) of the subjects present in both are compared with similarity_matrix. returns the identification
+## statistics and the similarity matrix as a frame of session_a subjects x session_b subjects
+def fingerprint_sessions(values,ids,session_a,session_b,metric='correlation',dtype=np.float32,chunk_bytes=DEFAULT_CHUNK_BYTES,outPath=''):
+
+    sessions = ids['sessionID'].astype(str).to_numpy()
+    subjects = ids['subjectID'].astype(str).to_numpy()
+    rows_a = pd.Series(np.flatnonzero(sessions == str(session_a)),index=subjects[sessions == str(session_a)])
+    rows_b = pd.Series(np.flatnonzero(sessions == str(session_b)),index=subjects[sessions == str(session_b)])
+    rows_a = rows_a[~rows_a.index.duplicated()]
+    rows_b = rows_b[~rows_b.index.duplicated()]
+    common = rows_a.index.intersection(rows_b.index,sort=False)
+    if not len(common):
+        raise ValueError('no subjects have both session %s and session %s' %(session_a,session_b))
+
+    similarity = similarity_matrix(values[rows_a[common].to_numpy()],values[rows_b[common].to_numpy()],metric,dtype,chunk_bytes,outPath)
+    statistics = identification_statistics(similarity,metric == 'euclidean')
+    statistics['subjects'] = len(common)
+    statistics['similarity'] = pd.DataFrame(similarity,index=pd.Index(common,name='subjectID'),columns=pd.Index(common,name='subjectID'))
+
+    return statistics
+
+## this function fingerprints the connectomes in matrices (see edge_vectors) across session_a and session_b. see fingerprint_sessions
+def connectome_fingerprinting(matrices,session_a,session_b,metric='correlation',dtype=np.float32,chunk_bytes=DEFAULT_CHUNK_BYTES,outPath=''):
+
+    values, ids = edge_vectors(matrices,dtype)
+
+    return fingerprint_sessions(values,ids,session_a,session_b,metric,dtype,chunk_bytes,outPath)
+
+## this function fingerprints the profiles of a collected table (see profile_vectors) across session_a and session_b. see fingerprint_sessions
+def profile_fingerprinting(data,measures,session_a,session_b,metric='correlation',feature_columns=['structureID','nodeID'],dtype=np.float32,
+                           chunk_bytes=DEFAULT_CHUNK_BYTES,outPath=''):
+
+    values, ids = profile_vectors(data,measures,feature_columns,dtype,chunk_bytes)
+
+    return fingerprint_sessions(values,ids,session_a,session_b,metric,dtype,chunk_bytes,outPath)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+from pybrainlife.data.instrument import stage
+from pybrainlife.data.index import SubjectIndex, join_participants
+from pybrainlife.data.harmonize import features_matrix
+
+## scipy is imported where p values are computed
+
+### mass-univariate linear models
+## one linear model per feature (profile node, cortex roi or connectome edge) with the same design: the responses are stacked into a
+## subjects x features matrix and all models are fit with one least squares solve. features with missing values are fit together with the
+## other features missing the same subjects
+
+## this function builds the design matrix of the covariates columns of rows (one row per subject): an intercept, numeric covariates as they
+## are and categorical ones dummy coded against their first level (named '<column>_<level>'). returns the matrix and its column names
+def design_matrix(rows,covariates):
+
+    design = pd.get_dummies(rows[list(covariates)],drop_first=True)
+    design.insert(0,'intercept',1.0)
+
+    return design.to_numpy(dtype=float), list(design.columns)
+
+## this function fits values (subjects x features) against design (subjects x terms). returns terms x features arrays of the betas, their
+## standard errors, t statistics and two-sided p values
+def fit_glm(values,design):
+
+    from scipy.stats import t as t_dist
+
+    values = np.asarray(values,dtype=float)
+    design = np.asarray(design,dtype=float)
+    shape = (design.shape[1],values.shape[1])
+    beta, se, dof = np.full(shape,np.nan), np.full(shape,np.nan), np.zeros(values.shape[1])
+
+    # features sharing a missing value pattern are fit together
+    valid = ~np.isnan(values)
+    if valid.all():
+        patterns, pattern_codes = np.ones((1,len(values)),dtype=bool), np.zeros(values.shape[1],dtype=int)
+    else:
+        patterns, pattern_codes = np.unique(valid.T,axis=0,return_inverse=True)
+        pattern_codes = pattern_codes.ravel()
+    for i, rows in enumerate(patterns):
+        features = pattern_codes == i
+        X, Y = design[rows], values[rows][:,features]
+        rank = np.linalg.matrix_rank(X)
+        if len(X) <= rank:
+            continue
+        beta[:,features], residuals = np.linalg.lstsq(X,Y,rcond=None)[:2]
+        dof[features] = len(X) - rank
+        if len(residuals) != Y.shape[1]:
+            residuals = np.sum((Y - X @ beta[:,features])**2,axis=0)
+        unscaled = np.diag(np.linalg.pinv(X.T @ X))
+        se[:,features] = np.sqrt(np.outer(unscaled,residuals / dof[features]))
+
+    with np.errstate(divide='ignore',invalid='ignore'):
+        t = beta / se
+    p = np.where(np.isnan(t),np.nan,2 * t_dist.sf(np.abs(t),np.where(dof > 0,dof,1)))
+
+    return beta, se, t, p
+
+## benjamini-hochberg false discovery rate adjusted p values of p. nans are ignored and kept
+def fdr_bh(p):
+
+    p = np.asarray(p,dtype=float)
+    out = np.full(p.shape,np.nan)
+    valid = ~np.isnan(p)
+    ranked = np.sort(p[valid])
+    n = len(ranked)
+    if not n:
+        return out
+
+    # running minimum from the largest p value down
+    adjusted = np.minimum.accumulate((ranked * n / np.arange(1,n+1))[::-1])[::-1]
+    out[valid] = np.minimum(adjusted,1)[np.argsort(np.argsort(p[valid],kind='stable'),kind='stable')]
+
+    return out
+
+## tidy frame of a fit: one row per feature and term, with the ids of every feature (features, a frame with one row per feature) and the
+## p values fdr adjusted across features within each term (and, if group_column is set, each group of features, i.e. measure)
+def glm_frame(features,terms,beta,se,t,p,group_column=''):
+
+    n_terms, n_features = beta.shape
+    out = features.loc[features.index.repeat(n_terms)].reset_index(drop=True)
+    out['term'] = np.tile(terms,n_features)
+    out['beta'] = beta.T.ravel()
+    out['se'] = se.T.ravel()
+    out['t'] = t.T.ravel()
+    out['p'] = p.T.ravel()
+
+    groups = ['term',group_column] if group_column else ['term']
+    out['p_fdr'] = np.nan
+    for _, rows in out.groupby(groups,sort=False).indices.items():
+        out.loc[rows,'p_fdr'] = fdr_bh(out['p'].to_numpy()[rows])
+
+    return out
+
+## this function fits the covariates columns of participants against every measure of every node / structure (feature_columns) of a collected
+## profile or cortex table at once. subjects missing any covariate are left out. returns a tidy frame of feature_columns, measure, term, beta,
+## se, t, p and p_fdr
+def mass_univariate_glm(data,participants,measures,covariates,feature_columns=['structureID','nodeID']):
+
+    with stage('glm',rows=len(data)) as record:
+        joined = join_participants(data,participants,list(covariates),how='inner')
+        joined = joined.loc[joined[list(covariates)].notna().all(axis=1).to_numpy()]
+        matrix, row_codes, feature_codes, n_features = features_matrix(joined,measures,feature_columns)
+        design, terms = design_matrix(joined.iloc[np.unique(row_codes,return_index=True)[1]],covariates)
+        beta, se, t, p = fit_glm(matrix,design)
+        record['features'] = matrix.shape[1]
+
+    # ids of every feature, in matrix column order
+    feature_columns = [ f for f in feature_columns if f in joined.columns ]
+    ids = joined.iloc[np.unique(feature_codes,return_index=True)[1]][feature_columns].reset_index(drop=True)
+    features = pd.concat([ ids.assign(measure=m) for m in measures ],ignore_index=True)
+
+    return glm_frame(features,terms,beta,se,t,p,'measure')
+
+## this function fits the covariates columns of participants against every edge of the connectomes in matrices, a dictionary of key to
+## node x node array keyed as in build_connectivity_matrix_dictionary or threshold_matrices. the upper triangle of every matrix is stacked
+## into one subjects x edges response. labels are the node labels (default: node indices). returns a tidy frame of source, target, term,
+## beta, se, t, p and p_fdr
+def edge_glm(matrices,participants,covariates,labels=None):
+
+    keys = list(matrices.keys())
+    index, subject_codes, _ = SubjectIndex.from_matrix_keys(keys)
+    n_nodes = np.asarray(matrices[keys[0]]).shape[0]
+    sources, targets = np.triu_indices(n_nodes,k=1)
+
+    with stage('edge glm',rows=len(keys)) as record:
+        values = np.stack([ np.asarray(matrices[f],dtype=float)[sources,targets] for f in keys ])
+        rows = pd.DataFrame({'subjectID': np.asarray(index.subjects)[subject_codes]})
+        rows = index.join(rows,participants,list(covariates),how='left',codes=subject_codes)
+        has_covariates = rows[list(covariates)].notna().all(axis=1).to_numpy()
+        design, terms = design_matrix(rows.loc[has_covariates],covariates)
+        beta, se, t, p = fit_glm(values[has_covariates],design)
+        record['edges'] = values.shape[1]
+
+    labels = np.asarray(labels) if labels is not None else np.arange(n_nodes)
+
+    return glm_frame(pd.DataFrame({'source': labels[sources], 'target': labels[targets]}),terms,beta,se,t,p)
+
+## boolean mask of the nodes x (nodeIDs) of structure and measure whose term is significant (p_fdr below alpha) in significance, a frame
+## returned by mass_univariate_glm. term defaults to the first term that isn't the intercept
+def significant_nodes(significance,structure,measure,x,term='',alpha=0.05):
+
+    if not term:
+        terms = [ f for f in significance['term'].unique() if f != 'intercept' ]
+        if not terms:
+            raise ValueError('significance only holds the intercept term: fit covariates or pass the term to shade')
+        term = terms[0]
+    rows = significance[(significance['structureID'] == structure) & (significance['measure'] == measure) & (significance['term'] == term)]
+    significant = set(rows.loc[rows['p_fdr'] < alpha,'nodeID'].tolist())
+
+    return np.array([ f in significant for f in np.asarray(x) ],dtype=bool)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+from pybrainlife.data.instrument import stage
+from pybrainlife.data.index import join_participants
+
+### site harmonization (ComBat)
+## empirical bayes location / scale batch correction (Johnson, Li & Rabinovic 2007, as in neuroCombat), fit for every feature at once: the
+## covariate regression is one least squares solve, the batch estimates are batch indicator matrix products and the empirical bayes
+## iterations update all batches x features together
+
+## this function harmonizes values (subjects x features) across batch (one label per subject). covariates (subjects x covariates, numeric)
+## are effects to preserve. eb=False skips the empirical bayes shrinkage and uses each feature's own batch estimates. missing values are filled
+## with their batch's feature mean for the fit and are missing again in the output; features with no variance are left as they are. returns
+## the harmonized values and the fit estimates
+def combat(values,batch,covariates=None,eb=True,tol=1e-4,max_iter=1000):
+
+    values = np.asarray(values,dtype=float)
+    batch_codes, batches = pd.factorize(np.asarray(batch))
+    if (batch_codes < 0).any():
+        raise ValueError('every subject needs a batch')
+    n_batch = np.bincount(batch_codes,minlength=len(batches))
+    if (n_batch < 2).any():
+        raise ValueError('every batch needs at least two subjects: %s' %', '.join([ str(f) for f in batches[n_batch < 2] ]))
+
+    batch_design = np.eye(len(batches))[batch_codes]
+    missing = np.isnan(values)
+    if missing.any():
+        values = fill_batch_means(values,missing,batch_design,n_batch)
+
+    # covariate regression: the batch columns give the batch intercepts, their weighted mean is the grand mean
+    design = batch_design if covariates is None else np.hstack([batch_design,np.asarray(covariates,dtype=float).reshape(len(values),-1)])
+    beta = np.linalg.lstsq(design,values,rcond=None)[0]
+    grand_mean = (n_batch / len(values)) @ beta[:len(batches)]
+    var_pooled = np.mean((values - design @ beta)**2,axis=0)
+    # no variance left beyond round-off of the least squares fit
+    constant = var_pooled <= np.finfo(float).eps * np.mean(values**2,axis=0)
+    var_pooled[constant] = 1
+    if eb and (~constant).sum() < 2:
+        raise ValueError('empirical bayes estimates need at least two features with variance')
+    stand_mean = grand_mean + (design[:,len(batches):] @ beta[len(batches):])
+    standardized = (values - stand_mean) / np.sqrt(var_pooled)
+
+    # batch location / scale of every feature
+    counts = n_batch[:,None]
+    sums = batch_design.T @ standardized
+    sum_squares = batch_design.T @ standardized**2
+    gamma_hat = sums / counts
+    delta_hat = (sum_squares - counts * gamma_hat**2) / (counts - 1)
+
+    if eb:
+        # features with no variance are left as they are, and are kept out of the priors
+        gamma_star, delta_star = gamma_hat.copy(), delta_hat.copy()
+        gamma_star[:,~constant], delta_star[:,~constant] = combat_eb(gamma_hat[:,~constant],delta_hat[:,~constant],sums[:,~constant],
+                                                                     sum_squares[:,~constant],counts,tol,max_iter)
+    else:
+        gamma_star, delta_star = gamma_hat, delta_hat
+
+    with np.errstate(divide='ignore',invalid='ignore'):
+        out = (standardized - gamma_star[batch_codes]) / np.sqrt(delta_star[batch_codes]) * np.sqrt(var_pooled) + stand_mean
+    out[:,constant] = values[:,constant]
+    out[missing] = np.nan
+
+    return out, {'batches': batches, 'gamma': gamma_star, 'delta': delta_star, 'grand_mean': grand_mean, 'var_pooled': var_pooled}
+
+## empirical bayes batch estimates. the priors are fit across features per batch; the posterior location and scale of all batches x features
+## are iterated together until the largest relative change is below tol
+def combat_eb(gamma_hat,delta_hat,sums,sum_squares,counts,tol=1e-4,max_iter=1000):
+
+    gamma_bar = gamma_hat.mean(axis=1)[:,None]
+    t2 = gamma_hat.var(axis=1,ddof=1)[:,None]
+    m = delta_hat.mean(axis=1)[:,None]
+    s2 = delta_hat.var(axis=1,ddof=1)[:,None]
+    a_prior = (2 * s2 + m**2) / s2
+    b_prior = (m * s2 + m**3) / s2
+
+    gamma_old, delta_old = gamma_hat, delta_hat
+    with np.errstate(divide='ignore',invalid='ignore'):
+        for i in range(max_iter):
+            gamma_new = (t2 * counts * gamma_hat + delta_old * gamma_bar) / (t2 * counts + delta_old)
+            sum2 = sum_squares - 2 * gamma_new * sums + counts * gamma_new**2
+            delta_new = (0.5 * sum2 + b_prior) / (counts / 2 + a_prior - 1)
+            change = max(np.nanmax(np.abs(gamma_new - gamma_old) / np.abs(gamma_old)),np.nanmax(np.abs(delta_new - delta_old) / delta_old))
+            gamma_old, delta_old = gamma_new, delta_new
+            if change < tol:
+                break
+
+    return gamma_new, delta_new
+
+## missing values replaced by the mean of their batch's values of that feature (or the feature's overall mean if the batch has none)
+def fill_batch_means(values,missing,batch_design,n_batch):
+
+    filled = np.where(missing,0,values)
+    present = batch_design.T @ (~missing)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        batch_means = (batch_design.T @ filled) / present
+        overall = filled.sum(axis=0) / (~missing).sum(axis=0)
+    batch_means = np.where(present > 0,batch_means,overall)
+
+    return np.where(missing,(batch_design @ np.nan_to_num(batch_means)),values)
+
+## this function builds the subjects x features matrix of the measures in data: one row per subjectID (and sessionID, if there is one), one
+## column per measure and combination of feature_columns (i.e. structureID and nodeID). repeated rows are averaged. the matrix is built in dtype,
+## in blocks of rows whose float64 sums fit in chunk_bytes. returns the matrix, the row code and feature code of every row of data (a measure's
+## columns start at its position times the number of features) and the number of features
+def features_matrix(data,measures,feature_columns=['structureID','nodeID'],dtype=np.float64,chunk_bytes=256*1024**2):
+
+    keys = [ f for f in ['subjectID','sessionID'] if f in data.columns ]
+    row_codes = data.groupby(keys,sort=False).ngroup().to_numpy()
+    feature_columns = [ f for f in feature_columns if f in data.columns ]
+    feature_codes = data.groupby(feature_columns,sort=False).ngroup().to_numpy() if feature_columns else np.zeros(len(data),dtype=int)
+    n_rows = row_codes.max() + 1 if len(data) else 0
+    n_features = feature_codes.max() + 1 if len(data) else 0
+
+    # rows of data sorted by matrix row, so every block of matrix rows is a slice of them
+    order = np.argsort(row_codes,kind='stable')
+    cells = row_codes[order] * n_features + feature_codes[order]
+    block = max(1,int(chunk_bytes / (16 * max(1,n_features))))
+    bounds = np.searchsorted(row_codes[order],np.arange(0,n_rows+block,block))
+
+    matrix = np.empty((n_rows,n_features*len(measures)),dtype=dtype)
+    for i, m in enumerate(measures):
+        values = data[m].to_numpy(dtype=float)[order]
+        valid = ~np.isnan(values)
+        for start, lo, hi in zip(range(0,n_rows,block),bounds[:-1],bounds[1:]):
+            rows = min(block,n_rows-start)
+            block_cells = cells[lo:hi] - start * n_features
+            sums = np.bincount(block_cells,weights=np.where(valid[lo:hi],values[lo:hi],0),minlength=rows*n_features)
+            counts = np.bincount(block_cells,weights=valid[lo:hi],minlength=rows*n_features)
+            with np.errstate(divide='ignore',invalid='ignore'):
+                matrix[start:start+rows,i*n_features:(i+1)*n_features] = (sums / counts).reshape(rows,n_features)
+
+    return matrix, row_codes, feature_codes, n_features
+
+## this function harmonizes the measures of a collected table (profiles or cortex data) across the batch_column of participants (i.e. 'site'),
+## preserving the effects of the covariates columns of participants (categorical ones are dummy coded). the subjects x features matrix is built
+## once and harmonized with combat. rows of subjects without participant data, a batch or any of the covariates are dropped. returns a copy of
+## data with harmonized measures
+def harmonize_data(data,participants,measures,batch_column,covariates=[],feature_columns=['structureID','nodeID'],eb=True):
+
+    with stage('harmonize',rows=len(data)) as record:
+        joined = join_participants(data,participants,[batch_column]+list(covariates),how='inner')
+        joined = joined.loc[joined[[batch_column]+list(covariates)].notna().all(axis=1).to_numpy()]
+        matrix, row_codes, feature_codes, n_features = features_matrix(joined,measures,feature_columns)
+
+        # batch and covariates of every matrix row
+        first = np.unique(row_codes,return_index=True)[1]
+        rows = joined.iloc[first]
+        covariate_values = None
+        if covariates:
+            covariate_values = pd.get_dummies(rows[list(covariates)],drop_first=True).to_numpy(dtype=float)
+
+        harmonized, _ = combat(matrix,rows[batch_column].to_numpy(),covariate_values,eb)
+        record['features'] = matrix.shape[1]
+
+        out = joined.drop(columns=[ f for f in [batch_column]+list(covariates) if f not in data.columns ])
+        for i, m in enumerate(measures):
+            values = harmonized[row_codes,i*n_features+feature_codes]
+            out[m] = np.where(np.isnan(out[m].to_numpy(dtype=float)),np.nan,values)
+
+    return out
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+import re
+import weakref
+import numpy as np
+import pandas as pd
+
+### subject / session index
+## integer codes for the subjects and subject / session pairs of a project, assigned once. frames carry their index in data.attrs['subject_index']
+## (attached by the first join_participants on them), so later joins with participant covariates become an integer take instead of a string merge
+class SubjectIndex:
+
+    def __init__(self,subjects,sessions=None):
+
+        self.subjects = pd.Index(pd.unique(np.asarray(subjects,dtype=str)),name='subjectID')
+        sessions = sessions if sessions is not None else []
+        self.sessions = pd.MultiIndex.from_tuples(list(dict.fromkeys([ (str(f[0]),str(f[1])) for f in sessions ])),names=['subjectID','sessionID'])
+        self._aligned = {}
+        self._frame_codes = None
+
+    def __repr__(self):
+        return 'SubjectIndex(subjects: %d, sessions: %d)' %(len(self.subjects),len(self.sessions))
+
+    def __len__(self):
+        return len(self.subjects)
+
+    ## builds the index from the subjectID (and sessionID, if there is one) columns of data
+    @classmethod
+    def from_frame(cls,data):
+
+        subjects = data['subjectID'].astype(str).to_numpy()
+        if 'sessionID' in data.columns:
+            pairs = data[['subjectID','sessionID']].astype(str).drop_duplicates()
+            return cls(subjects,list(pairs.itertuples(index=False,name=None)))
+
+        return cls(subjects)
+
+    ## builds the index from connectome dictionary keys, i.e. '<subject>_sess<session>' (threshold_matrices) or
+    ## 'subject_<subject>-session_<session>-...' (build_connectivity_matrix_dictionary). returns the index and the subject and session codes of each key
+    @classmethod
+    def from_matrix_keys(cls,keys):
+
+        pairs = [ parse_matrix_key(f) for f in keys ]
+        index = cls([ f[0] for f in pairs ],pairs)
+
+        return index, index.subject_codes([ f[0] for f in pairs ]), index.session_codes([ f[0] for f in pairs ],[ f[1] for f in pairs ])
+
+    ## integer code of each subjectID. -1 for subjects not in the index
+    def subject_codes(self,subjectIDs):
+
+        subjectIDs = pd.Series(subjectIDs) if not isinstance(subjectIDs,pd.Series) else subjectIDs
+        if not pd.api.types.is_string_dtype(subjectIDs) or pd.api.types.infer_dtype(subjectIDs,skipna=False) != 'string':
+            subjectIDs = subjectIDs.astype(str)
+
+        return self.subjects.get_indexer(subjectIDs.to_numpy())
+
+    ## integer code of each subject / session pair. -1 for pairs not in the index
+    def session_codes(self,subjectIDs,sessionIDs):
+
+        return self.sessions.get_indexer(pd.MultiIndex.from_arrays([np.asarray(subjectIDs,dtype=str),np.asarray(sessionIDs,dtype=str)]))
+
+    ## subject codes of the rows of data. computed once per frame: reused while data keeps the same row index object (filtering or sorting
+    ## makes a new one). the frame is only weakly referenced, since it usually holds this index in its attrs
+    def frame_codes(self,data):
+
+        if self._frame_codes is None or self._frame_codes[0] is not data.index or self._frame_codes[1]() is not data:
+            self._frame_codes = (data.index,weakref.ref(data),self.subject_codes(data['subjectID']))
+
+        return self._frame_codes[2]
+
+    ## the participant row of every subject code (-1 if the subject has no participant data), and the deduplicated participants it indexes.
+    ## cached per participants frame
+    def align(self,participants):
+
+        key = id(participants)
+        if key not in self._aligned or self._aligned[key][0] is not participants:
+            table = participants.drop_duplicates('subjectID').reset_index(drop=True)
+            rows = pd.Index(table['subjectID'].astype(str)).get_indexer(self.subjects)
+            self._aligned[key] = (participants,table,rows)
+
+        return self._aligned[key][1], self._aligned[key][2]
+
+    ## adds the participant covariates in columns (default: all of them) to data, by taking the aligned participant rows with the subject codes.
+    ## how='inner' drops rows of subjects without participant data, like pd.merge(data,participants,on='subjectID'); how='left' keeps them.
+    ## unlike pd.merge, the rows keep data's order and index (an inner merge groups them by subject and renumbers them)
+    def join(self,data,participants,columns=None,how='inner',codes=None):
+
+        table, rows = self.align(participants)
+        columns = columns if columns else [ f for f in table.columns if f not in data.columns ]
+        codes = codes if codes is not None else self.frame_codes(data)
+
+        # participant row of every data row
+        take = np.where(codes >= 0,rows[codes],-1)
+        found = take >= 0
+        if how == 'inner' and not found.all():
+            out = data.loc[found].copy()
+            take = take[found]
+            found = found[found]
+        else:
+            out = data.copy()
+        for c in columns:
+            if found.all():
+                out[c] = table[c].to_numpy()[take]
+            else:
+                out[c] = table[c].take(np.where(found,take,0)).where(found).to_numpy()
+        out.attrs['subject_index'] = self
+
+        return out
+
+## parses a connectome dictionary key into (subjectID, sessionID). keys without a session get session '1', as in collect_data
+def parse_matrix_key(key):
+
+    match = re.match(r'^subject_(.+?)-session_(.+?)(-tags_|$)',key)
+    if match:
+        return match.group(1), match.group(2)
+
+    match = re.match(r'^(.+)_sess(.+)$',key)
+    if match:
+        return match.group(1), match.group(2)
+
+    return key, '1'
+
+## builds a SubjectIndex for data (unless index is given) and attaches it to data.attrs. returns the index
+def attach_subject_index(data,index=None):
+
+    index = index if index is not None else SubjectIndex.from_frame(data)
+    data.attrs['subject_index'] = index
+
+    return index
+
+## the SubjectIndex attached to data, or a new one if there isn't one or it doesn't cover data's subjects
+def get_subject_index(data):
+
+    index = data.attrs.get('subject_index')
+    if index is None or (index.frame_codes(data) < 0).any():
+        index = attach_subject_index(data)
+
+    return index
+
+## this function adds participant covariates to data through the subject index: the integer-code counterpart of pd.merge(data,participants,on='subjectID'),
+## with the rows in data's order (see SubjectIndex.join)
+def join_participants(data,participants,columns=None,how='inner'):
+
+    return get_subject_index(data).join(data,participants,columns,how)
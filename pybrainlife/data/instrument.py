@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import time
+import logging
+from contextlib import contextmanager
+
+### opt-in stage instrumentation and progress reporting
+## progress messages go through this logger unless an instrumentation with a progress callback is active
+logger = logging.getLogger('pybrainlife')
+
+## active instrumentations, innermost last
+_active = []
+
+## peak resident set size of the process so far, in MB. None where the resource module isn't available (i.e. windows)
+def peak_rss_mb():
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # linux reports kilobytes, macos reports bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / 1024**2
+
+    return peak / 1024
+
+## collects one record per stage: wall time, rows processed, files read, bytes read, the process' peak rss so far (process_peak_rss_mb, the
+## lifetime ru_maxrss, not the stage's own use) and how much the stage raised it (peak_rss_growth_mb). progress is an optional callable that
+## receives progress messages instead of the logger, on_stage an optional callable that receives every stage record as it finishes.
+## wall_time is the time the instrumentation has been active: stages nest and run concurrently, so their times don't add up to it
+class Instrumentation:
+
+    def __init__(self,progress=None,on_stage=None):
+
+        self.progress = progress
+        self.on_stage = on_stage
+        self.stages = []
+        self.start = time.perf_counter()
+        self.end = None
+
+    def to_dict(self):
+
+        end = self.end if self.end is not None else time.perf_counter()
+
+        return {'stages': [ dict(f) for f in self.stages ], 'wall_time': end - self.start}
+
+    ## returns the records as a json string. if outPath is set, also writes them there
+    def to_json(self,outPath=''):
+
+        out = json.dumps(self.to_dict(),indent=2)
+        if outPath:
+            with open(outPath,'w') as out_f:
+                out_f.write(out)
+
+        return out
+
+## turns instrumentation on for everything run inside the block. ex:
+##   with instrument() as inst:
+##       data = collect_data(...)
+##   inst.to_json('collect_stages.json')
+@contextmanager
+def instrument(progress=None,on_stage=None):
+
+    instrumentation = Instrumentation(progress,on_stage)
+    _active.append(instrumentation)
+    try:
+        yield instrumentation
+    finally:
+        instrumentation.end = time.perf_counter()
+        _active.remove(instrumentation)
+
+## marks a pipeline stage. yields the stage record so callers can add to its 'rows', 'files' and 'bytes' counters. when no instrumentation
+## is active this only hands back a throwaway record, so instrumented code pays nothing by default
+@contextmanager
+def stage(name,rows=0):
+
+    record = {'stage': name, 'rows': rows, 'files': 0, 'bytes': 0}
+    if not _active:
+        yield record
+        return
+
+    instrumentation = _active[-1]
+    start = time.perf_counter()
+    start_rss = peak_rss_mb()
+    try:
+        yield record
+    finally:
+        record['wall_time'] = time.perf_counter() - start
+        record['process_peak_rss_mb'] = peak_rss_mb()
+        record['peak_rss_growth_mb'] = record['process_peak_rss_mb'] - start_rss if start_rss is not None else None
+        instrumentation.stages.append(record)
+        if instrumentation.on_stage:
+            instrumentation.on_stage(record)
+
+## reports progress (i.e. the structure currently being processed) to the active progress callback, or to the pybrainlife logger
+def report_progress(message):
+
+    if _active and _active[-1].progress:
+        _active[-1].progress(message)
+    else:
+        logger.info(message)
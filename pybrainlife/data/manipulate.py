@@ -1,22 +1,26 @@
-import os,sys,glob
-import requests
-from matplotlib import colors as mcolors
+import os
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
-import json
-import seaborn as sns
-from itertools import combinations
-from sklearn.metrics import mean_squared_error
-from scipy import stats
-import bct
-import jgf
-from scipy.signal import resample
-import requests
+from pybrainlife.data.summary import ProfileSummaryCube
+from pybrainlife.data.instrument import stage, report_progress
+from pybrainlife.data.backend import check_backend, groupby_aggregate, replace_blank_strings
+from pybrainlife.data.partitioned import is_partitioned_dataset, stream_moments
+from pybrainlife.data.index import SubjectIndex
+from pybrainlife.data.bootstrap import bootstrap_mean_ci, subject_node_array
+from pybrainlife.data.references import merge_reference_jsons, write_reference_bundle, write_reference_json
+from pybrainlife.data.network import NetworkRecord
+from pybrainlife.data.memo import memoized
+from pybrainlife.data.online import build_reference_state
+
+## scipy, sklearn and bct are imported where they are used
 
 ### dataframe manipulations
+## the backend argument of the functions below picks the engine groupbys and string cleanup run on ('pandas', 'pyarrow' or 'polars', see
+## pybrainlife.data.backend). inputs and outputs are pandas dataframes either way. functions marked @memoized reuse their results for repeated
+## inputs while memoization is on (see pybrainlife.data.memo)
+
 ## cut nodes for profilometry / timeseries data
-def cut_nodes(data,num_nodes,dataPath,savename):
+def cut_nodes(data,num_nodes,dataPath,savename,backend='pandas'):
 
     # identify inner n nodes based on num_nodes input
     total_nodes = len(data['nodeID'].unique())
@@ -26,7 +30,8 @@ def cut_nodes(data,num_nodes,dataPath,savename):
     data = data[data['nodeID'].between((cut_nodes)+1,(num_nodes+cut_nodes))]
 
     # replace empty spaces with nans
-    data = data.replace(r'^\s+$', np.nan, regex=True)
+    check_backend(backend)
+    data = replace_blank_strings(data,backend)
 
     if dataPath:
         # output data structure for records and any further analyses
@@ -37,11 +42,16 @@ def cut_nodes(data,num_nodes,dataPath,savename):
 
     return data
 
-## will compute mean dataframe 
-def compute_mean_data(dataPath,data,outname):
+## will compute mean dataframe. data can also be the path of a partitioned parquet dataset (see pybrainlife.data.partitioned), which is
+## streamed instead of loaded
+def compute_mean_data(dataPath,data,outname,backend='pandas'):
 
     # make mean data frame
-    data_mean =  data.groupby(['subjectID','classID','structureID']).mean().reset_index()
+    if is_partitioned_dataset(data):
+        data_mean = stream_moments(data,['subjectID','classID','structureID'])['mean']
+    else:
+        check_backend(backend)
+        data_mean = groupby_aggregate(data,['subjectID','classID','structureID'],'mean',backend)
     data_mean['nodeID'] = [ 1 for f in range(len(data_mean['nodeID'])) ]
 
     if dataPath:
@@ -53,7 +63,95 @@ def compute_mean_data(dataPath,data,outname):
 
     return data_mean
 
+## profile resampling
+## this function stacks the profiles in data into a profiles x nodes x measures array, one profile per unique combination of profile_measures.
+## nodes are ordered by nodeID; profiles shorter than the longest are padded with nans. returns the array, the number of nodes of each profile
+## and a dataframe with the first row of each profile (its ids and any other per-profile columns)
+def profiles_to_array(data,measures,profile_measures=['subjectID','sessionID','structureID']):
+
+    profile_measures = [ f for f in profile_measures if f in data.columns ]
+    data = data.dropna(subset=['nodeID']).sort_values(profile_measures+['nodeID'],kind='stable')
+
+    # profile code and position along the profile of every row
+    codes = data.groupby(profile_measures,sort=False).ngroup().to_numpy()
+    positions = data.groupby(codes,sort=False).cumcount().to_numpy()
+    lengths = np.bincount(codes)
+
+    values = np.full((len(lengths),lengths.max() if len(lengths) else 0,len(measures)),np.nan)
+    values[codes,positions] = data[measures].to_numpy(dtype=float)
+
+    first = np.r_[True,codes[1:] != codes[:-1]] if len(codes) else np.array([],dtype=bool)
+    profiles = data.loc[first,[ f for f in data.columns if f not in measures+['nodeID'] ]].reset_index(drop=True)
+
+    return values, lengths, profiles
+
+## this function fills the missing nodes of every profile in values (profiles x nodes x measures, nan padded) by linear interpolation between
+## the nearest nodes with data on either side. missing nodes before the first or after the last node with data take that node's value
+def interpolate_missing_nodes(values):
+
+    valid = ~np.isnan(values)
+    if valid.all() or not valid.any():
+        return values
+
+    n_nodes = values.shape[1]
+    nodes = np.broadcast_to(np.arange(n_nodes)[None,:,None],values.shape)
+    previous = np.maximum.accumulate(np.where(valid,nodes,-1),axis=1)
+    following = np.minimum.accumulate(np.where(valid,nodes,n_nodes)[:,::-1],axis=1)[:,::-1]
+
+    # ends take their one neighbour with data
+    missing = ~valid & ((previous >= 0) | (following < n_nodes))
+    lower = np.where(previous >= 0,previous,following)[missing]
+    upper = np.where(following < n_nodes,following,previous)[missing]
+    profiles, _, measures = np.nonzero(missing)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        fraction = np.where(upper > lower,(nodes[missing] - lower) / (upper - lower),0)
+
+    out = values.copy()
+    out[missing] = values[profiles,lower,measures] + fraction * (values[profiles,upper,measures] - values[profiles,lower,measures])
+
+    return out
+
+## this function linearly resamples every profile in values (profiles x nodes x measures, nan padded, as from profiles_to_array) to num_nodes
+## evenly spaced points along its first lengths[i] nodes, all profiles and measures in one batched interpolation. missing nodes are first
+## filled from the nodes with data around them (see interpolate_missing_nodes); profiles without any data for a measure stay nan
+def resample_profile_array(values,lengths,num_nodes):
+
+    n_profiles = values.shape[0]
+    lengths = np.asarray(lengths)
+    values = interpolate_missing_nodes(values)
+
+    # fractional source position of every target node, per profile
+    position = np.linspace(0,1,num_nodes)[None,:] * (lengths[:,None] - 1)
+    lower = np.clip(np.floor(position).astype(int),0,np.maximum(lengths[:,None]-1,0))
+    upper = np.minimum(lower+1,np.maximum(lengths[:,None]-1,0))
+    fraction = (position - lower)[:,:,None]
+
+    rows = np.arange(n_profiles)[:,None]
+
+    return values[rows,lower] * (1 - fraction) + values[rows,upper] * fraction
+
+## this function resamples the profiles of every subject, session and structure in data to num_nodes nodes, so tractography outputs with
+## different node counts can be combined. unlike cut_nodes, which trims the ends of profiles that all have the same length, profiles of any length are
+## stretched or squeezed onto nodeIDs 1..num_nodes. columns other than the measures keep the value of the profile's first row
+def resample_profiles(data,measures,num_nodes,profile_measures=['subjectID','sessionID','structureID']):
+
+    with stage('resample',rows=len(data)) as record:
+        values, lengths, profiles = profiles_to_array(data,measures,profile_measures)
+        resampled = resample_profile_array(values,lengths,num_nodes)
+        record['profiles'] = len(lengths)
+
+    # back to one row per profile and node
+    out = profiles.loc[profiles.index.repeat(num_nodes)].reset_index(drop=True)
+    out['nodeID'] = np.tile(np.arange(1,num_nodes+1),len(profiles))
+    out[measures] = resampled.reshape(-1,len(measures))
+
+    return out[[ f for f in data.columns if f in out.columns ]]
+
 ### scripts related to outlier detection and reference dataframe generation
+## reference json keys and the ProfileSummaryCube statistic each one is read from
+REFERENCE_JSON_SUMMARIES = {'mean': 'mean', 'min': 'min', 'max': 'max', 'sd': 'std', '5_percentile': '5_percentile', '25_percentile': '25_percentile',
+                            '75_percentile': '75_percentile', '95_percentile': '95_percentile'}
+
 ## this function will compute distance measures from input data and reference data
 def compute_distance(data,references_data,measures,metric):
 
@@ -69,17 +167,48 @@ def compute_distance(data,references_data,measures,metric):
 
     return dist
 
-## this function will compute simple average references for a given input data
-def compute_references(x,groupby_measures,index_measure,diff_measures):
+## raises a ValueError unless cube summarizes a single class (as built without a group_measure) and holds statistics. references pool every
+## subject, and a cube's classes can't be pooled
+def check_reference_cube(cube,statistics):
+
+    if len(cube.coords['classID']) != 1:
+        raise ValueError('references need a ProfileSummaryCube of a single class (build it without a group_measure), not %d classes'
+                         %len(cube.coords['classID']))
+    missing = [ f for f in statistics if f not in cube.coords['statistic'] ]
+    if missing:
+        raise ValueError('the ProfileSummaryCube lacks the statistics %s' %', '.join(missing))
+
+## this function will compute simple average references for a given input data. x can also be a ProfileSummaryCube built without a group_measure
+## (a single class), in which case the node-wise references for structureID (required) are read from the cube instead of re-aggregating the data,
+## or the path of a partitioned parquet dataset, which is streamed (only the structureID partition, if set)
+@memoized
+def compute_references(x,groupby_measures,index_measure,diff_measures,structureID='',backend='pandas'):
     
-    # computes mean and sd of the measures in a dataframe
-    references_mean = x.groupby(groupby_measures).mean().reset_index(index_measure)
-    references_sd = x.groupby(groupby_measures).std().reset_index(index_measure)
+    if isinstance(x,ProfileSummaryCube):
+        if groupby_measures not in ['nodeID',['nodeID']]:
+            raise ValueError('references can only be read from a ProfileSummaryCube grouped by nodeID')
+        check_reference_cube(x,['mean','std'])
+        if not structureID:
+            raise ValueError('references read from a ProfileSummaryCube need a structureID')
+        references_mean = x.to_frame('mean',structureID=structureID).drop(columns=['classID','structureID'])
+        references_sd = x.to_frame('std',structureID=structureID).drop(columns=['classID','structureID'])
+    elif is_partitioned_dataset(x):
+        keys = [groupby_measures] if isinstance(groupby_measures,str) else list(groupby_measures)
+        moments = stream_moments(x,keys,filters={'structureID': structureID} if structureID else None)
+        references_mean = moments['mean'].set_index(keys).reset_index(index_measure)
+        references_sd = moments['std'].set_index(keys).reset_index(index_measure)
+    else:
+        # computes mean and sd of the measures in a dataframe
+        check_backend(backend)
+        keys = [groupby_measures] if isinstance(groupby_measures,str) else list(groupby_measures)
+        references_mean = groupby_aggregate(x,keys,'mean',backend).set_index(keys).reset_index(index_measure)
+        references_sd = groupby_aggregate(x,keys,'std',backend).set_index(keys).reset_index(index_measure)
     references_sd[diff_measures] = references_sd[diff_measures] * 2
     
     return references_mean, references_sd
 
 ## this function calls compute_references and compute_distance to create a dataframe of distance measures
+@memoized
 def create_distance_dataframe(data,structures,groupby_measure,measures,dist_metric):
     
     # set up output lists that we will append to
@@ -90,7 +219,7 @@ def create_distance_dataframe(data,structures,groupby_measure,measures,dist_metr
 
     # loop through appropriate structures
     for i in structures:
-        print(i)
+        report_progress(i)
         # set data for a given structure
         subj_data = data.loc[data['structureID'] == i]
         # compute reference for given structure
@@ -116,11 +245,95 @@ def create_distance_dataframe(data,structures,groupby_measure,measures,dist_metr
     
     return dist_dataframe
 
-## this function is useful for saving reference.jsons for a given structure
-def output_reference_json(ref_data,measures,profile,resample_points,sourceID,data_dir,filename):
+## this function computes robust mahalanobis distances of every row (subject) of values (subjects x features) from the bulk of the rows, in one
+## batched step. missing values are filled with the feature median and features are scaled by their median absolute deviation. the covariance
+## is a minimum covariance determinant estimate when there are enough subjects for it (more than twice the features), otherwise a
+## ledoit-wolf shrinkage estimate refit without the subjects beyond the 97.5% chi-square quantile of the first fit
+def compute_mahalanobis_distances(values,robust=True):
+
+    from scipy.stats import chi2
+    from sklearn.covariance import LedoitWolf, MinCovDet
+
+    values = np.asarray(values,dtype=float)
+
+    # robust standardization. features without spread carry no information and are dropped
+    center = np.nanmedian(values,axis=0)
+    scale = 1.4826 * np.nanmedian(np.abs(values - center),axis=0)
+    scale = np.where(scale > 0,scale,np.nanstd(values,axis=0))
+    keep = np.isfinite(center) & (scale > 0)
+    values = np.where(np.isnan(values),center,values)[:,keep]
+    z = (values - center[keep]) / scale[keep]
+    n_subjects, n_features = z.shape
+
+    if robust and n_subjects > 2 * n_features:
+        covariance = MinCovDet(random_state=0).fit(z)
+        location, precision = covariance.location_, covariance.precision_
+    else:
+        covariance = LedoitWolf().fit(z)
+        location, precision = covariance.location_, covariance.precision_
+        if robust:
+            diff = z - location
+            inliers = np.einsum('ij,jk,ik->i',diff,precision,diff) <= chi2.ppf(.975,n_features)
+            if inliers.sum() > 1:
+                covariance = LedoitWolf().fit(z[inliers])
+                location, precision = covariance.location_, covariance.precision_
+
+    diff = z - location
+
+    return np.sqrt(np.maximum(np.einsum('ij,jk,ik->i',diff,precision,diff),0))
+
+## this function is the multivariate counterpart of create_distance_dataframe: for each structure, the subjects' profiles of all measures are laid out
+## as one subject x (groupby_measure, measure) matrix and scored with compute_mahalanobis_distances in a single pass. the dataframe has the same
+## layout as create_distance_dataframe's, with each subject's distance repeated for every measure, so compute_outliers and build_reference_data
+## drop a multivariate outlier from all measures of the structure
+def create_multivariate_distance_dataframe(data,structures,groupby_measure,measures):
+
+    frames = []
+    for i in structures:
+        report_progress(i)
+        subj_data = data.loc[data['structureID'] == i]
+        subjects = subj_data.subjectID.unique()
+        if groupby_measure in subj_data.columns and groupby_measure not in ['subjectID','structureID']:
+            table = subj_data.groupby(['subjectID',groupby_measure])[measures].mean().unstack(groupby_measure)
+        else:
+            table = subj_data.groupby('subjectID')[measures].mean()
+        dist = compute_mahalanobis_distances(table.reindex(subjects).to_numpy())
+
+        frames.append(pd.DataFrame({'subjectID': np.tile(subjects,len(measures)), 'structureID': i,
+                                    'measures': np.repeat(measures,len(subjects)), 'distance': np.tile(dist,len(measures))}))
+
+    if not frames:
+        return pd.DataFrame(columns=['subjectID','structureID','measures','distance'])
+
+    return pd.concat(frames,ignore_index=True)
+
+## this function is useful for saving reference.jsons for a given structure. ref_data can also be a ProfileSummaryCube built from the reference data
+## without a group_measure, in which case the summaries are read from the cube (resampled if resample_points is set) instead of re-aggregated.
+## if n_boot is set, a ci percent bootstrap confidence band of the mean (resampling subjects n_boot times) is added to the summaries (or next to
+## the data, without resample_points) as 'mean_ci_lower' and 'mean_ci_upper'. the band needs the subjects' data, so it can't be computed from
+## a cube. jsons are written with pybrainlife.data.references; if bundlePath is set, the references of all structures are also written to one
+## bundle there. if statePath is set, the mergeable reference statistics are saved there for pybrainlife.data.online.update_reference_jsons;
+## this needs the reference dataframe and resample_points (the state rebuilds resampled summaries, not the raw data layout)
+def output_reference_json(ref_data,measures,profile,resample_points,sourceID,data_dir,filename,n_boot=0,ci=95,bundlePath='',statePath=''):
     
+    from scipy.signal import resample
+
+    if statePath and (isinstance(ref_data,ProfileSummaryCube) or not resample_points):
+        raise ValueError('the reference state needs the reference dataframe, not a ProfileSummaryCube, and resample_points')
+
+    if isinstance(ref_data,ProfileSummaryCube):
+        check_reference_cube(ref_data,list(REFERENCE_JSON_SUMMARIES.values())+['count'])
+        if not profile:
+            raise ValueError('a ProfileSummaryCube holds node-wise summaries: profile must be set')
+        if n_boot:
+            raise ValueError('bootstrap confidence bands need the reference dataframe, not a ProfileSummaryCube')
+        structures = ref_data.coords['structureID']
+    else:
+        structures = ref_data.structureID.unique()
+
     # loop through structures in dataframe
-    for st in ref_data.structureID.unique():
+    references = {}
+    for st in structures:
         # set up important measures
         reference_json = []
         tmp = {}
@@ -130,6 +343,17 @@ def output_reference_json(ref_data,measures,profile,resample_points,sourceID,dat
         for meas in measures:
             # grab data
             tmp[meas] = {}
+            if isinstance(ref_data,ProfileSummaryCube):
+                # only keep nodes that have data, like the dropna below
+                summaries = ref_data.sel(classID=ref_data.coords['classID'][0],structureID=st,measure=meas)
+                summaries = summaries[summaries[:,ref_data.coords['statistic'].index('count')] > 0]
+                for key, statistic in REFERENCE_JSON_SUMMARIES.items():
+                    summary = summaries[:,ref_data.coords['statistic'].index(statistic)]
+                    if resample_points:
+                        summary = resample(summary,resample_points)
+                    tmp[meas][key] = summary.tolist()
+                continue
+
             if profile:
                 gb_frame = ref_data.loc[ref_data['structureID'] == st][['nodeID',meas]].dropna().groupby('nodeID')[meas]
             else:
@@ -142,7 +366,7 @@ def output_reference_json(ref_data,measures,profile,resample_points,sourceID,dat
                 mean_tmp = resample(gb_frame.mean().values.tolist(),resample_points).tolist()
                 min_tmp = resample(gb_frame.min().values.tolist(),resample_points).tolist()
                 max_tmp = resample(gb_frame.max().values.tolist(),resample_points).tolist()
-                sd_tmp = resample(gb_frame.std().values.tolist(),resampSNRle_points).tolist()
+                sd_tmp = resample(gb_frame.std().values.tolist(),resample_points).tolist()
                 five_tmp = resample(gb_frame.quantile(q=.05).values.tolist(),resample_points).tolist()
                 twofive_tmp = resample(gb_frame.quantile(q=.25).values.tolist(),resample_points).tolist()
                 sevenfive_tmp = resample(gb_frame.quantile(q=.75).values.tolist(),resample_points).tolist()
@@ -158,16 +382,31 @@ def output_reference_json(ref_data,measures,profile,resample_points,sourceID,dat
             else:
                 data_tmp = gb_frame.values.tolist()
                 tmp[meas]['data'] = data_tmp
+
+            # bootstrap band of the node-wise mean, resampled like the summaries
+            if n_boot:
+                columns = ['subjectID','nodeID',meas] if profile else ['subjectID',meas]
+                values, nodes = subject_node_array(ref_data.loc[ref_data['structureID'] == st][columns].dropna(),meas)
+                lower, upper = bootstrap_mean_ci(values,n_boot,ci)
+                tmp[meas]['mean_ci_lower'] = (resample(lower,resample_points) if resample_points else lower).tolist()
+                tmp[meas]['mean_ci_upper'] = (resample(upper,resample_points) if resample_points else upper).tolist()
         reference_json.append(tmp)
+        references[st] = reference_json
 
         if data_dir:
-            with open(data_dir+'/'+filename+'_'+st+'.json','w') as ref_out_f:
-                json.dump(reference_json,ref_out_f)
+            write_reference_json(data_dir+'/'+filename+'_'+st+'.json',reference_json)
+
+    if bundlePath:
+        write_reference_bundle(references,bundlePath)
+
+    # mergeable statistics for later incremental updates (see pybrainlife.data.online.update_reference_jsons)
+    if statePath:
+        build_reference_state(ref_data,measures,statePath,bootstrapped=bool(n_boot))
     
     return reference_json
 
 ## this function is used to build the reference dataset removing any subjects identified as outliers. the dataframe may or may not be useful
-def build_reference_data(data,outliers,profile,data_dir,filename):
+def build_reference_data(data,outliers,profile,data_dir,filename,backend='pandas'):
     
     # set up dataframe
     reference_data = pd.DataFrame()
@@ -183,7 +422,8 @@ def build_reference_data(data,outliers,profile,data_dir,filename):
             reference_data = pd.concat([reference_data,tmpdata])
     # if not profile, will compute average
     if not profile:
-        reference_data = reference_data.groupby(['structureID','subjectID']).mean().reset_index()
+        check_backend(backend)
+        reference_data = groupby_aggregate(reference_data,['structureID','subjectID'],'mean',backend)
 
     if data_dir:
         reference_data.to_csv(data_dir+'/'+filename+'.csv',index=False)
@@ -205,8 +445,9 @@ def compute_outliers(distances,threshold):
     return outliers
 
 ## this function calls compute_outliers, create_distance_dataframe, and build_reference_data and output_reference_json to actually generate the outliers
-## and final reference datasets
-def outlier_detection(data,structures,groupby_measure,measures,threshold,dist_metric,build_outliers,profile,resample_points,sourceID,data_dir,filename):
+## and final reference datasets. n_boot and ci are passed to output_reference_json for bootstrap confidence bands of the reference mean.
+## dist_metric is 'euclidean' (profiles) or 'emd' per measure, or 'mahalanobis' to score all measures of a structure together
+def outlier_detection(data,structures,groupby_measure,measures,threshold,dist_metric,build_outliers,profile,resample_points,sourceID,data_dir,filename,n_boot=0,ci=95):
     
     # set up important lists
     outliers_subjects = []
@@ -215,13 +456,19 @@ def outlier_detection(data,structures,groupby_measure,measures,threshold,dist_me
     outliers_metrics = []
 
     # compute distances and identify outliers
-    distances = create_distance_dataframe(data,structures,groupby_measure,measures,dist_metric)
-    outliers_dataframe = compute_outliers(distances,threshold)
+    with stage('distance',rows=len(data)):
+        if dist_metric == 'mahalanobis':
+            distances = create_multivariate_distance_dataframe(data,structures,groupby_measure,measures)
+        else:
+            distances = create_distance_dataframe(data,structures,groupby_measure,measures,dist_metric)
+        outliers_dataframe = compute_outliers(distances,threshold)
     
     # if building references, build the reference data. otherwise, output a blank array
     if build_outliers:
-        reference_dataframe = build_reference_data(data,outliers_dataframe,profile,data_dir,filename)
-        reference_json = output_reference_json(reference_dataframe,measures,profile,resample_points,sourceID,data_dir,filename)
+        with stage('reference output') as record:
+            reference_dataframe = build_reference_data(data,outliers_dataframe,profile,data_dir,filename)
+            reference_json = output_reference_json(reference_dataframe,measures,profile,resample_points,sourceID,data_dir,filename,n_boot,ci)
+            record['rows'] = len(reference_dataframe)
     else:
         reference_dataframe = []
         reference_json = []
@@ -242,7 +489,7 @@ def profile_flip_check(data,subjects,structures,test_measure,flip_measures,dist_
 
     # loop through structures
     for i in structures:
-        print(i)
+        report_progress(i)
         # set data frame for structure, including a copy that has the test_measure flipped
         struc_data = data.loc[data['structureID'] == i]
         flipped_struc_data = struc_data.copy()
@@ -277,24 +524,23 @@ def profile_flip_check(data,subjects,structures,test_measure,flip_measures,dist_
         output_summary.to_csv(outPath+'_flipped_profiles.csv',index=False)
         
 # this function will merge the structural and diffusion data for the reference datasets
-def merge_structural_diffusion_json(data,structuralPath,diffusionPath,outPath):
-    for i in data.structureID.unique():
-        print(i)
-        with open(structuralPath+'_'+i+'.json','r') as structural_f:
-            structural = json.load(structural_f)
-
-        with open(diffusionPath+'_'+i+'.json','r') as diffusion_f:
-            diffusion = json.load(diffusion_f)
+def merge_structural_diffusion_json(data,structuralPath,diffusionPath,outPath,n_threads=1,bundlePath=''):
 
-        merged = [{**structural[0],**diffusion[0]}]
-
-        if outPath:
-            with open(outPath+'_'+i+'.json','w') as out_f:
-                json.dump(merged,out_f)
+    # files are read and written in n_threads threads; see pybrainlife.data.references.merge_reference_jsons
+    merge_reference_jsons(data.structureID.unique().tolist(),structuralPath,diffusionPath,outPath,bundlePath,n_threads)
 
 ### adjacency-matrix related fuctions for computing network values locally
-# this function creates a datframe for the connectivity matrix from a network.igraph object
+# this function creates a datframe for the connectivity matrix from a network.igraph object or a pybrainlife.data.network.NetworkRecord
+@memoized
 def build_connectivity_matrix(network,output_array=False):
+    if isinstance(network,NetworkRecord):
+        # records fill the matrix straight from their edge arrays
+        conn_mat = network.adjacency('weight' if 'weight' in network.edge_attributes else None)
+        if output_array:
+            return conn_mat
+        labels = network.labels
+        return pd.DataFrame(conn_mat,index=labels,columns=labels)
+
     if 'weight' in network.es.attributes():
         conn_mat = pd.DataFrame(network.get_adjacency(attribute='weight').data)
     else:
@@ -368,6 +614,8 @@ def parse_networks(network_df):
 # this function will binarize an adjacency matrix
 def binarize_matrices(data):
     
+    import bct
+
     # use brain connectivity toolbox to binarize data
     bin_data = [ bct.utils.binarize(data[f]) for f in data.keys() ]
     
@@ -391,8 +639,9 @@ def threshold_matrices(data,bin_data,thresholdPercentageSubjects):
         
     return data
 
-# this function will compute the mean within-node functional connectivity
-def compute_mean_network_connectivity(data,networks,indices,out_path):
+# this function will compute the mean within-node functional connectivity. subject and session ids are recovered from the keys of data through
+# a SubjectIndex; if subjects_data (i.e. from collect_subject_data) is set, its covariates are joined on with the subject codes
+def compute_mean_network_connectivity(data,networks,indices,out_path,subjects_data=None):
 
     mean_data = []
     subs = []
@@ -409,11 +658,17 @@ def compute_mean_network_connectivity(data,networks,indices,out_path):
                         tmpdata = np.append(tmpdata,data[l][int(i)][int(j)])
             mean_data = np.append(mean_data,np.mean(tmpdata))
 
+    index, subject_codes, session_codes = SubjectIndex.from_matrix_keys(list(data.keys()))
+    subject_codes = np.repeat(subject_codes,len(networks))
+    session_codes = np.repeat(session_codes,len(networks))
+
     out_df = pd.DataFrame()
-    out_df['subjectID'] = [ f.split('_sess1')[0] for f in subs ]
+    out_df['subjectID'] = index.subjects[subject_codes]
+    out_df['sessionID'] = index.sessions.get_level_values('sessionID')[session_codes]
     out_df['FC'] = mean_data
-    out_df = pd.merge(out_df,subjects_data,on='subjectID')
     out_df['structureID'] = nets
+    if subjects_data is not None:
+        out_df = index.join(out_df,subjects_data,codes=subject_codes).reset_index(drop=True)
 
     if out_path:
         out_df.to_csv(out_path,index=False)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+import os
+import pickle
+import hashlib
+import functools
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from contextlib import contextmanager
+from pybrainlife.data.cache import DiskCache, DEFAULT_CACHE_BYTES, hash_frame
+
+### opt-in memoization
+## functions decorated with memoized (compute_references, create_distance_dataframe, build_connectivity_matrix, ...) look their results up
+## in the active Memo, keyed by a content hash of their arguments, while memoization is on. ex:
+##   with memoize(cacheDir='memo') as memo:
+##       distances = create_distance_dataframe(data,structures,'nodeID',measures,'euclidean')
+##       outliers = outlier_detection(data,structures,'nodeID',measures,...)   # reuses the distances above
+## or enable_memoization() / disable_memoization() around notebook cells. when memoization is off the decorated functions run as before.
+## memoization is process-wide, not per thread: a memo turned on in one thread is used by calls in every thread (i.e. the stages a Pipeline
+## runs in its thread pool), which share its entries. Memo is thread safe
+DEFAULT_MEMO_BYTES = 512 * 1024**2
+
+## active memos, innermost last, and the ones enable_memoization turned on
+_active = []
+_enabled = []
+_active_lock = threading.Lock()
+
+## content hash of a function argument. frames are hashed with hash_frame, arrays by their bytes, containers item by item and anything else
+## by its pickle. raises TypeError for paths that exist on disk (their contents can change under the cache) and for values that can't be pickled
+def hash_value(value,out=None):
+
+    out = out if out is not None else hashlib.sha1()
+    if isinstance(value,pd.DataFrame):
+        out.update(b'frame'+hash_frame(value).encode())
+    elif isinstance(value,pd.Series):
+        out.update(b'series'+hash_frame(value.to_frame()).encode())
+    elif isinstance(value,np.ndarray) and value.dtype != object:
+        out.update(repr(('array',value.dtype.str,value.shape)).encode())
+        out.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value,(list,tuple)):
+        out.update(repr((type(value).__name__,len(value))).encode())
+        for f in value:
+            hash_value(f,out)
+    elif isinstance(value,dict):
+        out.update(repr(('dict',len(value))).encode())
+        for key, f in value.items():
+            hash_value(key,out)
+            hash_value(f,out)
+    elif isinstance(value,str) and os.path.exists(value):
+        raise TypeError('%s is a path, its contents are not hashed' %value)
+    else:
+        try:
+            out.update(pickle.dumps(value,protocol=4))
+        except (pickle.PicklingError,TypeError,AttributeError):
+            raise TypeError('cannot hash %s' %type(value).__name__)
+
+    return out
+
+## memo key of a call
+def call_key(name,args,kwargs):
+
+    return hash_value((name,args,sorted(kwargs.items()))).hexdigest()
+
+## approximate memory held by a value
+def value_bytes(value):
+
+    if isinstance(value,(pd.DataFrame,pd.Series)):
+        return int(np.sum(value.memory_usage(deep=True)))
+    if isinstance(value,np.ndarray):
+        return value.nbytes
+    if isinstance(value,(list,tuple)):
+        return sum([ value_bytes(f) for f in value ])
+
+    return len(pickle.dumps(value,protocol=4))
+
+## copy of a memoized value handed to callers, so changing a result doesn't change the memo
+def copy_value(value):
+
+    if isinstance(value,(pd.DataFrame,pd.Series,np.ndarray)):
+        return value.copy()
+    if isinstance(value,(list,tuple)):
+        return type(value)([ copy_value(f) for f in value ])
+
+    return value
+
+## two tier memo: a least recently used in-memory tier of at most max_bytes and, if cacheDir is set, a DiskCache of at most disk_bytes behind
+## it. values too large for the memory tier only go to disk. hits and misses count lookups
+class Memo:
+
+    def __init__(self,max_bytes=DEFAULT_MEMO_BYTES,cacheDir='',disk_bytes=DEFAULT_CACHE_BYTES):
+
+        self.max_bytes = max_bytes
+        self.disk = DiskCache(cacheDir,disk_bytes) if cacheDir else None
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'Memo(entries: %d, bytes: %d, hits: %d, misses: %d)' %(len(self._entries),self.nbytes,self.hits,self.misses)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self,key):
+        return key in self._entries or (self.disk is not None and key in self.disk)
+
+    ## returns (True, value) for a memoized key, (False, None) otherwise. disk hits are promoted to the memory tier
+    def get(self,key):
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key][0]
+
+        if self.disk is not None:
+            missing = object()
+            value = self.disk.get(key,missing)
+            if value is not missing:
+                self._put_memory(key,value)
+                with self._lock:
+                    self.hits += 1
+                return True, value
+
+        with self._lock:
+            self.misses += 1
+
+        return False, None
+
+    def put(self,key,value):
+
+        self._put_memory(key,value)
+        if self.disk is not None:
+            self.disk.put(key,value)
+
+    def _put_memory(self,key,value):
+
+        size = value_bytes(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value,size)
+            self.nbytes += size
+        self.evict()
+
+    ## drops least recently used entries from the memory tier until it holds at most max_bytes (default: the memo's max_bytes). returns the
+    ## number of entries dropped
+    def evict(self,max_bytes=None):
+
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        evicted = 0
+        with self._lock:
+            while self._entries and self.nbytes > max_bytes:
+                _, (_, size) = self._entries.popitem(last=False)
+                self.nbytes -= size
+                evicted += 1
+
+        return evicted
+
+    ## empties the memory tier and, if disk is set, the disk tier
+    def clear(self,disk=False):
+
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+        if disk and self.disk is not None:
+            self.disk.clear()
+
+## turns memoization on for everything run inside the block. yields the Memo
+@contextmanager
+def memoize(max_bytes=DEFAULT_MEMO_BYTES,cacheDir='',disk_bytes=DEFAULT_CACHE_BYTES):
+
+    memo = Memo(max_bytes,cacheDir,disk_bytes)
+    with _active_lock:
+        _active.append(memo)
+    try:
+        yield memo
+    finally:
+        with _active_lock:
+            _active.remove(memo)
+
+## turns memoization on until disable_memoization is called (i.e. across notebook cells). returns the Memo
+def enable_memoization(max_bytes=DEFAULT_MEMO_BYTES,cacheDir='',disk_bytes=DEFAULT_CACHE_BYTES):
+
+    memo = Memo(max_bytes,cacheDir,disk_bytes)
+    with _active_lock:
+        _active.append(memo)
+        _enabled.append(memo)
+
+    return memo
+
+## turns off the memos of enable_memoization. memoize blocks still running keep theirs
+def disable_memoization():
+
+    with _active_lock:
+        for memo in _enabled:
+            _active.remove(memo)
+        _enabled.clear()
+
+## the active Memo, or None when memoization is off
+def active_memo():
+
+    with _active_lock:
+        return _active[-1] if _active else None
+
+## decorator memoizing a function in the active Memo. calls whose arguments can't be hashed run uncached
+def memoized(func):
+
+    name = func.__module__+'.'+func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args,**kwargs):
+
+        memo = active_memo()
+        if memo is None:
+            return func(*args,**kwargs)
+        try:
+            key = call_key(name,args,kwargs)
+        except TypeError:
+            return func(*args,**kwargs)
+
+        found, value = memo.get(key)
+        if not found:
+            value = func(*args,**kwargs)
+            memo.put(key,value)
+
+        return copy_value(value)
+
+    return wrapper
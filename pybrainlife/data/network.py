@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+
+### compact network records
+## a network as plain arrays: node count, edge index arrays, edge / vertex attribute arrays and graph attributes. built straight from jgf
+## without igraph, cheap to copy, pickle to worker processes and cache. it answers the igraph calls pybrainlife's network functions make
+## (get_vertex_dataframe, attributes, network[attribute], ...) and converts to an igraph.Graph with to_igraph when igraph itself is needed
+class NetworkRecord:
+
+    __slots__ = ('n_nodes','directed','sources','targets','edge_attributes','vertex_attributes','graph_attributes')
+
+    def __init__(self,n_nodes,sources,targets,directed=False,edge_attributes=None,vertex_attributes=None,graph_attributes=None):
+
+        self.n_nodes = int(n_nodes)
+        self.directed = bool(directed)
+        self.sources = np.asarray(sources,dtype=np.int32)
+        self.targets = np.asarray(targets,dtype=np.int32)
+        self.edge_attributes = edge_attributes if edge_attributes else {}
+        self.vertex_attributes = vertex_attributes if vertex_attributes else {}
+        self.graph_attributes = graph_attributes if graph_attributes else {}
+
+    def __repr__(self):
+        return 'NetworkRecord(nodes: %d, edges: %d, directed: %s)' %(self.n_nodes,len(self.sources),self.directed)
+
+    def __eq__(self,other):
+
+        if not isinstance(other,NetworkRecord):
+            return NotImplemented
+
+        return (self.n_nodes == other.n_nodes and self.directed == other.directed and np.array_equal(self.sources,other.sources)
+                and np.array_equal(self.targets,other.targets) and self.graph_attributes == other.graph_attributes
+                and all_arrays_equal(self.edge_attributes,other.edge_attributes) and all_arrays_equal(self.vertex_attributes,other.vertex_attributes))
+
+    ## builds a record from one graph of jgf.load's output
+    @classmethod
+    def from_jgf(cls,graph):
+
+        n_nodes = graph.get('node-count',0)
+        edges = np.asarray(graph.get('edges',[]),dtype=np.int64).reshape(-1,2)
+        graph_attributes = dict(graph.get('network-properties',{}))
+        if 'label' in graph:
+            graph_attributes['label'] = graph['label']
+
+        return cls(n_nodes,edges[:,0],edges[:,1],graph.get('directed',False),
+                   { f: attribute_array(v,len(edges)) for f, v in graph.get('edge-properties',{}).items() },
+                   { f: attribute_array(v,n_nodes) for f, v in graph.get('node-properties',{}).items() },
+                   graph_attributes)
+
+    ## builds a record from an igraph.Graph
+    @classmethod
+    def from_igraph(cls,graph):
+
+        edges = np.asarray(graph.get_edgelist(),dtype=np.int64).reshape(-1,2)
+
+        return cls(graph.vcount(),edges[:,0],edges[:,1],graph.is_directed(),
+                   { f: attribute_array(graph.es[f],graph.ecount()) for f in graph.edge_attributes() },
+                   { f: attribute_array(graph.vs[f],graph.vcount()) for f in graph.vertex_attributes() },
+                   { f: graph[f] for f in graph.attributes() })
+
+    def to_igraph(self):
+
+        import igraph as ig
+
+        graph = ig.Graph(self.n_nodes,edges=list(zip(self.sources.tolist(),self.targets.tolist())),directed=self.directed)
+        for key, value in self.graph_attributes.items():
+            graph[key] = value
+        for key, values in self.vertex_attributes.items():
+            graph.vs[key] = values.tolist()
+        for key, values in self.edge_attributes.items():
+            graph.es[key] = values.tolist()
+
+        return graph
+
+    ## node x node adjacency matrix, with the attribute values of the edges (i.e. 'weight') or ones. undirected edges fill both triangles
+    def adjacency(self,attribute=None,dtype=float):
+
+        values = self.edge_attributes[attribute].astype(dtype) if attribute else np.ones(len(self.sources),dtype=dtype)
+        out = np.zeros((self.n_nodes,self.n_nodes),dtype=dtype)
+        out[self.sources,self.targets] = values
+        if not self.directed:
+            out[self.targets,self.sources] = values
+
+        return out
+
+    ## node labels ('name' vertex attribute), or node indices if there isn't one
+    @property
+    def labels(self):
+
+        if 'name' in self.vertex_attributes:
+            return self.vertex_attributes['name']
+
+        return np.arange(self.n_nodes)
+
+    ## igraph-compatible accessors
+    def vcount(self):
+        return self.n_nodes
+
+    def ecount(self):
+        return len(self.sources)
+
+    def is_directed(self):
+        return self.directed
+
+    def attributes(self):
+        return list(self.graph_attributes.keys())
+
+    def __getitem__(self,key):
+        return self.graph_attributes[key]
+
+    def get_vertex_dataframe(self):
+
+        return pd.DataFrame(self.vertex_attributes,index=pd.RangeIndex(self.n_nodes,name='vertex ID'))
+
+    def get_edge_dataframe(self):
+
+        out = pd.DataFrame({'source': self.sources, 'target': self.targets},index=pd.RangeIndex(len(self.sources),name='edge ID'))
+        for key, values in self.edge_attributes.items():
+            out[key] = values
+
+        return out
+
+## jgf attribute values (a list, or a dictionary of index to value for sparse attributes) as an array. sparse gaps are None
+def attribute_array(values,length):
+
+    if isinstance(values,dict):
+        out = np.empty(length,dtype=object)
+        for key, value in values.items():
+            out[int(key)] = value
+        return out
+
+    out = np.asarray(values)
+    if out.ndim != 1 or out.dtype.kind not in 'biuf':
+        out = np.empty(len(values),dtype=object)
+        out[:] = list(values)
+
+    return out
+
+def all_arrays_equal(a,b):
+
+    return a.keys() == b.keys() and all([ np.array_equal(a[f],b[f]) for f in a.keys() ])
+
+## this function loads the graphs of a jgf file as NetworkRecords
+def load_network_records(path,compressed=None):
+
+    import jgf
+
+    return [ NetworkRecord.from_jgf(f) for f in jgf.load(path,compressed=compressed) ]
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+import os
+import pickle
+import tempfile
+import numpy as np
+import pandas as pd
+from pybrainlife.data.instrument import logger, stage
+from pybrainlife.data.partitioned import partial_moments, merge_moments
+from pybrainlife.data.references import write_reference_json, write_reference_bundle
+
+## scipy is imported where references are resampled
+
+### online reference statistics
+## the statistics of a reference json kept as mergeable state per structure x node x measure: counts, means and sums of squared deviations
+## (merged with chan et al.'s update, see pybrainlife.data.partitioned), min / max, and a quantile sketch. new subjects are folded into the
+## state and the reference jsons of the structures they touch are rewritten from it, without revisiting the rest of the cohort
+
+## centroids kept per structure x node x measure. while a group has at most this many values its quantiles are exact
+DEFAULT_SKETCH_SIZE = 256
+
+## reference json keys and the quantile each percentile is read from
+REFERENCE_QUANTILES = {'5_percentile': .05, '25_percentile': .25, '75_percentile': .75, '95_percentile': .95}
+
+SKETCH_KEYS = ['structureID','nodeID','measure']
+
+## the measures of data as one row per non-nan value: structureID, nodeID, measure, value and weight (1)
+def melt_values(data,measures):
+
+    out = data.melt(id_vars=['structureID','nodeID'],value_vars=list(measures),var_name='measure',value_name='value').dropna(subset=['value'])
+    out['weight'] = 1.0
+
+    return out.reset_index(drop=True)
+
+## merges quantile sketches (a can be None): tables of weighted centroids (value, weight) per structure x node x measure. groups holding more
+## than sketch_size centroids are compressed to sketch_size centroids of about equal weight, each at the weighted mean of the values it replaces
+def merge_sketches(a,b,sketch_size=DEFAULT_SKETCH_SIZE):
+
+    merged = pd.concat([ f for f in [a,b] if f is not None ],ignore_index=True).sort_values(SKETCH_KEYS+['value'],kind='stable',ignore_index=True)
+    grouped = merged.groupby(SKETCH_KEYS,sort=False)
+    size = grouped['weight'].transform('size').to_numpy()
+    if (size <= sketch_size).all():
+        return merged
+
+    weight = merged['weight'].to_numpy()
+    total = grouped['weight'].transform('sum').to_numpy()
+    before = grouped['weight'].cumsum().to_numpy() - weight
+    centroid = np.where(size > sketch_size,np.floor((before + weight / 2) / total * sketch_size),grouped.cumcount().to_numpy())
+
+    merged['centroid'] = centroid.astype(int)
+    merged['weighted'] = merged['value'] * merged['weight']
+    out = merged.groupby(SKETCH_KEYS+['centroid'],sort=False)[['weighted','weight']].sum().reset_index()
+    out['value'] = out['weighted'] / out['weight']
+
+    return out[SKETCH_KEYS+['value','weight']]
+
+## quantiles q of every group of a sketch, interpolated between centroid ranks like pandas' linear quantiles (exact for uncompressed groups).
+## returns a frame of the group keys and the quantile values
+def sketch_quantiles(sketch,q):
+
+    grouped = sketch.groupby(SKETCH_KEYS,sort=False)
+    codes = grouped.ngroup().to_numpy()
+    weight = sketch['weight'].to_numpy()
+    values = sketch['value'].to_numpy()
+    total = grouped['weight'].sum().to_numpy()
+    starts = np.flatnonzero(np.r_[True,np.diff(codes) != 0])
+    ends = np.r_[starts[1:],len(codes)] - 1
+
+    # centroid rank centers, offset per group so they increase over the whole table
+    span = total.max() + 1
+    ranks = grouped['weight'].cumsum().to_numpy() - weight + (weight - 1) / 2 + codes * span
+    targets = q * (total - 1) + np.arange(len(total)) * span
+    hi = np.clip(np.searchsorted(ranks,targets,side='right'),starts,ends)
+    lo = np.clip(hi - 1,starts,ends)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        fraction = np.clip(np.where(ranks[hi] > ranks[lo],(targets - ranks[lo]) / (ranks[hi] - ranks[lo]),0),0,1)
+
+    out = sketch.iloc[starts][SKETCH_KEYS].reset_index(drop=True)
+    out['value'] = values[lo] + fraction * (values[hi] - values[lo])
+
+    return out
+
+## mergeable reference statistics of measures. update folds in reference data (as returned by build_reference_data, with a nodeID column for
+## profiles; tables without one are treated as a single node), skipping subjects already folded in. bootstrapped records that the reference
+## jsons the state was built with hold bootstrap confidence bands, which the state can't update
+class ReferenceState:
+
+    def __init__(self,measures,sketch_size=DEFAULT_SKETCH_SIZE,bootstrapped=False):
+
+        self.measures = list(measures)
+        self.sketch_size = sketch_size
+        self.bootstrapped = bootstrapped
+        self.moments = None
+        self.sketch = None
+        self.subjects = set()
+
+    def __repr__(self):
+        return 'ReferenceState(subjects: %d, measures: %s)' %(len(self.subjects),', '.join(self.measures))
+
+    ## the subject (and session) key of every row of data
+    @staticmethod
+    def subject_keys(data):
+
+        if 'sessionID' in data.columns:
+            return data['subjectID'].astype(str) + '_sess' + data['sessionID'].astype(str)
+
+        return data['subjectID'].astype(str)
+
+    ## folds data into the state. returns the structures it touched
+    def update(self,data):
+
+        keys = self.subject_keys(data)
+        seen = keys.isin(self.subjects).to_numpy()
+        if seen.any():
+            logger.warning('skipping %d rows of subjects already in the reference' %seen.sum())
+            data, keys = data.loc[~seen], keys[~seen]
+        if not len(data):
+            return []
+        if 'nodeID' not in data.columns:
+            data = data.assign(nodeID=1)
+
+        with stage('reference update',rows=len(data)):
+            moments = partial_moments(data,['structureID','nodeID'],self.measures)
+            self.moments = moments if self.moments is None else merge_moments(self.moments,moments)
+            self.sketch = merge_sketches(self.sketch,melt_values(data,self.measures),self.sketch_size)
+            self.subjects.update(keys.unique().tolist())
+
+        return data['structureID'].unique().tolist()
+
+    ## node-wise statistics of every structure x node (index) and measure (columns): count, mean, sd, min, max and the REFERENCE_QUANTILES
+    def statistics(self):
+
+        count = self.moments['count']
+        out = {'count': count, 'mean': self.moments['mean'], 'min': self.moments['min'], 'max': self.moments['max']}
+        with np.errstate(divide='ignore',invalid='ignore'):
+            out['sd'] = np.sqrt(self.moments['m2'] / (count - 1)).where(count > 1)
+        for key, q in REFERENCE_QUANTILES.items():
+            quantiles = sketch_quantiles(self.sketch,q).pivot(index=['structureID','nodeID'],columns='measure',values='value')
+            out[key] = quantiles.reindex(index=count.index,columns=count.columns)
+
+        return out
+
+    ## reference jsons of structures (default: all), in the output_reference_json layout of resampled summaries (the raw data layout written
+    ## without resample_points can't be rebuilt from the state). dictionary of structure to reference json
+    def reference_jsons(self,sourceID,resample_points,structures=None):
+
+        from scipy.signal import resample
+
+        if not resample_points:
+            raise ValueError('reference jsons are rebuilt from the state as resampled summaries: resample_points must be set')
+
+        statistics = self.statistics()
+        structures = structures if structures is not None else statistics['count'].index.get_level_values('structureID').unique().tolist()
+
+        references = {}
+        for st in structures:
+            tmp = {'structurename': st, 'source': sourceID}
+            for meas in self.measures:
+                # only nodes that have data, like the dropna in output_reference_json
+                nodes = statistics['count'].xs(st)[meas] > 0
+                tmp[meas] = {}
+                for key in ['mean','min','max','sd']+list(REFERENCE_QUANTILES.keys()):
+                    summary = statistics[key].xs(st)[meas][nodes].to_numpy(dtype=float)
+                    tmp[meas][key] = resample(summary,resample_points).tolist()
+            references[st] = [tmp]
+
+        return references
+
+    def save(self,outPath):
+
+        out_dir = os.path.dirname(os.path.abspath(outPath))
+        fd, tmpPath = tempfile.mkstemp(dir=out_dir,suffix='.tmp')
+        with os.fdopen(fd,'wb') as out_f:
+            pickle.dump(self,out_f,protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpPath,outPath)
+
+        return outPath
+
+def load_reference_state(inPath):
+
+    with open(inPath,'rb') as in_f:
+        return pickle.load(in_f)
+
+## this function builds the reference state of reference_data (see ReferenceState) and, if outPath is set, saves it there
+def build_reference_state(reference_data,measures,outPath='',sketch_size=DEFAULT_SKETCH_SIZE,bootstrapped=False):
+
+    state = ReferenceState(measures,sketch_size,bootstrapped)
+    state.update(reference_data)
+    if outPath:
+        state.save(outPath)
+
+    return state
+
+## this function folds new reference data (i.e. build_reference_data run on newly collected subjects) into the reference state at statePath
+## (created if it doesn't exist) and rewrites the reference jsons data_dir+'/'+filename+'_'+structure+'.json' of the structures the new data
+## touches, and the bundle at bundlePath if that is set. resample_points must be set (see ReferenceState.reference_jsons). bootstrap confidence
+## bands (mean_ci_lower / mean_ci_upper) can't be updated and are left out of the rewritten jsons. returns a dictionary of structure to
+## rewritten reference json
+def update_reference_jsons(statePath,new_data,measures,resample_points,sourceID,data_dir,filename,bundlePath='',sketch_size=DEFAULT_SKETCH_SIZE):
+
+    if not resample_points:
+        raise ValueError('reference jsons are rebuilt from the state as resampled summaries: resample_points must be set')
+
+    state = load_reference_state(statePath) if os.path.exists(statePath) else ReferenceState(measures,sketch_size)
+    if getattr(state,'bootstrapped',False):
+        logger.warning('the reference jsons hold bootstrap confidence bands, which are dropped: rerun output_reference_json with n_boot to rebuild them')
+    structures = state.update(new_data)
+    references = state.reference_jsons(sourceID,resample_points,structures) if structures else {}
+
+    for st, reference_json in references.items():
+        write_reference_json(data_dir+'/'+filename+'_'+st+'.json',reference_json)
+    if bundlePath:
+        write_reference_bundle(state.reference_jsons(sourceID,resample_points),bundlePath)
+    state.save(statePath)
+
+    return references
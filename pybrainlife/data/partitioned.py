@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+import os
+import numpy as np
+import pandas as pd
+from pybrainlife.data.summary import SUMMARY_QUANTILES
+from pybrainlife.data.instrument import stage
+
+### out-of-core aggregation over partitioned parquet datasets
+## profile tables too big for memory are stored as a parquet dataset partitioned by structureID (a directory with one structureID=<name>
+## subdirectory per structure). count, mean, std, min and max are computed by streaming record batches and merging partial aggregates, so
+## memory only grows with the number of groups. quantiles need every value of a group at once, so they are computed one partition at a time
+## and need the partition columns among the grouping keys. needs pyarrow
+
+## statistics that are merged across batches
+STREAMING_STATISTICS = ['count','mean','std','min','max']
+
+## rows per record batch read from the dataset
+DEFAULT_BATCH_ROWS = 1024**2
+
+## this function writes data as a parquet dataset under outPath, partitioned by partition_cols
+def write_partitioned_dataset(data,outPath,partition_cols=['structureID']):
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # lists (i.e. tags) don't round trip through parquet partitions cleanly and aren't aggregated, so they are left out
+    columns = [ f for f in data.columns if not data[f].map(lambda x: isinstance(x,(list,np.ndarray))).any() ]
+    pq.write_to_dataset(pa.Table.from_pandas(data[columns],preserve_index=False),outPath,partition_cols=partition_cols)
+
+    return outPath
+
+## returns True if x is the path of a partitioned dataset rather than a dataframe
+def is_partitioned_dataset(x):
+
+    return isinstance(x,str) and os.path.isdir(x)
+
+def open_dataset(dataPath):
+
+    import pyarrow.dataset as ds
+
+    return ds.dataset(dataPath,format='parquet',partitioning='hive')
+
+## names of the numeric columns of the dataset that aren't grouping keys
+def dataset_measures(dataset,keys):
+
+    import pyarrow as pa
+
+    return [ f.name for f in dataset.schema if f.name not in keys and (pa.types.is_integer(f.type) or pa.types.is_floating(f.type)) ]
+
+## builds a pyarrow filter expression from a dictionary of column to value (or list of values)
+def build_filter(filters):
+
+    import pyarrow.dataset as ds
+
+    expression = None
+    for column, value in filters.items():
+        if isinstance(value,(list,tuple)):
+            condition = ds.field(column).isin(value)
+        else:
+            condition = ds.field(column) == value
+        expression = condition if expression is None else expression & condition
+
+    return expression
+
+## partial aggregates of one batch: per group and measure, the count of non-nan values, their mean, sum of squared deviations from the mean
+## (m2), min and max
+def partial_moments(data,keys,measures):
+
+    grouped = data.groupby(keys)[measures]
+    count = grouped.count()
+    mean = grouped.mean()
+    m2 = (grouped.var(ddof=0) * count).fillna(0)
+
+    return {'count': count, 'mean': mean, 'm2': m2, 'min': grouped.min(), 'max': grouped.max()}
+
+## merges two sets of partial aggregates (chan et al.'s parallel variance update). groups only present in one of them are kept as they are
+def merge_moments(a,b):
+
+    index = a['count'].index.union(b['count'].index)
+    a = { f: a[f].reindex(index) for f in a.keys() }
+    b = { f: b[f].reindex(index) for f in b.keys() }
+
+    count_a = a['count'].fillna(0)
+    count_b = b['count'].fillna(0)
+    count = count_a + count_b
+    delta = b['mean'].fillna(0) - a['mean'].fillna(0)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        mean = (a['mean'].fillna(0) * count_a + b['mean'].fillna(0) * count_b) / count
+        m2 = a['m2'].fillna(0) + b['m2'].fillna(0) + delta**2 * count_a * count_b / count
+
+    return {'count': count, 'mean': mean.where(count > 0), 'm2': m2.where(count > 0,0),
+            'min': np.fmin(a['min'],b['min']), 'max': np.fmax(a['max'],b['max'])}
+
+## this function streams the dataset at dataPath in record batches and returns the streaming statistics (see STREAMING_STATISTICS) of
+## measures (default: every numeric column) grouped by keys, as a dictionary of statistic to dataframe with the keys as columns.
+## filters is an optional dictionary of column to value(s), i.e. {'structureID': 'lh_arcuate'}; filters on partition columns skip whole files
+def stream_moments(dataPath,keys,measures=None,filters=None,batch_rows=DEFAULT_BATCH_ROWS):
+
+    keys = [keys] if isinstance(keys,str) else list(keys)
+    dataset = open_dataset(dataPath)
+    measures = measures if measures else dataset_measures(dataset,keys)
+    expression = build_filter(filters) if filters else None
+
+    moments = None
+    with stage('stream aggregate') as record:
+        for batch in dataset.to_batches(columns=keys+measures,filter=expression,batch_size=batch_rows):
+            if batch.num_rows == 0:
+                continue
+            partial = partial_moments(batch.to_pandas(),keys,measures)
+            moments = partial if moments is None else merge_moments(moments,partial)
+            record['rows'] = record['rows'] + batch.num_rows
+
+    if moments is None:
+        empty = pd.DataFrame(columns=keys+measures)
+        return { f: empty.copy() for f in STREAMING_STATISTICS }
+
+    # match pandas: sample standard deviation, nan for groups with fewer than two values
+    with np.errstate(divide='ignore',invalid='ignore'):
+        std = np.sqrt(moments['m2'] / (moments['count'] - 1)).where(moments['count'] > 1)
+    out = {'count': moments['count'].astype(int), 'mean': moments['mean'], 'std': std, 'min': moments['min'], 'max': moments['max']}
+
+    return { f: out[f].sort_index().reset_index() for f in out.keys() }
+
+## this function computes quantiles (a dictionary of name to quantile, default SUMMARY_QUANTILES plus the median) of measures grouped by keys,
+## loading one partition at a time. every group has to sit inside one partition, so keys must include the dataset's partition columns
+def partition_quantiles(dataPath,keys,quantiles=None,measures=None,filters=None):
+
+    keys = [keys] if isinstance(keys,str) else list(keys)
+    quantiles = quantiles if quantiles else dict(SUMMARY_QUANTILES,median=.5)
+    dataset = open_dataset(dataPath)
+    measures = measures if measures else dataset_measures(dataset,keys)
+    expression = build_filter(filters) if filters else None
+
+    partition_cols = dataset.partitioning.schema.names if dataset.partitioning else []
+    if not set(partition_cols).issubset(keys):
+        raise ValueError('quantiles of a partitioned dataset can only be grouped by keys that include the partition columns %s' %partition_cols)
+
+    # a partition can be spread over several files; read each partition once
+    partitions = {}
+    for fragment in dataset.get_fragments(filter=expression):
+        partitions[str(fragment.partition_expression)] = fragment.partition_expression
+
+    out = { f: [] for f in quantiles.keys() }
+    with stage('partition quantiles') as record:
+        for partition in partitions.values():
+            condition = partition if expression is None else partition & expression
+            data = dataset.to_table(columns=keys+measures,filter=condition).to_pandas()
+            record['rows'] = record['rows'] + len(data)
+            record['partitions'] = record.get('partitions',0) + 1
+            grouped = data.groupby(keys)[measures]
+            for name, q in quantiles.items():
+                out[name].append(grouped.quantile(q))
+
+    return { f: pd.concat(out[f]).sort_index().reset_index() if out[f] else pd.DataFrame(columns=keys+measures) for f in out.keys() }
+
+## this function returns the requested statistics (names from pybrainlife.data.summary.SUMMARY_STATISTICS, minus sem) of the dataset at
+## dataPath grouped by keys, as a dictionary of statistic to dataframe with the keys as columns
+def aggregate_partitioned(dataPath,keys,statistics=['mean','std'],measures=None,filters=None,batch_rows=DEFAULT_BATCH_ROWS):
+
+    out = {}
+    streaming = [ f for f in statistics if f in STREAMING_STATISTICS ]
+    if streaming:
+        moments = stream_moments(dataPath,keys,measures,filters,batch_rows)
+        out.update({ f: moments[f] for f in streaming })
+
+    quantiles = dict(SUMMARY_QUANTILES,median=.5)
+    requested = { f: quantiles[f] for f in statistics if f in quantiles.keys() }
+    if requested:
+        out.update(partition_quantiles(dataPath,keys,requested,measures,filters))
+
+    unknown = [ f for f in statistics if f not in out.keys() ]
+    if unknown:
+        raise ValueError('unsupported statistics for a partitioned dataset: %s' %', '.join(unknown))
+
+    return out
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import json
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from pybrainlife.data.instrument import stage, report_progress
+
+### reference json i/o
+## reference jsons are written with the standard json module, in the format they have always had (nan is written as NaN), and read with
+## orjson when it is installed (several times faster). orjson doesn't accept NaN, so files that hold it are read with the json module
+
+## numpy values for the standard json module
+def to_builtin(obj):
+
+    if isinstance(obj,np.ndarray):
+        return obj.tolist()
+    if isinstance(obj,np.generic):
+        return obj.item()
+
+    raise TypeError('%s is not json serializable' %type(obj).__name__)
+
+def dumps_json(obj):
+
+    return json.dumps(obj,default=to_builtin).encode()
+
+def loads_json(data):
+
+    try:
+        import orjson
+    except ImportError:
+        return json.loads(data)
+
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return json.loads(data)
+
+def write_reference_json(outPath,reference_json):
+
+    with open(outPath,'wb') as out_f:
+        out_f.write(dumps_json(reference_json))
+
+def read_reference_json(inPath):
+
+    with open(inPath,'rb') as in_f:
+        return loads_json(in_f.read())
+
+## runs func(structure) for every structure, in n_threads threads. returns the results in the order of structures
+def map_structures(func,structures,n_threads=1):
+
+    if n_threads > 1 and len(structures) > 1:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            return list(executor.map(func,structures))
+
+    return [ func(f) for f in structures ]
+
+### consolidated reference bundles
+## all reference jsons of a library in one .npz file. every summary list is stored as a float array under '<structure>/<measure>/<summary>'
+## and everything else of a structure's reference (name, source, ...) as json under '<structure>/__meta__'. np.load reads members on access,
+## so opening a bundle is cheap and each structure is only read when it is asked for
+
+## this function writes references (a dictionary of structure to reference json, as written by output_reference_json) to bundlePath
+def write_reference_bundle(references,bundlePath):
+
+    arrays = {}
+    for structure, reference_json in references.items():
+        meta = []
+        for entry in reference_json:
+            entry_meta = {}
+            for key, value in entry.items():
+                if isinstance(value,dict):
+                    entry_meta[key] = {}
+                    for summary, values in value.items():
+                        arrays['%s/%s/%s' %(structure,key,summary)] = np.asarray(values,dtype=float)
+                else:
+                    entry_meta[key] = value
+            meta.append(entry_meta)
+        arrays['%s/__meta__' %structure] = np.frombuffer(dumps_json(meta),dtype=np.uint8)
+
+    np.savez(bundlePath,**arrays)
+
+    return bundlePath
+
+## lazily loaded reference bundle. bundle[structure] returns that structure's reference json in the output_reference_json layout
+class ReferenceBundle:
+
+    def __init__(self,bundlePath):
+
+        self._npz = np.load(bundlePath)
+        self.structures = [ f.rsplit('/',1)[0] for f in self._npz.files if f.endswith('/__meta__') ]
+
+        # summary arrays of each structure
+        self._members = { f: [] for f in self.structures }
+        for name in self._npz.files:
+            if not name.endswith('/__meta__'):
+                structure, measure, summary = name.rsplit('/',2)
+                self._members[structure].append((name,measure,summary))
+
+    def __repr__(self):
+        return 'ReferenceBundle(structures: %d)' %len(self.structures)
+
+    def __contains__(self,structure):
+        return structure in self.structures
+
+    def __len__(self):
+        return len(self.structures)
+
+    def __iter__(self):
+        return iter(self.structures)
+
+    def __getitem__(self,structure):
+
+        if structure not in self.structures:
+            raise KeyError(structure)
+
+        reference_json = loads_json(self._npz['%s/__meta__' %structure].tobytes())
+        for name, measure, summary in self._members[structure]:
+            for entry in reference_json:
+                if measure in entry:
+                    entry[measure][summary] = self._npz[name].tolist()
+
+        return reference_json
+
+    def close(self):
+        self._npz.close()
+
+def load_reference_bundle(bundlePath):
+
+    return ReferenceBundle(bundlePath)
+
+## this function reads the reference jsons inPath+'_'+structure+'.json' of every structure in n_threads threads and writes them to one bundle
+def bundle_reference_jsons(structures,inPath,bundlePath,n_threads=8):
+
+    with stage('bundle references',rows=len(structures)):
+        references = map_structures(lambda f: read_reference_json(inPath+'_'+f+'.json'),list(structures),n_threads)
+        write_reference_bundle(dict(zip(structures,references)),bundlePath)
+
+    return bundlePath
+
+## this function merges the structural and diffusion reference jsons of every structure, reading and writing in n_threads threads. merged
+## jsons are written to outPath+'_'+structure+'.json' if outPath is set, and to one bundle at bundlePath if that is set. returns a dictionary of
+## structure to merged reference json
+def merge_reference_jsons(structures,structuralPath,diffusionPath,outPath='',bundlePath='',n_threads=8):
+
+    def merge(structure):
+        report_progress(structure)
+        structural = read_reference_json(structuralPath+'_'+structure+'.json')
+        diffusion = read_reference_json(diffusionPath+'_'+structure+'.json')
+        merged = [{**structural[0],**diffusion[0]}]
+        if outPath:
+            write_reference_json(outPath+'_'+structure+'.json',merged)
+
+        return merged
+
+    with stage('merge references',rows=len(structures)) as record:
+        merged = dict(zip(structures,map_structures(merge,list(structures),n_threads)))
+        record['files'] = 2 * len(structures)
+
+    if bundlePath:
+        write_reference_bundle(merged,bundlePath)
+
+    return merged
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+
+### reliability statistics for paired (i.e. test retest, validity) data
+## this function computes n, r, rmse, slope, intercept and icc for every group of paired X,Y values in a single pass. groups is an array the same
+## length as X and Y identifying which group each pair belongs to (i.e. structureID, subjectID). if groups is not set, all pairs are treated as one group.
+## pairs where either value is nan are dropped. returns a dataframe with one row per group, in order of first appearance
+def compute_pair_stats(X,Y,groups=None,group_name='group'):
+
+    X = np.asarray(X,dtype=float)
+    Y = np.asarray(Y,dtype=float)
+    if groups is None:
+        groups = np.zeros(len(X),dtype=int)
+
+    # drop pairs containing nans
+    keep = ~(np.isnan(X) | np.isnan(Y))
+    codes, uniques = pd.factorize(np.asarray(groups)[keep])
+    X = X[keep]
+    Y = Y[keep]
+    n_groups = len(uniques)
+
+    # group counts and means
+    n = np.bincount(codes,minlength=n_groups).astype(float)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        mean_x = np.bincount(codes,weights=X,minlength=n_groups) / n
+        mean_y = np.bincount(codes,weights=Y,minlength=n_groups) / n
+
+    # centered second moments. centering against group means keeps the sums stable for large values
+    dx = X - mean_x[codes]
+    dy = Y - mean_y[codes]
+    sxx = np.bincount(codes,weights=dx*dx,minlength=n_groups)
+    syy = np.bincount(codes,weights=dy*dy,minlength=n_groups)
+    sxy = np.bincount(codes,weights=dx*dy,minlength=n_groups)
+    sse = np.bincount(codes,weights=(X-Y)**2,minlength=n_groups)
+
+    with np.errstate(divide='ignore',invalid='ignore'):
+        r = sxy / np.sqrt(sxx * syy)
+        rmse = np.sqrt(sse / n)
+        slope = sxy / sxx
+        intercept = mean_y - slope * mean_x
+
+        # icc(2,1): two-way random effects, absolute agreement, single measurement. x and y are treated as the two raters / sessions
+        grand_mean = (mean_x + mean_y) / 2
+        ss_rows = (sxx + syy + 2*sxy) / 2
+        ss_cols = n * ((mean_x - grand_mean)**2 + (mean_y - grand_mean)**2)
+        ss_total = sxx + syy + n * ((mean_x - grand_mean)**2 + (mean_y - grand_mean)**2)
+        ss_error = ss_total - ss_rows - ss_cols
+        ms_rows = ss_rows / (n - 1)
+        ms_cols = ss_cols
+        ms_error = ss_error / (n - 1)
+        icc = (ms_rows - ms_error) / (ms_rows + ms_error + 2 * (ms_cols - ms_error) / n)
+
+    out_df = pd.DataFrame()
+    out_df[group_name] = uniques
+    out_df['n'] = n.astype(int)
+    out_df['r'] = r
+    out_df['rmse'] = rmse
+    out_df['slope'] = slope
+    out_df['intercept'] = intercept
+    out_df['icc'] = icc
+
+    return out_df
+
+## wrapper around compute_pair_stats for paired dataframes. x_data and y_data should have the same number of rows and correspond to the same source
+## (i.e. subject) row by row, the same way setup_data expects. groupby_measure is the column within which each unique value gets its own row of statistics.
+## if groupby_measure is empty, computes a single row across all the data. if outPath is set, will save the table as a csv for reports
+def compute_reliability_stats(x_data,y_data,x_measure,y_measure,groupby_measure,outPath=''):
+
+    if groupby_measure:
+        groups = x_data[groupby_measure].values
+        group_name = groupby_measure
+    else:
+        groups = None
+        group_name = 'group'
+
+    stats_df = compute_pair_stats(x_data[x_measure].values,y_data[y_measure].values,groups,group_name)
+
+    if outPath:
+        stats_df.to_csv(outPath,index=False)
+
+    return stats_df
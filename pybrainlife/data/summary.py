@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import os
+import numpy as np
+import pandas as pd
+
+### precomputed profile summaries
+## summary statistics stored in the cube. quantile names match the keys used in the reference jsons
+SUMMARY_STATISTICS = ['mean','median','min','max','std','sem','count','5_percentile','25_percentile','75_percentile','95_percentile']
+SUMMARY_QUANTILES = {'5_percentile': .05, '25_percentile': .25, '75_percentile': .75, '95_percentile': .95}
+
+## labeled numpy array of profile summaries with dimensions class x structure x node x measure x statistic. built once from a profile dataframe
+## and shared by plot_profiles, compute_references and output_reference_json so they don't have to re-aggregate the raw table
+class ProfileSummaryCube:
+
+    dims = ('classID','structureID','nodeID','measure','statistic')
+
+    def __init__(self,values,coords,colors=None):
+
+        self.values = values
+        self.coords = { f: list(coords[f]) for f in self.dims }
+        self.colors = colors if colors else {}
+        self._positions = { f: { l: i for i, l in enumerate(self.coords[f]) } for f in self.dims }
+
+    def __repr__(self):
+        return 'ProfileSummaryCube(%s)' %', '.join([ '%s: %d' %(f,len(self.coords[f])) for f in self.dims ])
+
+    ## returns the array for the selected labels. dimensions that are selected with a single label are dropped, like xarray's sel
+    def sel(self,**labels):
+
+        # index one dimension at a time so lists of labels don't broadcast against each other
+        out = self.values
+        axis = 0
+        for dim in self.dims:
+            if dim not in labels:
+                axis = axis + 1
+            elif isinstance(labels[dim],(list,tuple,np.ndarray)):
+                out = np.take(out,[ self._positions[dim][f] for f in labels[dim] ],axis=axis)
+                axis = axis + 1
+            else:
+                out = np.take(out,self._positions[dim][labels[dim]],axis=axis)
+
+        return out
+
+    ## returns a long dataframe (classID, structureID, nodeID, one column per measure) for a single statistic, in the same layout as
+    ## data.groupby(['classID','structureID','nodeID']).<statistic>().reset_index(). classID and structureID optionally filter the rows
+    def to_frame(self,statistic,classID=None,structureID=None):
+
+        classes = [classID] if classID is not None else self.coords['classID']
+        structures = [structureID] if structureID is not None else self.coords['structureID']
+
+        values = self.sel(classID=classes,structureID=structures,statistic=statistic)
+        index = pd.MultiIndex.from_product([classes,structures,self.coords['nodeID']],names=['classID','structureID','nodeID'])
+        out_df = pd.DataFrame(values.reshape(-1,len(self.coords['measure'])),index=index,columns=self.coords['measure']).reset_index()
+
+        return out_df
+
+    ## saves the cube as a compressed .npz file
+    def save(self,outPath):
+
+        arrays = { 'values': self.values }
+        for dim in self.dims:
+            arrays[dim] = np.asarray(self.coords[dim]) if dim == 'nodeID' else np.asarray(self.coords[dim],dtype=str)
+        arrays['color_keys'] = np.asarray(list(self.colors.keys()),dtype=str)
+        arrays['color_values'] = np.asarray(list(self.colors.values()),dtype=str)
+
+        with open(outPath,'wb') as out_f:
+            np.savez_compressed(out_f,**arrays)
+
+## this function loads a cube saved with ProfileSummaryCube.save
+def load_summary_cube(inPath):
+
+    with np.load(inPath,allow_pickle=False) as f:
+        coords = { dim: f[dim].tolist() for dim in ProfileSummaryCube.dims }
+        colors = dict(zip(f['color_keys'].tolist(),f['color_values'].tolist()))
+        values = f['values']
+
+    return ProfileSummaryCube(values,coords,colors)
+
+## this function builds a cube from a profile dataframe (i.e. tractmeasures) with subjectID, structureID and nodeID columns. all statistics come from a
+## single groupby over group_measure, structureID and nodeID. if group_measure is empty, all subjects are summarized together under the class 'all',
+## which is what the reference functions expect. statistics (default: all SUMMARY_STATISTICS) limits the cube to the ones needed. sem is the std over
+## the square root of the number of subjects in the class, as plot_profiles has always drawn it. if cachePath is set, the cube is loaded from there if it
+## exists (unless overwrite) and saved there otherwise
+def build_summary_cube(data,measures,group_measure='classID',cachePath='',overwrite=False,statistics=SUMMARY_STATISTICS):
+
+    # if already computed, just load it
+    if cachePath and os.path.exists(cachePath) and not overwrite:
+        return load_summary_cube(cachePath)
+
+    statistics = [ f for f in SUMMARY_STATISTICS if f in statistics ]
+
+    # plotting colors for each class, if available
+    colors = {}
+    if group_measure and 'colors' in data.keys():
+        colors = data.groupby(group_measure,sort=False)['colors'].first().to_dict()
+
+    subjects = ['subjectID'] if 'subjectID' in data.columns else []
+    if group_measure:
+        data = data[[group_measure,'structureID','nodeID']+subjects+measures].rename(columns={group_measure: 'classID'})
+    else:
+        data = data[['structureID','nodeID']+subjects+measures].assign(classID='all')
+
+    # labels. classes and structures keep their order of appearance, nodes are sorted
+    classes = data['classID'].unique().tolist()
+    structures = data['structureID'].unique().tolist()
+    nodes = np.sort(data['nodeID'].unique()).tolist()
+    full_index = pd.MultiIndex.from_product([classes,structures,nodes],names=['classID','structureID','nodeID'])
+
+    # group once, then pull each statistic off the same grouping
+    gb = data.groupby(['classID','structureID','nodeID'])[measures]
+    stats = {}
+    for name in [ f for f in ['mean','median','min','max','count'] if f in statistics ]:
+        stats[name] = getattr(gb,name)()
+    if 'std' in statistics or 'sem' in statistics:
+        stats['std'] = gb.std()
+    if 'sem' in statistics:
+        # subjects per class, or values per node for tables without subjectIDs
+        if subjects:
+            stats['sem'] = stats['std'].div(np.sqrt(data.groupby('classID')['subjectID'].nunique()),axis=0,level='classID')
+        else:
+            stats['sem'] = stats['std'] / np.sqrt(gb.count())
+    for name, q in SUMMARY_QUANTILES.items():
+        if name in statistics:
+            stats[name] = gb.quantile(q)
+
+    # reshape every statistic into the dense class x structure x node x measure grid
+    shape = (len(classes),len(structures),len(nodes),len(measures))
+    values = np.stack([ stats[f].reindex(full_index)[measures].values.astype(float).reshape(shape) for f in statistics ],axis=-1)
+
+    coords = {'classID': classes, 'structureID': structures, 'nodeID': nodes, 'measure': measures, 'statistic': statistics}
+    cube = ProfileSummaryCube(values,coords,colors)
+
+    if cachePath:
+        cube.save(cachePath)
+
+    return cube
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import hashlib
+import logging
+import argparse
+import threading
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pybrainlife.data.instrument import logger, instrument, stage
+from pybrainlife.data.cache import hash_frame
+
+### resumable batch pipelines
+## a pipeline is a config file (json, or yaml if pyyaml is installed) declaring stages, each of which runs one of the STAGE_FUNCTIONS below
+## on the outputs of earlier stages. ex:
+##   {"workdir": "pipeline",
+##    "stages": [
+##      {"name": "tractmeasures", "function": "collect_data", "args": {"datatype": "neuro/tractmeasures", "filename": "output_FiberStats.csv"}},
+##      {"name": "profiles", "function": "cut_nodes", "inputs": {"data": "tractmeasures"}, "args": {"num_nodes": 160}},
+##      {"name": "outliers", "function": "outlier_detection", "inputs": {"data": "profiles"},
+##       "args": {"groupby_measure": "nodeID", "measures": ["fa","md"], "threshold": 95, "dist_metric": "euclidean"}},
+##      {"name": "reference", "function": "build_reference_data", "inputs": {"data": "profiles", "outliers": "outliers.outliers"}},
+##      {"name": "reference_json", "function": "output_reference_json", "inputs": {"ref_data": "reference"},
+##       "args": {"measures": ["fa","md"], "resample_points": 200, "data_dir": "references", "filename": "reference"}},
+##      {"name": "plots", "function": "batch_plot_profiles", "inputs": {"stat": "profiles"},
+##       "args": {"diffusion_measures": ["fa","md"], "dir_out": "img", "img_name": "profiles"}}]}
+## an input is '<stage>' (that stage's 'data' output) or '<stage>.<output>'. every output is checkpointed to <workdir>/<stage>/<output>.parquet
+## (or .pkl, for outputs parquet can't hold or without pyarrow) along with a manifest of the stage's fingerprint: a hash of its function,
+## args, the content hashes of its inputs and, for stages reading from outside the pipeline, of their sources (the selected warehouse objects
+## and their finish dates, the input files). a stage whose fingerprint matches its manifest is skipped and its checkpoints are read instead,
+## so a crashed run resumes where it stopped and a stage rerun with unchanged output doesn't invalidate what comes after it. stages that write
+## files outside the workdir (reference jsons, plots) list them in a PRODUCT_COLUMN of their output, and are rerun if any of them is missing.
+## stages whose inputs are ready run concurrently in a pool of threads
+
+## output column listing the files a stage wrote outside its checkpoints
+PRODUCT_COLUMN = 'path'
+
+## stage functions. each takes its inputs and args as keyword arguments and returns a dictionary of output name to dataframe
+def collect_data_stage(datatype,datatype_tags=[],tags=[],filename='',duplicates=False,cacheDir='',backend='pandas',network_records=False):
+
+    from pybrainlife.data.collect import collect_data
+
+    return {'data': collect_data(datatype,datatype_tags,tags,filename,'',duplicates,cacheDir=cacheDir,backend=backend,network_records=network_records)[0]}
+
+def collect_subject_data_stage():
+
+    from pybrainlife.data.collect import collect_subject_data
+
+    return {'data': collect_subject_data()}
+
+def read_table_stage(path,sep=',',backend='pandas'):
+
+    from pybrainlife.data.backend import read_table
+
+    return {'data': read_table(path,sep,backend)}
+
+def join_participants_stage(data,participants,columns=None,how='inner'):
+
+    from pybrainlife.data.index import join_participants
+
+    return {'data': join_participants(data,participants,columns,how)}
+
+def harmonize_data_stage(data,participants,measures,batch_column,covariates=[],feature_columns=['structureID','nodeID'],eb=True):
+
+    from pybrainlife.data.harmonize import harmonize_data
+
+    return {'data': harmonize_data(data,participants,measures,batch_column,covariates,feature_columns,eb)}
+
+## one row per feature and term (see pybrainlife.data.glm)
+def mass_univariate_glm_stage(data,participants,measures,covariates,feature_columns=['structureID','nodeID']):
+
+    from pybrainlife.data.glm import mass_univariate_glm
+
+    return {'data': mass_univariate_glm(data,participants,measures,covariates,feature_columns)}
+
+def cut_nodes_stage(data,num_nodes,dataPath='',savename='',backend='pandas'):
+
+    from pybrainlife.data.manipulate import cut_nodes
+
+    return {'data': cut_nodes(data,num_nodes,dataPath,savename,backend)}
+
+def resample_profiles_stage(data,measures,num_nodes,profile_measures=['subjectID','sessionID','structureID']):
+
+    from pybrainlife.data.manipulate import resample_profiles
+
+    return {'data': resample_profiles(data,measures,num_nodes,profile_measures)}
+
+def compute_mean_data_stage(data,dataPath='',outname='',backend='pandas'):
+
+    from pybrainlife.data.manipulate import compute_mean_data
+
+    return {'data': compute_mean_data(dataPath,data,outname,backend)}
+
+## outlier_detection without building the references, which are the build_reference_data and output_reference_json stages
+def outlier_detection_stage(data,groupby_measure,measures,threshold,dist_metric,structures=None):
+
+    from pybrainlife.data.manipulate import outlier_detection
+
+    structures = structures if structures else data['structureID'].unique().tolist()
+    distances, outliers, _, _ = outlier_detection(data,structures,groupby_measure,measures,threshold,dist_metric,False,True,0,'','','')
+
+    return {'distances': distances, 'outliers': outliers}
+
+def build_reference_data_stage(data,outliers,profile=True,data_dir='',filename='',backend='pandas'):
+
+    from pybrainlife.data.manipulate import build_reference_data
+
+    return {'data': build_reference_data(data,outliers,profile,data_dir,filename,backend)}
+
+## writes the reference jsons. the output lists the json written for every structure
+def output_reference_json_stage(ref_data,measures,data_dir,filename,profile=True,resample_points=0,sourceID='',n_boot=0,ci=95,bundlePath='',
+                                statePath=''):
+
+    from pybrainlife.data.manipulate import output_reference_json
+
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+    output_reference_json(ref_data,measures,profile,resample_points,sourceID,data_dir,filename,n_boot,ci,bundlePath,statePath)
+    structures = ref_data['structureID'].unique().tolist()
+
+    return {'data': pd.DataFrame({'structureID': structures, 'path': [ data_dir+'/'+filename+'_'+f+'.json' for f in structures ]})}
+
+## saves the profile plots, shading the significant nodes of an optional mass_univariate_glm input. the output lists the saved image names and,
+## if dir_out is set, the png written for each
+def batch_plot_profiles_stage(stat,diffusion_measures,dir_out,img_name,structures=None,summary_method='mean',error_method='std',n_procs=1,
+                              significance=None,term='',alpha=0.05):
+
+    from pybrainlife.vis.plots import batch_plot_profiles
+
+    structures = structures if structures else stat['structureID'].unique().tolist()
+    img_names = batch_plot_profiles(structures,stat,diffusion_measures,summary_method,error_method,dir_out,img_name,n_procs,significance,term,alpha)
+
+    # images are named <img_name>_<structure>_<measure>_<measure>.png, in structure x measure order
+    measures = list(diffusion_measures) * len(structures)
+
+    out = pd.DataFrame({'img_name': img_names})
+    if dir_out:
+        out['path'] = [ os.path.join(dir_out,f+'_'+m+'.png') for f, m in zip(img_names,measures) ]
+
+    return {'data': out}
+
+STAGE_FUNCTIONS = {'collect_data': collect_data_stage, 'collect_subject_data': collect_subject_data_stage, 'read_table': read_table_stage,
+                   'join_participants': join_participants_stage, 'harmonize_data': harmonize_data_stage, 'cut_nodes': cut_nodes_stage,
+                   'mass_univariate_glm': mass_univariate_glm_stage, 'resample_profiles': resample_profiles_stage,
+                   'compute_mean_data': compute_mean_data_stage, 'outlier_detection': outlier_detection_stage,
+                   'build_reference_data': build_reference_data_stage, 'output_reference_json': output_reference_json_stage,
+                   'batch_plot_profiles': batch_plot_profiles_stage}
+
+## source fingerprints of the stages that read from outside the pipeline. each takes the pipeline and the stage args
+def collect_data_source(pipeline,args):
+
+    from pybrainlife.data.collect import select_objects
+
+    if args['datatype'] in ['cortex_example','tractmeasures_example']:
+        return file_source('./sample-data/'+args['datatype'].replace('_example','')+'.csv')
+
+    _, _, paths, finish_dates, _, _ = select_objects(pipeline.listing(),args['datatype'],args.get('datatype_tags',[]),args.get('tags',[]),
+                                                     args.get('filename',''),args.get('duplicates',False))
+
+    return hashlib.sha1(repr(list(zip(paths,[ str(f) for f in finish_dates ]))).encode()).hexdigest()
+
+## size and modification time of a file, or None if it doesn't exist
+def file_source(path):
+
+    if not os.path.exists(path):
+        return None
+    info = os.stat(path)
+
+    return [info.st_size,info.st_mtime_ns]
+
+SOURCE_FINGERPRINTS = {'collect_data': collect_data_source,
+                       'collect_subject_data': lambda pipeline, args: file_source('input/participants.json'),
+                       'read_table': lambda pipeline, args: file_source(args['path'])}
+
+## reads a pipeline config file
+def load_pipeline_config(configPath):
+
+    with open(configPath) as config_f:
+        if configPath.endswith(('.yml','.yaml')):
+            import yaml
+            return yaml.safe_load(config_f)
+
+        return json.load(config_f)
+
+## checkpoint i/o. checkpoints are written to a temporary file and moved in place, so a crash never leaves a partial one behind
+def write_checkpoint(data,outPath):
+
+    try:
+        data.to_parquet(outPath+'.parquet.tmp',index=False)
+        os.replace(outPath+'.parquet.tmp',outPath+'.parquet')
+        return outPath+'.parquet'
+    except (ImportError,ValueError,TypeError,NotImplementedError):
+        # no pyarrow, or columns parquet can't hold (i.e. network objects)
+        if os.path.exists(outPath+'.parquet.tmp'):
+            os.remove(outPath+'.parquet.tmp')
+
+    data.to_pickle(outPath+'.pkl.tmp')
+    os.replace(outPath+'.pkl.tmp',outPath+'.pkl')
+
+    return outPath+'.pkl'
+
+def read_checkpoint(inPath):
+
+    if inPath.endswith('.parquet'):
+        return pd.read_parquet(inPath)
+
+    return pd.read_pickle(inPath)
+
+class Pipeline:
+
+    def __init__(self,config,workdir=''):
+
+        self.workdir = workdir if workdir else config.get('workdir','pipeline')
+        self.stages = {}
+        for spec in config['stages']:
+            if spec['name'] in self.stages:
+                raise ValueError('stage %s is declared twice' %spec['name'])
+            if spec['function'] not in STAGE_FUNCTIONS:
+                raise ValueError('stage %s: unknown function %s. choose from %s' %(spec['name'],spec['function'],', '.join(STAGE_FUNCTIONS)))
+            inputs = { f: tuple(v.split('.',1)) if '.' in v else (v,'data') for f, v in spec.get('inputs',{}).items() }
+            self.stages[spec['name']] = {'name': spec['name'], 'function': spec['function'], 'args': spec.get('args',{}), 'inputs': inputs,
+                                         'after': list(spec.get('after',[]))}
+        self.order = self.sort_stages()
+
+        # outputs ('<stage>.<output>') produced or read during this run, and their content hashes
+        self._frames = {}
+        self._hashes = {}
+        self._listing = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'Pipeline(stages: %d, workdir: %s)' %(len(self.stages),self.workdir)
+
+    ## stages a stage waits for
+    def dependencies(self,name):
+
+        return list(dict.fromkeys([ f[0] for f in self.stages[name]['inputs'].values() ] + self.stages[name]['after']))
+
+    ## stage names in dependency order. raises ValueError for unknown or circular dependencies
+    def sort_stages(self):
+
+        order = []
+        visiting = set()
+
+        def visit(name,path):
+            if name in order:
+                return
+            if name not in self.stages:
+                raise ValueError('stage %s depends on unknown stage %s' %(path[-1],name))
+            if name in visiting:
+                raise ValueError('circular dependency: %s' %' -> '.join(path+[name]))
+            visiting.add(name)
+            for f in self.dependencies(name):
+                visit(f,path+[name])
+            order.append(name)
+
+        for name in self.stages:
+            visit(name,[])
+
+        return order
+
+    ## the warehouse listing of the project, fetched once per run
+    def listing(self):
+
+        import requests
+
+        with self._lock:
+            if self._listing is None:
+                self._listing = requests.get('https://brainlife.io/api/warehouse/secondary/list/%s'%os.environ['PROJECT_ID']).json()
+
+        return self._listing
+
+    def stage_dir(self,name):
+
+        return os.path.join(self.workdir,name)
+
+    def read_manifest(self,name):
+
+        manifestPath = os.path.join(self.stage_dir(name),'manifest.json')
+        if not os.path.exists(manifestPath):
+            return None
+
+        with open(manifestPath) as manifest_f:
+            return json.load(manifest_f)
+
+    def write_manifest(self,name,manifest):
+
+        manifestPath = os.path.join(self.stage_dir(name),'manifest.json')
+        with open(manifestPath+'.tmp','w') as manifest_f:
+            json.dump(manifest,manifest_f,indent=2)
+        os.replace(manifestPath+'.tmp',manifestPath)
+
+    ## hash of everything a stage's output depends on. upstream stages must have run (or been skipped) already
+    def fingerprint(self,name):
+
+        spec = self.stages[name]
+        inputs = {}
+        for param, (upstream, output) in spec['inputs'].items():
+            key = upstream+'.'+output
+            if key not in self._hashes:
+                raise ValueError('stage %s: stage %s has no output %s' %(name,upstream,output))
+            inputs[param] = self._hashes[key]
+        source = SOURCE_FINGERPRINTS[spec['function']](self,spec['args']) if spec['function'] in SOURCE_FINGERPRINTS else None
+
+        payload = json.dumps({'function': spec['function'], 'args': spec['args'], 'inputs': inputs, 'source': source},sort_keys=True,default=str)
+
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    ## an output, from this run or from its checkpoint
+    def load_output(self,key):
+
+        with self._lock:
+            if key not in self._frames:
+                upstream, output = key.split('.',1)
+                self._frames[key] = read_checkpoint(self.read_manifest(upstream)['outputs'][output]['path'])
+
+            return self._frames[key].copy(deep=False)
+
+    ## runs one stage, unless its checkpoints are up to date (and force is not set). returns 'ran' or 'skipped'
+    def run_stage(self,name,force=False):
+
+        spec = self.stages[name]
+        fingerprint = self.fingerprint(name)
+        manifest = self.read_manifest(name)
+
+        if (not force and manifest and manifest['fingerprint'] == fingerprint
+                and all([ os.path.exists(f['path']) for f in manifest['outputs'].values() ])
+                and all([ os.path.exists(f) for f in manifest.get('products',[]) ])):
+            logger.info('%s: up to date' %name)
+            with self._lock:
+                for output, f in manifest['outputs'].items():
+                    self._hashes[name+'.'+output] = f['hash']
+            return 'skipped'
+
+        logger.info('%s: running %s' %(name,spec['function']))
+        inputs = { param: self.load_output(upstream+'.'+output) for param, (upstream, output) in spec['inputs'].items() }
+        with stage('pipeline '+name) as record:
+            outputs = STAGE_FUNCTIONS[spec['function']](**inputs,**spec['args'])
+            record['rows'] = sum([ len(f) for f in outputs.values() ])
+
+        # checkpoint every output, then the manifest that marks the stage as done
+        if not os.path.exists(self.stage_dir(name)):
+            os.makedirs(self.stage_dir(name))
+        manifest = {'function': spec['function'], 'fingerprint': fingerprint, 'outputs': {}, 'products': []}
+        for output, data in outputs.items():
+            manifest['outputs'][output] = {'path': write_checkpoint(data,os.path.join(self.stage_dir(name),output)), 'hash': hash_frame(data),
+                                           'rows': len(data)}
+            if PRODUCT_COLUMN in data.columns:
+                manifest['products'] += data[PRODUCT_COLUMN].astype(str).tolist()
+        self.write_manifest(name,manifest)
+
+        with self._lock:
+            for output, data in outputs.items():
+                self._frames[name+'.'+output] = data
+                self._hashes[name+'.'+output] = manifest['outputs'][output]['hash']
+
+        return 'ran'
+
+    ## runs the pipeline, n_threads stages at a time. force is a list of stage names to rerun regardless of their checkpoints, or True for all.
+    ## a failing stage is logged and blocks the stages depending on it; the others still run. returns a dictionary of stage name to
+    ## 'ran', 'skipped', 'failed' or 'blocked'
+    def run(self,n_threads=4,force=[]):
+
+        status = {}
+        pending = list(self.order)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=max(1,n_threads)) as executor:
+            while pending or running:
+                for name in list(pending):
+                    dependencies = [ status.get(f) for f in self.dependencies(name) ]
+                    if any([ f in ['failed','blocked'] for f in dependencies ]):
+                        status[name] = 'blocked'
+                        logger.warning('%s: blocked by a failed stage' %name)
+                        pending.remove(name)
+                    elif all([ f in ['ran','skipped'] for f in dependencies ]):
+                        running[executor.submit(self.run_stage,name,force is True or name in force)] = name
+                        pending.remove(name)
+
+                if not running:
+                    continue
+
+                done, _ = wait(list(running),return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        status[name] = future.result()
+                    except Exception:
+                        logger.exception('%s: failed' %name)
+                        status[name] = 'failed'
+
+        return { f: status[f] for f in self.order }
+
+## this function runs the pipeline declared in configPath. see Pipeline.run
+def run_pipeline(configPath,workdir='',n_threads=4,force=[]):
+
+    config = load_pipeline_config(configPath)
+    if config.get('project_id'):
+        os.environ['PROJECT_ID'] = str(config['project_id'])
+
+    return Pipeline(config,workdir).run(n_threads,force)
+
+## command line entry point: pybrainlife run <config> [--workdir DIR] [--threads N] [--force [STAGE ...]] [--instrument PATH]
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(prog='pybrainlife',description='pybrainlife batch pipelines')
+    commands = parser.add_subparsers(dest='command',required=True)
+    run = commands.add_parser('run',help='run the pipeline declared in a config file, resuming from its checkpoints')
+    run.add_argument('config',help='pipeline config (.json, or .yml / .yaml with pyyaml installed)')
+    run.add_argument('--workdir',default='',help='checkpoint directory (default: the config\'s workdir, or ./pipeline)')
+    run.add_argument('--threads',type=int,default=4,help='number of stages run at once')
+    run.add_argument('--force',nargs='*',default=None,metavar='STAGE',help='rerun these stages (all of them if none are given)')
+    run.add_argument('--instrument',default='',metavar='PATH',help='write stage timings to this json file')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,format='%(asctime)s %(message)s')
+    force = True if args.force == [] else (args.force if args.force else [])
+
+    with instrument() as inst:
+        status = run_pipeline(args.config,args.workdir,args.threads,force)
+    if args.instrument:
+        inst.to_json(args.instrument)
+
+    for name, result in status.items():
+        print('%-30s %s' %(name,result))
+
+    return 1 if any([ f in ['failed','blocked'] for f in status.values() ]) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
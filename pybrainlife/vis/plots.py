@@ -1,20 +1,14 @@
 #!/usr/bin/env python3
 
-import os,sys,glob
-import requests
-from matplotlib import colors as mcolors
+import os
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
-import json
-import seaborn as sns
-from itertools import combinations
-from sklearn.metrics import mean_squared_error
-from scipy import stats
-import bct
-import jgf
-from scipy.signal import resample
-import requests
+from pybrainlife.data.reliability import compute_pair_stats
+from pybrainlife.data.summary import ProfileSummaryCube, build_summary_cube
+from pybrainlife.data.instrument import logger, report_progress
+from pybrainlife.data.glm import significant_nodes
+
+## matplotlib, seaborn, sklearn and scipy are imported inside the functions that draw
 
 ### visualization related scripts
 # groups data by input measure and computes mean for each value in that column. x_stat is a pd dataframe, with each row being a single value, and each column being a different ID value or measure
@@ -30,28 +24,43 @@ def average_within_column(x_stat,y_stat,x_measure,y_measure,measure):
 # can be same pd.dataframe, but indexing of specific subject groups
 def append_within_column(x_stat,y_stat,x_measure,y_measure,measure):
 
-    X,Y = [np.array([]),np.array([])]
-    for i in range(len(x_stat[measure].unique())):
-        x = x_stat[x_stat[measure] == x_stat[measure].unique()[i]][x_measure]
-        y = y_stat[y_stat[measure] == y_stat[measure].unique()[i]][y_measure]
-
-        if np.isnan(x).any() or np.isnan(y).any():
-            print("skipping %s due to nan" %x_stat[measure].unique()[i])
-        else:
-            # checks to make sure the same data
-            if len(x) == len(y):
-                X = np.append(X,x)
-                Y = np.append(Y,y)
+    # pair the i-th unique value of x_stat[measure] with the i-th unique value of y_stat[measure] using integer codes instead of repeated masks
+    x_codes, x_uniques = pd.factorize(x_stat[measure])
+    y_codes, y_uniques = pd.factorize(y_stat[measure])
+    n_groups = min(len(x_uniques),len(y_uniques))
+    x = x_stat[x_measure].values.astype(float)
+    y = y_stat[y_measure].values.astype(float)
+
+    # drop groups without a partner
+    x_valid = x_codes < n_groups
+    y_valid = y_codes < n_groups
+    x_codes, x = x_codes[x_valid], x[x_valid]
+    y_codes, y = y_codes[y_valid], y[y_valid]
+
+    # skip groups containing nans, and groups that don't have the same number of values (checks to make sure the same data)
+    x_nan = np.bincount(x_codes,weights=np.isnan(x),minlength=n_groups)
+    y_nan = np.bincount(y_codes,weights=np.isnan(y),minlength=n_groups)
+    has_nan = (x_nan > 0) | (y_nan > 0)
+    for i in np.where(has_nan)[0]:
+        logger.warning("skipping %s due to nan" %x_uniques[i])
+    keep = ~has_nan & (np.bincount(x_codes,minlength=n_groups) == np.bincount(y_codes,minlength=n_groups))
+
+    # stable sort keeps the original row order within each group
+    x_order = np.argsort(x_codes,kind='stable')
+    y_order = np.argsort(y_codes,kind='stable')
+    X = x[x_order][keep[x_codes[x_order]]]
+    Y = y[y_order][keep[y_codes[y_order]]]
 
     return X,Y
 
-# unravels networks. x_stat and y_stat should be S x M, where S is the number of subjects and M is the adjacency matrix for that subject
+# unravels networks. x_stat and y_stat should be S x M, where S is the number of subjects and M is the adjacency matrix for that subject.
+# returns numpy arrays, so millions of edges never become python lists
 def ravel_network(x_stat,y_stat):
 
     import numpy as np
 
-    X = np.ravel(x_stat).tolist()
-    Y = np.ravel(y_stat).tolist()
+    X = np.ravel(x_stat)
+    Y = np.ravel(y_stat)
 
     return X,Y
 
@@ -60,8 +69,8 @@ def ravel_network(x_stat,y_stat):
 # can be same pd.dataframe, but indexing of specific subject groups
 def ravel_non_network(x_stat,y_stat,x_measure,y_measure):
 
-    X = x_stat[x_measure].to_list()
-    Y = y_stat[y_measure].to_list()
+    X = x_stat[x_measure].to_numpy()
+    Y = y_stat[y_measure].to_numpy()
 
     return X,Y
 
@@ -84,16 +93,19 @@ def setup_data(x_data,y_data,x_measure,y_measure,ravelAverageAppend,isnetwork,me
     return x_stat,y_stat,X,Y
 
 # function to shuffle data and colors
-def shuffle_data_alg(X,Y,hues):
+def shuffle_data_alg(X,Y,hues,*others):
 
     from sklearn.utils import shuffle
 
-    X,Y,hues = shuffle(X,Y,hues)
+    if hues is None:
+        X,Y,*others = shuffle(X,Y,*others)
+    else:
+        X,Y,hues,*others = shuffle(X,Y,hues,*others)
 
-    return X,Y,hues
+    return (X,Y,hues)+tuple(others)
 
-# simple display or figure save function
-def save_or_show_img(dir_out,x_measure,y_measure,img_name):
+# simple display or figure save function. if fig is set (i.e. a figure not managed by pyplot), saves that figure instead of the current pyplot figure
+def save_or_show_img(dir_out,x_measure,y_measure,img_name,fig=None):
     import os,sys
     import matplotlib.pyplot as plt
     import warnings
@@ -116,52 +128,58 @@ def save_or_show_img(dir_out,x_measure,y_measure,img_name):
                 img_name_png = img_name+'_'+x_measure+'_vs_'+y_measure+'.png'
                 img_name_svg = img_name+'_'+x_measure+'_vs_'+y_measure+'.svg'
 
-            plt.savefig(os.path.join(dir_out, img_name_eps),transparent=True)
-            plt.savefig(os.path.join(dir_out, img_name_png))
+            if fig is None:
+                fig = plt.gcf()
+            fig.savefig(os.path.join(dir_out, img_name_eps),transparent=True)
+            fig.savefig(os.path.join(dir_out, img_name_png))
         else:
             plt.show()
 
         # plt.close()
 
+## categories returned by color_distance_scatter, in code order, and the colors used to plot them
+DISTANCE_CATEGORIES = ['lt-one-sd','one-sd','two-sd']
+DISTANCE_COLORS = ['blue','green','red']
+
 # this function will identify data within 1 sd, between 1 and 2sd, and 2 sd or greater within a scatter distrbution. intended to be used when comparing a/b
-# like analyses (i.e. test retest, validity, etc)
-def color_distance_scatter(x,y,perfectOrSlope):
-    from scipy import stats
+# like analyses (i.e. test retest, validity, etc). returns a pandas categorical with DISTANCE_CATEGORIES as categories; its .codes (0: lt-one-sd, 1: one-sd,
+# 2: two-sd) index directly into DISTANCE_COLORS. groups is an optional array the same length as x and y; if set, each group is rotated about its own slope
+# and gets its own sd thresholds, all in one call
+def color_distance_scatter(x,y,perfectOrSlope,groups=None):
     import numpy as np
-    import math
+    import pandas as pd
 
     ### this process creates a list of sd categories by rotating the x,y distribution
     ### by 45 degrees (to make the slope essentially zero) and computing the standard
     ### deviation along the y-axis. then, it identifies whether the y-data falls either
     ### within 1 sd, within 1-2 sd, and greater than 2 sds
 
+    x = np.asarray(x,dtype=float)
+    y = np.asarray(y,dtype=float)
+    if groups is None:
+        groups = np.zeros(len(x),dtype=int)
+    codes, uniques = pd.factorize(np.asarray(groups))
+
     # if users want to compute distribution around perfect 45 deg equality line or around
-    # the actual data slope
+    # the actual data slope of each group
     if perfectOrSlope == True:
-        m = 1
+        m = np.ones(len(uniques))
     else:
-        m,b = np.polyfit(x,y,1)
+        m = compute_pair_stats(x,y,codes).set_index('group')['slope'].reindex(np.arange(len(uniques))).values
 
-    # compute theta as the clockwise atan rotation along m
-    theta = -math.atan(m)
+    # compute theta as the clockwise atan rotation along m. only the rotated y (difference) values are needed
+    theta = -np.arctan(m)[codes]
+    y_dif = np.abs(np.sin(theta) * x + np.cos(theta) * y)
 
-    # generate rotation matrix
-    r = np.array([[np.cos(theta),-np.sin(theta)],[np.sin(theta),np.cos(theta)]])
+    # compute standard deviation thresholds for difference values in each group
+    n = np.bincount(codes,minlength=len(uniques))
+    mean_dif = np.bincount(codes,weights=y_dif,minlength=len(uniques)) / n
+    one_sd = np.sqrt(np.bincount(codes,weights=(y_dif - mean_dif[codes])**2,minlength=len(uniques)) / n)
 
-    # compute rotation
-    [x_dif,y_dif] = r.dot(np.array([x,y]))
+    # determine category (lt-one-sd: within one sd, one sd: within 1 and 2 sds, two-sd: greater or equal to 2 sds)
+    category = np.digitize(y_dif / one_sd[codes],[1,2]).astype(np.int8)
 
-    # set output variable (category)
-    category = []
-
-    # compute standard deviation thresholds for difference values
-    one_sd = np.std(np.abs(y_dif))
-    two_sd = one_sd * 2
-
-    # loop through each data point and determine category (one sd: within 1 and 2 sds, two-sd: greater or equal to 2 sds, lt-one-sd: within one sd)
-    category = [ 'one-sd' if one_sd <= f < two_sd else 'two-sd' if f >= two_sd else 'lt-one-sd' for f in np.abs(y_dif) ]
-
-    return category
+    return pd.Categorical.from_codes(category,DISTANCE_CATEGORIES)
 
 # this function will randomly subsample the data to make lighter visualization images
 def subsample_data(x,y,percentage):
@@ -174,6 +192,25 @@ def subsample_data(x,y,percentage):
 
     return sub_x, sub_y
 
+# draws large point clouds without pushing every point through seaborn. 'hexbin' and 'hist2d' bin the points and color the bins by log counts,
+# 'rasterized' draws the points as one rasterized collection. all three are rasterized, so eps size stays bounded no matter how many points there are.
+# colors is an optional per-point color array for 'rasterized'
+def plot_density_scatter(X,Y,densityMethod,colors=None):
+
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import LogNorm
+
+    ax = plt.gca()
+
+    if densityMethod == 'hexbin':
+        ax.hexbin(X,Y,gridsize=100,bins='log',mincnt=1,cmap='viridis',rasterized=True)
+    elif densityMethod == 'hist2d':
+        ax.hist2d(X,Y,bins=200,cmin=1,norm=LogNorm(),cmap='viridis',rasterized=True)
+    else:
+        ax.scatter(X,Y,s=4,c=colors,linewidths=0,alpha=0.5,rasterized=True)
+
+    return ax
+
 ### visualization related scripts
 # uses seaborn's relplot function to plot data for each unique value in a column of a pandas dataframe (ex. subjects, structureID). useful for supplementary figures or sanity checking or preliminary results
 # column measure is the measure within which each unique value will have its own plot. hue_measure is the column to use for coloring the data. column_wrap is how many panels you want per row
@@ -186,22 +223,24 @@ def relplot_scatter(x_data,y_data,x_measure,y_measure,column_measure,hue_measure
     import numpy as np
     import matplotlib.pyplot as plt
     import seaborn as sns
-    from sklearn.metrics import mean_squared_error
 
     # grab data: CANNOT BE AVERAGE
     [x_stat,y_stat,X,Y] = setup_data(x_data,y_data,x_measure,y_measure,'ravel',False,hue_measure)
 
     p = sns.relplot(x=X,y=Y,col=x_stat[column_measure],hue=x_stat[hue_measure],kind="scatter",s=100,col_wrap=column_wrap)
 
-    # setting counter. looping through axes to add important info and regression lines
-    i = 0
-    for ax in p.axes.flat:
+    # compute r, rmse and linear fit for every panel in one pass
+    panel_stats = compute_pair_stats(X,Y,x_stat[column_measure].values,column_measure).set_index(column_measure)
+
+    # looping through axes to add important info and regression lines
+    for ax, col_name in zip(p.axes.flat,p.col_names):
         x_lim,y_lim = [ax.get_xlim(),ax.get_ylim()]
+        panel = panel_stats.loc[col_name]
 
         if trendline == 'equality':
             ax.plot(x_lim,y_lim,ls="--",c='k')
         elif trendline == 'linreg':
-            m,b = np.polyfit(p.data[p.data[column_measure] == x_stat[column_measure].unique()[i]]['x'],p.data[p.data[column_measure] == y_stat[column_measure].unique()[i]]['y'],1)
+            m,b = [panel['slope'],panel['intercept']]
             ax.plot(ax.get_xticks(),m*ax.get_xticks() + b)
             plt.text(0.1,0.7,'y = %s x + %s' %(str(np.round(m,4)),str(np.round(b,4))),fontsize=12,verticalalignment="top",horizontalalignment="left",transform=ax.transAxes)
 
@@ -210,16 +249,11 @@ def relplot_scatter(x_data,y_data,x_measure,y_measure,column_measure,hue_measure
         ax.set_xlabel(x_measure)
         ax.set_ylabel(y_measure)
 
-        # compute correlation for each subject and add to plots
-        corr = np.corrcoef(p.data[p.data[column_measure] == x_stat[column_measure].unique()[i]]['x'],p.data[p.data[column_measure] == y_stat[column_measure].unique()[i]]['y'])[1][0]
-        plt.text(0.1,0.9,'r = %s' %str(np.round(corr,4)),fontsize=12,verticalalignment="top",horizontalalignment="left",transform=ax.transAxes)
+        # add correlation for each subject to plots
+        plt.text(0.1,0.9,'r = %s' %str(np.round(panel['r'],4)),fontsize=12,verticalalignment="top",horizontalalignment="left",transform=ax.transAxes)
 
-        # compute rmse for each subject and add to plots
-        rmse = np.sqrt(mean_squared_error(p.data[p.data[column_measure] == x_stat[column_measure].unique()[i]]['x'],p.data[p.data[column_measure] == y_stat[column_measure].unique()[i]]['y']))
-        plt.text(0.1,0.8,'rmse = %s' %str(np.round(rmse,4)),fontsize=12,verticalalignment="top",horizontalalignment="left",transform=ax.transAxes)
-
-        # update counter
-        i = i+1
+        # add rmse for each subject to plots
+        plt.text(0.1,0.8,'rmse = %s' %str(np.round(panel['rmse'],4)),fontsize=12,verticalalignment="top",horizontalalignment="left",transform=ax.transAxes)
 
     # save image or show image
     save_or_show_img(dir_out,x_measure,y_measure,img_name)
@@ -230,24 +264,33 @@ def relplot_scatter(x_data,y_data,x_measure,y_measure,column_measure,hue_measure
 # trendline, depending on user input, can either be the linear regression between x_data[x_measure] and y_data[y_measure] or the line of equality
 # dir_out and img_name are the directory where the figures should be saved and the name for the image. will save .eps and .png
 # if want to view plot instead of save, set dir_out=""
-def singleplot_scatter(colors_dict,x_data,y_data,x_measure,y_measure,logX,column_measure,hue_measure,ravelAverageAppend,trendline,shuffleData,colorDistance,perfectOrSlope,subsample_percentage,dir_out,img_name):
+# densityMethod is an optional string value of either 'hexbin', 'hist2d' or 'rasterized' to draw large point clouds (i.e. ravelled networks) with plot_density_scatter
+# instead of seaborn. r, rmse and the linreg trendline are always computed on the full data. isnetwork should be set when x_data and y_data are S x M network arrays for 'ravel'
+def singleplot_scatter(colors_dict,x_data,y_data,x_measure,y_measure,logX,column_measure,hue_measure,ravelAverageAppend,trendline,shuffleData,colorDistance,perfectOrSlope,subsample_percentage,dir_out,img_name,densityMethod='',isnetwork=False):
 
     import os,sys
     import numpy as np
     import matplotlib.pyplot as plt
     import seaborn as sns
-    from sklearn.metrics import mean_squared_error
+    from scipy import stats
 
     # grab data
-    [x_stat,y_stat,X,Y] = setup_data(x_data,y_data,x_measure,y_measure,ravelAverageAppend,False,column_measure)
+    [x_stat,y_stat,X,Y] = setup_data(x_data,y_data,x_measure,y_measure,ravelAverageAppend,isnetwork,column_measure)
 
-    # compute corr and rmse first in case data gets subsampled later
-    corr = np.corrcoef(X,Y)[1][0]
-    rmse = np.sqrt(mean_squared_error(X,Y))
+    # compute corr, rmse and trendline first in case data gets subsampled later
+    pair_stats = compute_pair_stats(X,Y).iloc[0]
+    corr = pair_stats['r']
+    rmse = pair_stats['rmse']
 
-    # map trendlines before subsampling
+    # map trendlines before subsampling. the line is fit on the plotted (log10, if logX) x values
     if trendline == 'linreg':
-        m,b = np.polyfit(X,Y,1)
+        if logX == True:
+            # log10 is only defined for positive x
+            positive = np.asarray(X,dtype=float) > 0
+            fit = compute_pair_stats(np.log10(np.asarray(X,dtype=float)[positive]),np.asarray(Y,dtype=float)[positive]).iloc[0]
+        else:
+            fit = pair_stats
+        m,b = [fit['slope'],fit['intercept']]
     elif trendline == 'groupreg':
         for g in range(len(groups)):
             if stat_name == 'volume':
@@ -260,10 +303,14 @@ def singleplot_scatter(colors_dict,x_data,y_data,x_measure,y_measure,logX,column
 
     if colorDistance:
         category = color_distance_scatter(X,Y,perfectOrSlope)
-    else:
+    elif not isnetwork:
         colors = sns.color_palette('colorblind',len(x_stat[hue_measure]))
 
-    if ravelAverageAppend == 'average':
+    # density plots don't use per-point hues. the distance category codes are kept attached to the points so they shuffle with them
+    codes = category.codes if colorDistance else None
+    if densityMethod or isnetwork:
+        hues = codes
+    elif ravelAverageAppend == 'average':
         if isinstance(x_stat[hue_measure].unique()[0],str):
             hues = x_stat[hue_measure].unique().tolist()
         else:
@@ -272,15 +319,20 @@ def singleplot_scatter(colors_dict,x_data,y_data,x_measure,y_measure,logX,column
         hues = list(x_stat[hue_measure])
 
     if shuffleData == True:
-        X,Y,hues = shuffle_data_alg(X,Y,hues)
+        if colorDistance:
+            X,Y,hues,codes = shuffle_data_alg(X,Y,hues,codes)
+        else:
+            X,Y,hues = shuffle_data_alg(X,Y,hues)
 
     if logX == True:
         X = np.log10(X)
 
-    if colors_dict:
+    if densityMethod:
+        p = plot_density_scatter(X,Y,densityMethod,colors=np.array(DISTANCE_COLORS)[codes] if colorDistance else None)
+    elif colors_dict:
         p = sns.scatterplot(x=X,y=Y,hue=hues,s=100,palette=colors_dict,legend=False)
     elif colorDistance:
-        p = sns.scatterplot(x=X,y=Y,hue=category,hue_order=['two-sd','one-sd','lt-one-sd'],palette=['red','green','blue'],s=100)
+        p = sns.scatterplot(x=X,y=Y,hue=pd.Categorical.from_codes(codes,DISTANCE_CATEGORIES),hue_order=DISTANCE_CATEGORIES[::-1],palette=DISTANCE_COLORS[::-1],s=100)
     else:
         p = sns.scatterplot(x=X,y=Y,hue=hues,s=100)
 
@@ -299,13 +351,14 @@ def singleplot_scatter(colors_dict,x_data,y_data,x_measure,y_measure,logX,column
     if trendline == 'equality':
         p.plot(x_lim,y_lim,ls="--",c='k')
         ax = plt.gca()
-        ax.get_legend().remove()
+        if ax.get_legend():
+            ax.get_legend().remove()
     elif trendline == 'linreg':
-        m,b = np.polyfit(X,Y,1)
         p.plot(p.get_xticks(),m*p.get_xticks() + b,c='k')
         plt.text(0.1,0.7,'y = %s x + %s' %(str(np.round(m,4)),str(np.round(b,4))),fontsize=16,verticalalignment="top",horizontalalignment="left",transform=p.axes.transAxes)
         ax = plt.gca()
-        ax.get_legend().remove()
+        if ax.get_legend():
+            ax.get_legend().remove()
 
     elif trendline == 'groupreg':
         for g in range(len(groups)):
@@ -339,65 +392,135 @@ def singleplot_scatter(colors_dict,x_data,y_data,x_measure,y_measure,logX,column
     # save image or show image
     save_or_show_img(dir_out,x_measure,y_measure,img_name)
 
-# this function will plot group summarized tract profile data, but can also be used with any timeseries-like data
-def plot_profiles(structures,stat,diffusion_measures,summary_method,error_method,dir_out,img_name):
+## this function builds the list of per-structure, per-measure plotting jobs. stat can either be the profile dataframe or a ProfileSummaryCube built
+## with build_summary_cube(stat,diffusion_measures,'classID'); either way the summary and error curves are computed once. each job is a plain dictionary
+## of numpy arrays so it can be drawn locally or sent to a worker process. significance is an optional mass_univariate_glm frame: nodes where term
+## is significant (p_fdr below alpha) are shaded
+def build_profile_jobs(structures,stat,diffusion_measures,summary_method,error_method,dir_out,img_name,significance=None,term='',alpha=0.05):
+
+    # error bar is either: standard error of mean (sem), standard deviation (std)
+    error_stat = 'sem' if error_method == 'sem' else 'std'
+
+    # only the summary and error statistics are computed
+    if isinstance(stat,ProfileSummaryCube):
+        cube = stat
+    else:
+        cube = build_summary_cube(stat,diffusion_measures,'classID',statistics=[summary_method,error_stat])
+
+    # x is nodes
+    x = np.asarray(cube.coords['nodeID'])
 
-    # loop through all structures
+    jobs = []
     for t in structures:
-        print(t)
-        # loop through all measures
         for dm in diffusion_measures:
-            print(dm)
+            lines = []
+            for c in cube.coords['classID']:
+                # y is summary (mean, median, max, main) profile data
+                y = cube.sel(classID=c,structureID=t,measure=dm,statistic=summary_method)
+                err = cube.sel(classID=c,structureID=t,measure=dm,statistic=error_stat)
+                lines.append({'classID': c, 'color': cube.colors.get(c), 'y': y, 'err': err})
 
-            imgname=img_name+"_"+t+"_"+dm
+            significant = significant_nodes(significance,t,dm,x,term,alpha) if significance is not None else None
+            jobs.append({'structure': t, 'measure': dm, 'x': x, 'lines': lines, 'summary_method': summary_method, 'error_method': error_method,
+                         'dir_out': dir_out, 'img_name': img_name+"_"+t+"_"+dm, 'significant': significant})
 
-            # generate figures
-            fig = plt.figure(figsize=(15,15))
+    return jobs
 
-            # fig.patch.set_visible(False)
-            p = plt.subplot()
+## this function draws a single profile plotting job onto an axis
+def draw_profile(ax,job):
 
-            # set title and catch array for legend handle
-            plt.title("%s Profiles %s: %s" %(summary_method,t,dm),fontsize=20)
+    x = job['x']
+    dm = job['measure']
 
-            # loop through groups and plot profile data
-            for g in range(len(stat.classID.unique())):
-                # x is nodes
-                x = stat['nodeID'].unique()
+    # set title
+    ax.set_title("%s Profiles %s: %s" %(job['summary_method'],job['structure'],dm),fontsize=20)
 
-                # y is summary (mean, median, max, main) profile data
-                if summary_method == 'mean':
-                    y = stat[stat['classID'] == stat.classID.unique()[g]].groupby(['structureID','nodeID']).mean()[dm][t]
-                elif summary_method == 'median':
-                    y = stat[stat['classID'] == stat.classID.unique()[g]].groupby(['structureID','nodeID']).median()[dm][t]
-                elif summary_method == 'max':
-                    y = stat[stat['classID'] == stat.classID.unique()[g]].groupby(['structureID','nodeID']).max()[dm][t]
-                elif summary_method == 'min':
-                    y = stat[stat['classID'] == stat.classID.unique()[g]].groupby(['structureID','nodeID']).min()[dm][t]
-
-                # error bar is either: standard error of mean (sem), standard deviation (std)
-                if error_method == 'sem':
-                    err = stat[stat['classID'] == stat.classID.unique()[g]].groupby(['structureID','nodeID']).std()[dm][t] / np.sqrt(len(stat[stat['classID'] == stat.classID.unique()[g]]['subjectID'].unique()))
-                else:
-                    err = stat[stat['classID'] == stat.classID.unique()[g]].groupby(['structureID','nodeID']).std()[dm][t]
-
-                # plot summary
-                plt.plot(x,y,color=stat[stat['classID'] == stat.classID.unique()[g]]['colors'].unique()[0],linewidth=5,label=stat.classID.unique()[g])
-
-                # plot shaded error
-                plt.fill_between(x,y-err,y+err,alpha=0.2,color=stat[stat['classID'] == stat.classID.unique()[g]]['colors'].unique()[0],label='1 %s %s' %(error_method,stat.classID.unique()[g]))
-
-            # set up labels and ticks
-            plt.xlabel('Location',fontsize=18)
-            plt.ylabel(dm,fontsize=18)
-            plt.xticks([x[0],x[-1]],['Begin','End'],fontsize=16)
-            plt.legend(fontsize=16)
-            y_lim = plt.ylim()
-            plt.yticks([np.round(y_lim[0],2),np.mean(y_lim),np.round(y_lim[1],2)],fontsize=16)
-
-            # remove top and right spines from plot
-            p.axes.spines["top"].set_visible(False)
-            p.axes.spines["right"].set_visible(False)
-
-            # save image or show image
-            save_or_show_img(dir_out,dm,dm,imgname)
+    # loop through groups and plot profile data
+    for line in job['lines']:
+        # plot summary
+        ax.plot(x,line['y'],color=line['color'],linewidth=5,label=line['classID'])
+
+        # plot shaded error
+        ax.fill_between(x,line['y']-line['err'],line['y']+line['err'],alpha=0.2,color=line['color'],label='1 %s %s' %(job['error_method'],line['classID']))
+
+    # shade runs of significant nodes
+    if job.get('significant') is not None and job['significant'].any():
+        edges = np.diff(np.concatenate([[0],job['significant'].astype(int),[0]]))
+        for start, stop in zip(np.flatnonzero(edges == 1),np.flatnonzero(edges == -1) - 1):
+            ax.axvspan(x[start]-0.5,x[stop]+0.5,color='grey',alpha=0.15,linewidth=0)
+
+    # set up labels and ticks
+    ax.set_xlabel('Location',fontsize=18)
+    ax.set_ylabel(dm,fontsize=18)
+    ax.set_xticks([x[0],x[-1]])
+    ax.set_xticklabels(['Begin','End'],fontsize=16)
+    ax.legend(fontsize=16)
+    y_lim = ax.get_ylim()
+    ax.set_yticks([np.round(y_lim[0],2),np.mean(y_lim),np.round(y_lim[1],2)])
+    ax.tick_params(axis='y',labelsize=16)
+
+    # remove top and right spines from plot
+    ax.spines["top"].set_visible(False)
+    ax.spines["right"].set_visible(False)
+
+## this function renders and saves a single profile plotting job headlessly. the figure is created on an Agg canvas outside of pyplot so it never
+## touches the interactive backend and is released as soon as it is saved. top-level so it can be used by a process pool
+def render_profile_job(job):
+
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=(15,15))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    draw_profile(ax,job)
+
+    save_or_show_img(job['dir_out'],job['measure'],job['measure'],job['img_name'],fig=fig)
+    fig.clear()
+
+    return job['img_name']
+
+# this function will plot group summarized tract profile data, but can also be used with any timeseries-like data. stat can also be a ProfileSummaryCube.
+# significance is an optional mass_univariate_glm frame (see build_profile_jobs) for shading significant nodes
+def plot_profiles(structures,stat,diffusion_measures,summary_method,error_method,dir_out,img_name,significance=None,term='',alpha=0.05):
+
+    import matplotlib.pyplot as plt
+
+    # compute all summary and error curves once
+    jobs = build_profile_jobs(structures,stat,diffusion_measures,summary_method,error_method,dir_out,img_name,significance,term,alpha)
+
+    for job in jobs:
+        report_progress('%s %s' %(job['structure'],job['measure']))
+
+        # generate figures
+        fig = plt.figure(figsize=(15,15))
+        p = plt.subplot()
+        draw_profile(p,job)
+
+        # save image or show image
+        save_or_show_img(dir_out,job['measure'],job['measure'],job['img_name'])
+
+        # close saved figures so they don't accumulate
+        if dir_out:
+            plt.close(fig)
+
+## this function is the headless batch version of plot_profiles. all summary and error curves are computed in one groupby (or taken from a
+## ProfileSummaryCube), every figure is rendered on the Agg backend and closed once saved, and rendering can be spread over n_procs worker
+## processes. dir_out is required. returns the saved image names
+def batch_plot_profiles(structures,stat,diffusion_measures,summary_method,error_method,dir_out,img_name,n_procs=1,significance=None,term='',alpha=0.05):
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    # make the output directory up front so workers don't race to create it
+    if not os.path.exists(dir_out):
+        os.makedirs(dir_out)
+
+    jobs = build_profile_jobs(structures,stat,diffusion_measures,summary_method,error_method,dir_out,img_name,significance,term,alpha)
+
+    if n_procs > 1:
+        with ProcessPoolExecutor(max_workers=n_procs) as executor:
+            img_names = list(executor.map(render_profile_job,jobs))
+    else:
+        img_names = [ render_profile_job(f) for f in jobs ]
+
+    return img_names
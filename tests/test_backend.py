@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pybrainlife.data.backend import check_backend, groupby_aggregate, read_table, replace_blank_strings
+
+
+def make_data():
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame({'subjectID': np.repeat(['sub-2', 'sub-1', 'sub-3'], 4),
+                         'nodeID': np.tile([1, 2, 3, 4], 3),
+                         'fa': rng.random(12),
+                         'md': rng.random(12),
+                         'structureID': ['af'] * 11 + [' ']})
+    data.loc[5, 'fa'] = np.nan
+
+    return data
+
+
+@pytest.mark.parametrize('backend', ['pyarrow', 'polars'])
+@pytest.mark.parametrize('agg', ['mean', 'std'])
+def test_groupby_aggregate_matches_pandas(backend, agg):
+    pytest.importorskip(backend)
+    pytest.importorskip('pyarrow')
+    data = make_data()
+
+    expected = groupby_aggregate(data, 'subjectID', agg)
+    out = groupby_aggregate(data, 'subjectID', agg, backend)
+
+    pd.testing.assert_frame_equal(out, expected[out.columns], check_dtype=False)
+
+
+@pytest.mark.parametrize('backend', ['pyarrow', 'polars'])
+def test_replace_blank_strings_matches_pandas(backend):
+    pytest.importorskip(backend)
+    pytest.importorskip('pyarrow')
+    data = make_data()
+
+    pd.testing.assert_frame_equal(replace_blank_strings(data, backend), replace_blank_strings(data))
+
+
+def test_check_backend_rejects_unknown():
+    with pytest.raises(ValueError):
+        check_backend('spark')
+
+
+@pytest.mark.parametrize('backend', ['pyarrow', 'polars'])
+def test_read_table_matches_pandas(backend, tmp_path):
+    pytest.importorskip(backend)
+    pytest.importorskip('pyarrow')
+    # missing value strings, empty cells and whitespace-padded integers
+    path = str(tmp_path / 'messy.csv')
+    with open(path, 'w') as f:
+        f.write('subjectID,nodeID,fa,md,tag\n'
+                '001, 1 ,0.5,1,a\n'
+                '002,2,NA,,\n'
+                '003, 3,n/a,2,NULL\n'
+                '004,4 ,nan,#N/A,b\n')
+
+    expected = read_table(path)
+    out = read_table(path, backend=backend)
+    assert expected['tag'].isna().sum() == 2
+    pd.testing.assert_frame_equal(out, expected)
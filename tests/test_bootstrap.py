@@ -0,0 +1,36 @@
+import numpy as np
+
+from pybrainlife.data.bootstrap import bootstrap_indices, bootstrap_mean_ci, bootstrap_means
+
+
+def test_bootstrap_means_match_resampled_loop():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(30, 12))
+    values[4, 2] = np.nan
+
+    # small chunks so several are needed
+    means = bootstrap_means(values, n_boot=200, seed=3, chunk_bytes=4096)
+    expected = np.stack([np.nanmean(values[f], axis=0) for f in bootstrap_indices(30, 200, seed=3)])
+
+    np.testing.assert_allclose(means, expected)
+
+
+def test_bootstrap_mean_ci_brackets_mean():
+    values = np.random.default_rng(1).normal(0.5, 0.05, size=(100, 20))
+
+    lower, upper = bootstrap_mean_ci(values, n_boot=500)
+
+    assert (lower < values.mean(axis=0)).all() and (values.mean(axis=0) < upper).all()
+
+
+def test_reference_json_band_without_resampling():
+    import pandas as pd
+    from pybrainlife.data.manipulate import output_reference_json
+
+    rng = np.random.default_rng(2)
+    data = pd.DataFrame({'structureID': 'cst', 'subjectID': ['sub-%02d' % f for f in range(40)], 'volume': rng.normal(10, 1, 40)})
+
+    reference = output_reference_json(data, ['volume'], False, 0, 'test', '', 'ref', n_boot=300)
+    lower, upper = reference[0]['volume']['mean_ci_lower'], reference[0]['volume']['mean_ci_upper']
+    assert len(reference[0]['volume']['data']) == 40 and len(lower) == 1
+    assert lower[0] < data['volume'].mean() < upper[0]
@@ -0,0 +1,49 @@
+import os
+import time
+import pandas as pd
+import numpy as np
+from pybrainlife.data.cache import DiskCache, hash_frame, parse_cache_key
+
+
+def test_disk_cache_roundtrip(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    key = parse_cache_key('input/sub-1/tractmeasures.csv', '2023-06-01T00:00:00.000Z')
+    frame = pd.DataFrame({'structureID': ['a', 'b'], 'fa': [0.4, 0.5]})
+
+    assert cache.get(key) is None
+    cache.put(key, frame)
+    assert key in cache
+    pd.testing.assert_frame_equal(cache.get(key), frame)
+
+    # a new finish date is a new object
+    assert parse_cache_key('input/sub-1/tractmeasures.csv', '2023-07-01T00:00:00.000Z') != key
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=2500)
+    payload = b'x' * 1000
+    for i, key in enumerate(['aa01', 'bb02']):
+        cache.put(key, payload)
+        os.utime(cache._file(key), (time.time() - 100 + i, time.time() - 100 + i))
+
+    # reading aa01 makes bb02 the least recently used entry
+    cache.get('aa01')
+    cache.put('cc03', payload)
+
+    assert 'aa01' in cache
+    assert 'bb02' not in cache
+    assert 'cc03' in cache
+
+
+def test_hash_frame_hashes_unhashable_cells_by_content():
+    # large arrays share their truncated repr, so they must be told apart by their contents
+    first = np.zeros(10000)
+    second = first.copy()
+    second[5000] = 1
+    assert str(first) == str(second)
+    frame = pd.DataFrame({'subjectID': ['1', '2'], 'matrix': [first, first], 'tags': [['a'], ['b']]})
+    changed = pd.DataFrame({'subjectID': ['1', '2'], 'matrix': [first, second], 'tags': [['a'], ['b']]})
+
+    assert hash_frame(frame) == hash_frame(frame.copy())
+    assert hash_frame(frame) != hash_frame(changed)
+    assert hash_frame(frame) != hash_frame(frame.assign(tags=[['a'], ['c']]))
@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from pybrainlife.data.collect import collect_data, collect_data_multi
+
+
+def make_project(root):
+    rng = np.random.default_rng(0)
+    listing = []
+    for s in range(6):
+        for datatype, name, tags, datatype_tags in [('neuro/tractmeasures', 'tractmeasures', ['prod'], ['cleaned']),
+                                                    ('neuro/tractmeasures', 'tractmeasures_raw', ['prod'], ['raw']),
+                                                    ('neuro/parc-stats', 'parc', ['prod'] if s % 2 else ['test'], [])]:
+            for finish_date in ['2023-06-01T00:00:00.000Z', '2023-07-01T00:00:00.000Z'][:1 + (s == 2)]:
+                path = 'sub-%d/%s/%s' % (s, name, finish_date[:7])
+                os.makedirs(os.path.join(root, 'input', path))
+                pd.DataFrame({'structureID': ['af', 'cst'], 'nodeID': 1, 'fa': rng.random(2)}).to_csv(
+                    os.path.join(root, 'input', path, 'data.csv'), index=False)
+                listing.append({'datatype': {'name': datatype}, 'path': path, 'finish_date': finish_date,
+                                'output': {'meta': {'subject': 'sub-%d' % s, 'session': '1'}, 'tags': tags, 'datatype_tags': datatype_tags}})
+
+    return listing
+
+
+def test_collect_data_multi_matches_collect_data(tmp_path, monkeypatch):
+    import requests
+
+    listing = make_project(str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('PROJECT_ID', 'test')
+
+    class Response:
+        def json(self):
+            return listing
+    monkeypatch.setattr(requests, 'get', lambda url: Response())
+
+    specs = {'cleaned': ('neuro/tractmeasures', ['cleaned'], [], 'data.csv'),
+             'raw': ('neuro/tractmeasures', ['raw', '!cleaned'], ['prod'], 'data.csv'),
+             'parc': ('neuro/parc-stats', [], ['prod', '!test'], 'data.csv')}
+    for duplicates in [False, True]:
+        out = collect_data_multi(specs, duplicates, n_threads=2)
+        for name, (datatype, datatype_tags, tags, filename) in specs.items():
+            data, obj_tags, obj_datatype_tags = collect_data(datatype, datatype_tags, tags, filename, '', duplicates)
+            assert len(data), name
+            pd.testing.assert_frame_equal(out[name][0].reset_index(drop=True), data.reset_index(drop=True))
+            assert out[name][1] == obj_tags and out[name][2] == obj_datatype_tags
@@ -0,0 +1,112 @@
+import hashlib
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from pybrainlife.data.download import download_objects
+
+FILES = {
+    'sub-1/tractmeasures/tractmeasures.csv': b'structureID,nodeID,fa\n' + b'af,1,0.5\n' * 5000,
+    'sub-2/tractmeasures/tractmeasures.csv': b'structureID,nodeID,fa\n' + b'af,1,0.4\n' * 5000,
+}
+
+
+# serves FILES with support for range requests, and counts requests per path
+class RangeHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        path = self.path.lstrip('/')
+        self.server.requests[path] = self.server.requests.get(path, 0) + 1
+        if path not in FILES:
+            self.send_error(404)
+            return
+
+        body = FILES[path]
+        match = re.match(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */%d' % len(body))
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, len(body) - 1, len(body)))
+            body = body[start:]
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    httpd.requests = {}
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def objects():
+    return [{'path': 'sub-1/tractmeasures'}, {'path': 'sub-2/tractmeasures'}]
+
+
+def test_download_resume_and_skip(server, tmp_path):
+    base_url = 'http://127.0.0.1:%d' % server.server_address[1]
+    checksums = {f: hashlib.md5(b).hexdigest() for f, b in FILES.items()}
+
+    # leave a partial download behind for the first object
+    partial = tmp_path / 'sub-1' / 'tractmeasures' / 'tractmeasures.csv.part'
+    partial.parent.mkdir(parents=True)
+    partial.write_bytes(FILES['sub-1/tractmeasures/tractmeasures.csv'][:1000])
+
+    results = download_objects(objects(), 'tractmeasures.csv', base_url, str(tmp_path), max_concurrency=2, checksums=checksums)
+    assert sorted(f['status'] for f in results) == ['downloaded', 'resumed']
+    for path, body in FILES.items():
+        assert (tmp_path / path).read_bytes() == body
+    assert not partial.exists()
+
+    # everything is present now, so nothing is requested again
+    results = download_objects(objects(), 'tractmeasures.csv', base_url, str(tmp_path))
+    assert [f['status'] for f in results] == ['skipped', 'skipped']
+    assert sum(server.requests.values()) == 2
+
+
+def test_download_checksum_mismatch(server, tmp_path):
+    base_url = 'http://127.0.0.1:%d' % server.server_address[1]
+    checksums = {'sub-1/tractmeasures/tractmeasures.csv': 'not-the-checksum'}
+
+    with pytest.raises(IOError, match='checksum mismatch'):
+        download_objects(objects(), 'tractmeasures.csv', base_url, str(tmp_path), checksums=checksums, retries=0)
+    assert not os.path.exists(tmp_path / 'sub-1' / 'tractmeasures' / 'tractmeasures.csv')
+    assert (tmp_path / 'sub-2' / 'tractmeasures' / 'tractmeasures.csv').exists()
+
+
+def test_download_range_not_satisfiable(server, tmp_path):
+    base_url = 'http://127.0.0.1:%d' % server.server_address[1]
+    checksums = {f: hashlib.md5(b).hexdigest() for f, b in FILES.items()}
+
+    # a complete .part file is only checked, an oversized one is downloaded again
+    complete = tmp_path / 'sub-1' / 'tractmeasures' / 'tractmeasures.csv.part'
+    complete.parent.mkdir(parents=True)
+    complete.write_bytes(FILES['sub-1/tractmeasures/tractmeasures.csv'])
+    oversized = tmp_path / 'sub-2' / 'tractmeasures' / 'tractmeasures.csv.part'
+    oversized.parent.mkdir(parents=True)
+    oversized.write_bytes(FILES['sub-2/tractmeasures/tractmeasures.csv'] + b'af,1,0.9\n')
+
+    results = download_objects(objects(), 'tractmeasures.csv', base_url, str(tmp_path), checksums=checksums, retries=0)
+    assert [f['status'] for f in results] == ['resumed', 'downloaded']
+    for path, body in FILES.items():
+        assert (tmp_path / path).read_bytes() == body
+    assert server.requests == {'sub-1/tractmeasures/tractmeasures.csv': 1, 'sub-2/tractmeasures/tractmeasures.csv': 2}
+    assert not complete.exists() and not oversized.exists()
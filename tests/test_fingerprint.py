@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from pybrainlife.data.fingerprint import connectome_fingerprinting, profile_fingerprinting, similarity_matrix
+
+
+def test_blocked_similarity_matches_numpy():
+    rng = np.random.default_rng(0)
+    x, y = rng.normal(size=(7, 30)), rng.normal(size=(5, 30))
+    out = similarity_matrix(x, y, chunk_bytes=1000)
+    np.testing.assert_allclose(out, np.corrcoef(x, y)[:7, 7:], atol=1e-5)
+    distances = similarity_matrix(x, y, 'euclidean', np.float64, chunk_bytes=1000)
+    np.testing.assert_allclose(distances, np.linalg.norm(x[:, None] - y[None], axis=2))
+
+
+def test_fingerprinting_identifies_subjects(tmp_path):
+    rng = np.random.default_rng(1)
+    subjects = ['sub-%02d' % f for f in range(12)]
+    base = {s: rng.normal(size=(10, 10)) for s in subjects}
+    matrices = {}
+    for session in ['1', '2']:
+        for s in subjects:
+            matrices['subject_%s-session_%s' % (s, session)] = base[s] + rng.normal(0, 0.3, size=(10, 10))
+    del matrices['subject_sub-03-session_2']
+
+    out = connectome_fingerprinting(matrices, '1', '2', outPath=str(tmp_path / 'similarity.npy'))
+    assert out['subjects'] == 11 and out['accuracy_rows'] == 1 and out['accuracy_columns'] == 1
+    assert out['i_diff'] > 50 and 'sub-03' not in out['similarity'].index
+    assert np.load(str(tmp_path / 'similarity.npy')).shape == (11, 11)
+
+    data = pd.DataFrame([(s, ses, st, n) for ses in ['1', '2'] for s in subjects for st in ['af', 'cst'] for n in range(1, 11)],
+                        columns=['subjectID', 'sessionID', 'structureID', 'nodeID'])
+    data['fa'] = np.tile(rng.normal(size=12 * 20), 2) + rng.normal(0, 0.3, len(data))
+    out = profile_fingerprinting(data, ['fa'], '1', '2', 'euclidean')
+    assert out['accuracy_rows'] == 1 and out['i_diff'] < 0
+
+
+def test_profile_vectors_built_in_dtype_by_blocks():
+    from pybrainlife.data.fingerprint import profile_vectors
+
+    rng = np.random.default_rng(4)
+    data = pd.DataFrame([(s, st, n) for s in ['sub-3', 'sub-1', 'sub-2', 'sub-4'] for st in ['af', 'cst'] for n in range(1, 6)],
+                        columns=['subjectID', 'structureID', 'nodeID'])
+    data['sessionID'] = '1'
+    data['fa'] = rng.normal(0.5, 0.1, len(data))
+    data['md'] = rng.normal(0.8, 0.1, len(data))
+    data.loc[3, 'fa'] = np.nan
+    data = data.sample(frac=1, random_state=0)
+
+    # blocks of a single row give the same vectors as a pivot
+    values, ids = profile_vectors(data, ['fa', 'md'], chunk_bytes=1)
+    assert values.dtype == np.float32
+    features = data[['structureID', 'nodeID']].drop_duplicates()
+    columns = [(m, st, n) for m in ['fa', 'md'] for st, n in features.itertuples(index=False)]
+    expected = data.pivot_table(index='subjectID', columns=['structureID', 'nodeID'], values=['fa', 'md'], dropna=False)
+    np.testing.assert_allclose(values, expected.loc[ids['subjectID'], columns].to_numpy(dtype=float), rtol=1e-6)
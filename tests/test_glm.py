@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+import pytest
+from pybrainlife.data.glm import edge_glm, fdr_bh, fit_glm, mass_univariate_glm, significant_nodes
+from pybrainlife.vis.plots import build_profile_jobs
+
+
+def test_fit_glm_matches_per_feature_regression():
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=30)
+    values = rng.normal(size=(30, 4)) + np.outer(x, [0, 1, 2, 0])
+    values[3, 1] = np.nan
+    beta, se, t, p = fit_glm(values, np.column_stack([np.ones(30), x]))
+    for j in range(4):
+        valid = ~np.isnan(values[:, j])
+        expected = stats.linregress(x[valid], values[valid, j])
+        np.testing.assert_allclose([beta[1, j], se[1, j], p[1, j]], [expected.slope, expected.stderr, expected.pvalue])
+
+    # a duplicated column doesn't use up a degree of freedom
+    beta, se, t, p = fit_glm(values, np.column_stack([np.ones(30), x, x]))
+    expected = stats.linregress(x, values[:, 0])
+    np.testing.assert_allclose([beta[1, 0] + beta[2, 0], p[1, 0]], [expected.slope, expected.pvalue])
+
+
+def test_fdr_bh():
+    p = np.array([0.01, 0.04, np.nan, 0.03, 0.5])
+    np.testing.assert_allclose(fdr_bh(p), [0.04, 0.16 / 3, np.nan, 0.16 / 3, 0.5])
+
+
+def test_mass_univariate_and_edge_glm():
+    rng = np.random.default_rng(1)
+    subjects = ['sub-%02d' % f for f in range(20)]
+    participants = pd.DataFrame({'subjectID': subjects, 'classID': np.repeat(['control', 'patient'], 10), 'age': rng.uniform(20, 60, 20)})
+    data = pd.DataFrame([(s, st, n) for s in subjects for st in ['af', 'cst'] for n in range(1, 11)],
+                        columns=['subjectID', 'structureID', 'nodeID'])
+    patient = (data['subjectID'] >= 'sub-10') & (data['structureID'] == 'af') & (data['nodeID'] <= 5)
+    data['fa'] = rng.normal(0.5, 0.01, len(data)) + np.where(patient, 0.1, 0)
+
+    out = mass_univariate_glm(data, participants, ['fa'], ['classID', 'age'])
+    assert len(out) == 2 * 10 * 3 and set(out['term']) == {'intercept', 'classID_patient', 'age'}
+    effect = out[out['term'] == 'classID_patient']
+    assert (effect['p_fdr'] < 0.05).sum() == 5
+    jobs = build_profile_jobs(['af'], data.merge(participants), ['fa'], 'mean', 'std', '', 'profiles', out, 'classID_patient')
+    np.testing.assert_array_equal(jobs[0]['significant'], np.arange(1, 11) <= 5)
+
+    matrices = {'subject_%s-session_1' % s: rng.normal(0, 0.1, size=(4, 4)) + (i >= 10) for i, s in enumerate(subjects)}
+    edges = edge_glm(matrices, participants, ['classID'])
+    assert len(edges) == 6 * 2 and (edges.loc[edges['term'] == 'classID_patient', 'beta'] > 0.5).all()
+
+
+def test_glm_skips_missing_covariates():
+    rng = np.random.default_rng(2)
+    subjects = ['sub-%02d' % f for f in range(12)]
+    participants = pd.DataFrame({'subjectID': subjects, 'age': rng.uniform(20, 60, 12)})
+    participants.loc[3, 'age'] = np.nan
+    data = pd.DataFrame([(s, 'af', n) for s in subjects for n in range(1, 4)], columns=['subjectID', 'structureID', 'nodeID'])
+    data['fa'] = rng.normal(0.5, 0.05, len(data))
+
+    out = mass_univariate_glm(data, participants, ['fa'], ['age'])
+    expected = mass_univariate_glm(data[data['subjectID'] != 'sub-03'], participants.dropna(), ['fa'], ['age'])
+    pd.testing.assert_frame_equal(out, expected)
+
+    with pytest.raises(ValueError):
+        significant_nodes(mass_univariate_glm(data, participants, ['fa'], []), 'af', 'fa', [1, 2, 3])
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+from pybrainlife.data.harmonize import combat, harmonize_data
+
+
+def test_combat_without_eb_matches_per_feature_fit():
+    rng = np.random.default_rng(0)
+    site = np.repeat(['a', 'b', 'c'], [10, 12, 8])
+    age = rng.uniform(20, 80, len(site))
+    values = rng.normal(size=(len(site), 5)) + 0.01 * age[:, None]
+    values[site == 'b'] = values[site == 'b'] * 2 + 1
+    out, _ = combat(values, site, age[:, None], eb=False)
+
+    design = np.column_stack([site == 'a', site == 'b', site == 'c', age]).astype(float)
+    for j in range(values.shape[1]):
+        beta = np.linalg.lstsq(design, values[:, j], rcond=None)[0]
+        grand = np.mean(design[:, :3], axis=0) @ beta[:3]
+        sd = np.sqrt(np.mean((values[:, j] - design @ beta)**2))
+        stand = grand + age * beta[3]
+        z = (values[:, j] - stand) / sd
+        for s in 'abc':
+            rows = site == s
+            expected = (z[rows] - z[rows].mean()) / z[rows].std(ddof=1) * sd + stand[rows]
+            np.testing.assert_allclose(out[rows, j], expected)
+
+
+def test_harmonize_data_removes_site_offsets():
+    rng = np.random.default_rng(1)
+    subjects = ['sub-%02d' % f for f in range(24)]
+    data = pd.DataFrame([(s, '1', st, n) for s in subjects for st in ['af', 'cst'] for n in range(1, 11)],
+                        columns=['subjectID', 'sessionID', 'structureID', 'nodeID'])
+    participants = pd.DataFrame({'subjectID': subjects, 'site': np.repeat(['x', 'y'], 12), 'sex': np.tile(['f', 'm'], 12)})
+    data['fa'] = rng.normal(0.5, 0.02, len(data)) + np.where(data['subjectID'] >= 'sub-12', 0.1, 0)
+    data.loc[3, 'fa'] = np.nan
+
+    out = harmonize_data(data, participants, ['fa'], 'site', ['sex'])
+    assert list(out.columns) == list(data.columns) and len(out) == len(data)
+    assert np.isnan(out.loc[3, 'fa'])
+    site_means = out.assign(site=np.repeat(['x', 'y'], 240)).groupby('site')['fa'].mean()
+    assert abs(site_means['x'] - site_means['y']) < 0.01
+
+
+def test_harmonize_data_drops_subjects_missing_covariates():
+    rng = np.random.default_rng(2)
+    subjects = ['sub-%02d' % f for f in range(24)]
+    data = pd.DataFrame([(s, '1', 'af', n) for s in subjects for n in range(1, 11)], columns=['subjectID', 'sessionID', 'structureID', 'nodeID'])
+    data['fa'] = rng.normal(0.5, 0.02, len(data)) + np.where(data['subjectID'] >= 'sub-12', 0.1, 0)
+    participants = pd.DataFrame({'subjectID': subjects, 'site': np.repeat(['x', 'y'], 12), 'sex': np.tile(['f', 'm'], 12),
+                                 'age': rng.uniform(20, 60, 24)})
+    participants.loc[2, 'sex'] = np.nan
+    participants.loc[15, 'age'] = np.nan
+    participants.loc[20, 'site'] = np.nan
+
+    out = harmonize_data(data, participants, ['fa'], 'site', ['sex', 'age'])
+    assert set(out['subjectID']) == set(subjects) - {'sub-02', 'sub-15', 'sub-20'}
+    assert np.isfinite(out['fa']).all()
+
+    complete = participants.dropna()
+    expected = harmonize_data(data[data['subjectID'].isin(complete['subjectID'])], complete, ['fa'], 'site', ['sex', 'age'])
+    np.testing.assert_allclose(out['fa'].to_numpy(), expected['fa'].to_numpy())
+
+
+def test_combat_keeps_constant_features_out_of_the_priors():
+    rng = np.random.default_rng(3)
+    batch = np.repeat(['x', 'y'], 10)
+    values = rng.normal(0, 1, (20, 6)) + np.where(batch == 'y', 1, 0)[:, None]
+
+    out, fit = combat(np.hstack([values, np.full((20, 1), 2.0)]), batch)
+    expected, expected_fit = combat(values, batch)
+    np.testing.assert_allclose(out[:, :6], expected)
+    assert (out[:, 6] == 2).all()
+    np.testing.assert_allclose(fit['gamma'][:, :6], expected_fit['gamma'])
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+from pybrainlife.data.index import SubjectIndex, attach_subject_index, join_participants
+
+
+def test_join_participants_matches_merge():
+    data = pd.DataFrame({'subjectID': np.repeat(['sub-3', 'sub-1', 'sub-2', 'sub-4'], 3),
+                         'sessionID': '1',
+                         'fa': np.arange(12.0)})
+    participants = pd.DataFrame({'subjectID': ['sub-1', 'sub-2', 'sub-3'], 'classID': ['a', 'b', 'a'], 'age': [30, 40, 50]})
+    index = attach_subject_index(data)
+
+    out = join_participants(data, participants)
+
+    pd.testing.assert_frame_equal(out.reset_index(drop=True), pd.merge(data, participants, on='subjectID'))
+    assert out.attrs['subject_index'] is index
+
+    out = join_participants(data, participants, how='left')
+    assert len(out) == len(data)
+    assert out.loc[data['subjectID'] == 'sub-4', 'age'].isna().all()
+
+
+def test_index_from_matrix_keys():
+    index, subjects, sessions = SubjectIndex.from_matrix_keys(['sub-1_sess1', 'sub-2_sess1', 'subject_sub-1-session_2-tags_a-datatype_tags_b'])
+
+    assert index.subjects.tolist() == ['sub-1', 'sub-2']
+    assert subjects.tolist() == [0, 1, 0]
+    assert sessions.tolist() == [0, 1, 2]
+    assert index.sessions[2] == ('sub-1', '2')
+
+
+def test_join_keeps_row_order_without_copy_warnings_or_cycles():
+    import gc
+    import warnings
+    import weakref
+
+    data = pd.DataFrame({'subjectID': np.tile(['sub-2', 'sub-1', 'sub-9'], 4), 'fa': np.arange(12.0)})
+    participants = pd.DataFrame({'subjectID': ['sub-1', 'sub-2'], 'age': [30, 40]})
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        out = join_participants(data, participants)
+        out['fa'] = out['fa'] * 2
+
+    # data's order and index, where an inner merge groups the rows by subject
+    assert out.index.tolist() == [f for f in range(12) if f % 3 != 2]
+    expected = pd.merge(data, participants, on='subjectID').sort_values('fa').reset_index(drop=True)
+    pd.testing.assert_frame_equal(out.assign(fa=out['fa'] / 2).reset_index(drop=True), expected)
+
+    # the index caches the frame's codes without keeping the frame alive
+    reference = weakref.ref(data)
+    gc.disable()
+    try:
+        del data
+        assert reference() is None
+    finally:
+        gc.enable()
+
+
+def test_get_subject_index_attaches_on_first_use():
+    from pybrainlife.data.index import get_subject_index
+
+    data = pd.DataFrame({'subjectID': ['sub-2', 'sub-1', 'sub-2'], 'sessionID': '1', 'fa': [1.0, 2.0, 3.0]})
+    assert 'subject_index' not in data.attrs
+
+    index = get_subject_index(data)
+    assert data.attrs['subject_index'] is index
+    assert get_subject_index(data) is index
+    assert sorted(index.subjects.tolist()) == ['sub-1', 'sub-2']
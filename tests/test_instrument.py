@@ -0,0 +1,50 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from pybrainlife.data.instrument import instrument, report_progress, stage
+
+
+def test_stage_records_and_json(tmp_path):
+    messages = []
+    finished = []
+    with instrument(progress=messages.append, on_stage=finished.append) as inst:
+        with stage('outer', rows=10) as record:
+            record['files'] = 2
+            with stage('inner') as inner:
+                inner['bytes'] = 100
+                report_progress('af')
+                block = np.ones(64 * 1024**2 // 8)
+        del block
+
+    assert messages == ['af']
+    assert [f['stage'] for f in inst.stages] == ['inner', 'outer'] and finished == inst.stages
+    outer = inst.stages[1]
+    assert outer['rows'] == 10 and outer['files'] == 2 and inst.stages[0]['bytes'] == 100
+    if outer['process_peak_rss_mb'] is not None:
+        assert outer['peak_rss_growth_mb'] >= 0 and outer['process_peak_rss_mb'] >= outer['peak_rss_growth_mb']
+
+    path = str(tmp_path / 'stages.json')
+    assert json.loads(inst.to_json(path)) == json.load(open(path))
+    assert json.load(open(path))['stages'][0]['stage'] == 'inner'
+
+    # outside an instrumentation stages are not recorded
+    with stage('ignored') as record:
+        pass
+    assert 'wall_time' not in record and len(inst.stages) == 2
+
+
+def test_wall_time_does_not_double_count_concurrent_stages():
+    def work(name):
+        with stage(name):
+            time.sleep(0.2)
+
+    with instrument() as inst:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(work, ['a', 'b', 'c', 'd']))
+
+    total = inst.to_dict()['wall_time']
+    assert sum(f['wall_time'] for f in inst.stages) > 0.75
+    assert 0.2 <= total < 0.6
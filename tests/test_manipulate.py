@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from pybrainlife.data.manipulate import interpolate_missing_nodes, outlier_detection, resample_profiles
+
+
+def test_resample_profiles_of_different_lengths():
+    rows = []
+    for subject, n_nodes in [('sub-1', 50), ('sub-2', 73)]:
+        position = np.linspace(0, 1, n_nodes)
+        for n in range(n_nodes):
+            rows.append((subject, '1', 'af', n + 1, 2 * position[n], np.nan if n in [0, 3, 4] else 1 + position[n]))
+    data = pd.DataFrame(rows, columns=['subjectID', 'sessionID', 'structureID', 'nodeID', 'fa', 'md'])
+
+    out = resample_profiles(data, ['fa', 'md'], 100)
+
+    assert out.columns.tolist() == data.columns.tolist()
+    assert out.groupby('subjectID').size().tolist() == [100, 100]
+    assert out['nodeID'].tolist() == list(range(1, 101)) * 2
+    # linear profiles stay linear, missing nodes inside a profile are interpolated from their neighbours, and a missing end node takes its
+    # nearest neighbour's value
+    for subject, profile in out.groupby('subjectID'):
+        np.testing.assert_allclose(profile['fa'], np.linspace(0, 2, 100))
+        n_nodes = 50 if subject == 'sub-1' else 73
+        expected = 1 + np.linspace(0, 1, 100)
+        first = np.linspace(0, 1, 100) * (n_nodes - 1) < 1
+        expected[first] = 1 + 1 / (n_nodes - 1)
+        np.testing.assert_allclose(profile['md'], expected)
+
+
+def test_interpolate_missing_nodes_matches_np_interp():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(20, 30, 2))
+    values[rng.random(values.shape) < 0.3] = np.nan
+    values[3, :, 1] = np.nan
+
+    out = interpolate_missing_nodes(values)
+    for p in range(20):
+        for m in range(2):
+            valid = ~np.isnan(values[p, :, m])
+            if valid.any():
+                np.testing.assert_allclose(out[p, :, m], np.interp(np.arange(30), np.flatnonzero(valid), values[p, valid, m]))
+            else:
+                assert np.isnan(out[p, :, m]).all()
+
+
+def test_mahalanobis_outlier_detection():
+    rng = np.random.default_rng(0)
+    rows = []
+    for s in range(40):
+        shift = 0.3 if s == 7 else 0.0
+        for n in range(1, 21):
+            rows.append(('sub-%02d' % s, 'af', n, 0.5 + shift + rng.normal(0, 0.02), 0.8 + rng.normal(0, 0.02)))
+    data = pd.DataFrame(rows, columns=['subjectID', 'structureID', 'nodeID', 'fa', 'md'])
+
+    distances, outliers, reference, _ = outlier_detection(data, ['af'], 'nodeID', ['fa', 'md'], 95, 'mahalanobis', True, True, 20, 'test', '', '')
+
+    assert distances.columns.tolist() == ['subjectID', 'structureID', 'measures', 'distance']
+    assert len(distances) == 40 * 2
+    assert distances.groupby('measures')['distance'].idxmax().map(distances['subjectID']).unique().tolist() == ['sub-07']
+    assert 'sub-07' in outliers['subjectID'].tolist()
+    assert 'sub-07' not in reference['subjectID'].tolist()
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+from pybrainlife.data.manipulate import compute_references, create_distance_dataframe
+from pybrainlife.data.memo import Memo, active_memo, disable_memoization, enable_memoization, memoize
+
+
+def make_profiles(seed=0):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame([('sub-%02d' % s, st, n) for s in range(8) for st in ['af', 'cst'] for n in range(1, 11)],
+                        columns=['subjectID', 'structureID', 'nodeID'])
+    data['fa'] = rng.normal(0.5, 0.05, len(data))
+    return data
+
+
+def test_memoized_results_match_and_are_reused(tmp_path):
+    data = make_profiles()
+    expected = create_distance_dataframe(data, ['af', 'cst'], 'nodeID', ['fa'], 'euclidean')
+
+    with memoize(cacheDir=str(tmp_path)) as memo:
+        first = create_distance_dataframe(data, ['af', 'cst'], 'nodeID', ['fa'], 'euclidean')
+        misses = memo.misses
+        first['distance'] = 0
+        second = create_distance_dataframe(data.copy(), ['af', 'cst'], 'nodeID', ['fa'], 'euclidean')
+        assert memo.misses == misses and memo.hits == 1
+        pd.testing.assert_frame_equal(second, expected)
+
+        # a change to the data is a new key
+        changed = data.copy()
+        changed.loc[0, 'fa'] = 1
+        compute_references(changed, 'nodeID', 'nodeID', ['fa'])
+        assert memo.misses == misses + 1
+
+    # the disk tier outlives the memory tier
+    with memoize(cacheDir=str(tmp_path)) as memo:
+        create_distance_dataframe(data, ['af', 'cst'], 'nodeID', ['fa'], 'euclidean')
+        assert (memo.hits, memo.misses) == (1, 0)
+
+
+def test_memory_tier_evicts_least_recently_used():
+    memo = Memo(max_bytes=3 * 8000)
+    for key in 'abc':
+        memo.put(key, np.zeros(1000))
+    memo.get('a')
+    memo.put('d', np.zeros(1000))
+    assert 'b' not in memo and 'a' in memo and memo.nbytes == 3 * 8000
+    assert memo.evict(8000) == 2 and len(memo) == 1
+
+
+def test_disable_memoization_keeps_memoize_blocks():
+    from concurrent.futures import ThreadPoolExecutor
+
+    data = make_profiles()
+    with memoize() as memo:
+        enabled = enable_memoization()
+        assert active_memo() is enabled
+        disable_memoization()
+        assert active_memo() is memo
+
+        # memoization is process-wide: calls in other threads use the memo too
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(lambda f: compute_references(data, 'nodeID', 'nodeID', ['fa']), range(2)))
+        assert memo.misses + memo.hits == 2 and len(memo) == 1
+    assert active_memo() is None
@@ -0,0 +1,30 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+igraph = pytest.importorskip('igraph')
+jgf = pytest.importorskip('jgf')
+
+from pybrainlife.data.manipulate import parse_networks
+from pybrainlife.data.network import NetworkRecord, load_network_records
+
+
+def test_records_match_igraph(tmp_path):
+    graph = igraph.Graph.Full(6)
+    graph.es['weight'] = np.linspace(0.1, 1.5, graph.ecount()).tolist()
+    graph.vs['name'] = ['node_%d' % f for f in range(6)]
+    graph.vs['degree'] = graph.degree()
+    graph['density'] = graph.density()
+    path = str(tmp_path / 'network.json.gz')
+    jgf.igraph.save(graph, path, compressed=True)
+
+    graph = jgf.igraph.load(path, compressed=True)[0]
+    record = load_network_records(path, compressed=True)[0]
+    assert pickle.loads(pickle.dumps(record)) == record
+    assert NetworkRecord.from_igraph(record.to_igraph()) == record
+
+    ids = {'subjectID': ['sub-1'], 'sessionID': ['1'], 'tags': [['a']], 'datatype_tags': [['b']]}
+    for expected, out in zip(parse_networks(pd.DataFrame(dict(ids, igraph=[graph]))), parse_networks(pd.DataFrame(dict(ids, igraph=[record])))):
+        pd.testing.assert_frame_equal(out, expected, check_dtype=False)
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+from pybrainlife.data.manipulate import output_reference_json
+from pybrainlife.data.online import load_reference_state, merge_sketches, sketch_quantiles, update_reference_jsons
+from pybrainlife.data.references import read_reference_json
+
+
+def make_reference(subjects, seed):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame([(st, s, n) for s in subjects for st in ['af', 'cst'] for n in range(1, 11)],
+                        columns=['structureID', 'subjectID', 'nodeID'])
+    data['fa'] = rng.normal(0.5, 0.05, len(data))
+    data['md'] = rng.normal(0.8, 0.1, len(data))
+    data.loc[4, 'md'] = np.nan
+    return data
+
+
+def test_incremental_update_matches_full_rebuild(tmp_path):
+    first = make_reference(['sub-%02d' % f for f in range(15)], 0)
+    second = make_reference(['sub-%02d' % f for f in range(15, 20)], 1)
+    state = str(tmp_path / 'reference_state.pkl')
+    output_reference_json(first, ['fa', 'md'], True, 20, 'test', str(tmp_path), 'ref', statePath=state)
+
+    # only the new subjects are folded in; subjects already in the reference are skipped
+    updated = update_reference_jsons(state, pd.concat([second, first.iloc[:5]]), ['fa', 'md'], 20, 'test', str(tmp_path), 'ref')
+    assert sorted(updated) == ['af', 'cst'] and len(load_reference_state(state).subjects) == 20
+
+    expected = output_reference_json(pd.concat([first, second]), ['fa', 'md'], True, 20, 'test', '', 'ref')
+    result = read_reference_json(str(tmp_path / 'ref_cst.json'))
+    assert result[0].keys() == expected[0].keys()
+    for meas in ['fa', 'md']:
+        for key, values in expected[0][meas].items():
+            np.testing.assert_allclose(result[0][meas][key], values)
+
+
+def test_compressed_sketch_quantiles_are_close():
+    rng = np.random.default_rng(2)
+    values = rng.normal(size=5000)
+    sketch = None
+    for chunk in np.array_split(values, 10):
+        batch = pd.DataFrame({'structureID': 'af', 'nodeID': 1, 'measure': 'fa', 'value': chunk, 'weight': 1.0})
+        sketch = merge_sketches(sketch, batch, 100)
+    assert len(sketch) <= 100 and sketch['weight'].sum() == 5000
+    for q in [.05, .25, .75, .95]:
+        assert abs(sketch_quantiles(sketch, q)['value'][0] - np.quantile(values, q)) < 0.05
+
+
+def test_state_needs_resampled_dataframe_references(tmp_path):
+    import pytest
+    from pybrainlife.data.summary import build_summary_cube
+
+    data = make_reference(['sub-%02d' % f for f in range(5)], 0)
+    state = str(tmp_path / 'reference_state.pkl')
+    with pytest.raises(ValueError):
+        output_reference_json(data, ['fa'], True, 0, 'test', str(tmp_path), 'ref', statePath=state)
+    with pytest.raises(ValueError):
+        output_reference_json(build_summary_cube(data, ['fa'], group_measure=''), ['fa'], True, 20, 'test', str(tmp_path), 'ref', statePath=state)
+    with pytest.raises(ValueError):
+        update_reference_jsons(state, data, ['fa'], 0, 'test', str(tmp_path), 'ref')
+    assert not (tmp_path / 'ref_af.json').exists()
+
+
+def test_update_warns_about_dropped_bootstrap_bands(tmp_path, caplog):
+    first = make_reference(['sub-%02d' % f for f in range(10)], 0)
+    state = str(tmp_path / 'reference_state.pkl')
+    output_reference_json(first, ['fa'], True, 20, 'test', str(tmp_path), 'ref', n_boot=50, statePath=state)
+    assert 'mean_ci_lower' in read_reference_json(str(tmp_path / 'ref_af.json'))[0]['fa']
+
+    update_reference_jsons(state, make_reference(['sub-10'], 1), ['fa'], 20, 'test', str(tmp_path), 'ref')
+    assert 'confidence bands' in caplog.text
+    assert 'mean_ci_lower' not in read_reference_json(str(tmp_path / 'ref_af.json'))[0]['fa']
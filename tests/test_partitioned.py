@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from pybrainlife.data.manipulate import compute_mean_data, compute_references
+from pybrainlife.data.partitioned import aggregate_partitioned, write_partitioned_dataset
+
+
+@pytest.fixture
+def profiles(tmp_path):
+    rng = np.random.default_rng(0)
+    subjects = ['sub-%02d' % f for f in range(12)]
+    data = pd.DataFrame([(s, st, n) for s in subjects for st in ['af', 'cst'] for n in range(1, 21)],
+                        columns=['subjectID', 'structureID', 'nodeID'])
+    data['classID'] = np.where(data['subjectID'] < 'sub-06', 'control', 'patient')
+    data['fa'] = rng.normal(0.5, 0.05, len(data))
+    data['md'] = rng.normal(0.8, 0.1, len(data))
+    data.loc[7, 'fa'] = np.nan
+    dataset = write_partitioned_dataset(data, str(tmp_path / 'profiles'))
+
+    return data, dataset
+
+
+def test_streamed_aggregates_match_in_memory(profiles):
+    data, dataset = profiles
+    out = aggregate_partitioned(dataset, ['structureID', 'nodeID'], ['mean', 'std', 'count', '25_percentile'], batch_rows=50)
+    grouped = data.groupby(['structureID', 'nodeID'])[['fa', 'md']]
+
+    for name, expected in [('mean', grouped.mean()), ('std', grouped.std()), ('count', grouped.count()), ('25_percentile', grouped.quantile(.25))]:
+        pd.testing.assert_frame_equal(out[name].set_index(['structureID', 'nodeID'])[['fa', 'md']], expected, check_dtype=False)
+
+
+def test_mean_data_and_references_accept_dataset(profiles):
+    data, dataset = profiles
+
+    expected = compute_mean_data('', data, '')
+    out = compute_mean_data('', dataset, '')
+    pd.testing.assert_frame_equal(out, expected[out.columns], check_dtype=False)
+
+    expected = compute_references(data[data['structureID'] == 'af'], 'nodeID', 'nodeID', ['fa', 'md'])
+    out = compute_references(dataset, 'nodeID', 'nodeID', ['fa', 'md'], structureID='af')
+    for e, o in zip(expected, out):
+        pd.testing.assert_frame_equal(o, e[o.columns], check_dtype=False)
+
+
+def test_quantiles_need_partition_keys(profiles):
+    data, dataset = profiles
+
+    with pytest.raises(ValueError):
+        aggregate_partitioned(dataset, ['nodeID'], ['median'])
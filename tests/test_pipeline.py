@@ -0,0 +1,85 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from pybrainlife.pipeline import main, read_checkpoint
+
+
+def test_pipeline_resumes_from_checkpoints(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame([('sub-%02d' % s, st, n) for s in range(10) for st in ['af', 'cst'] for n in range(1, 13)],
+                        columns=['subjectID', 'structureID', 'nodeID'])
+    data['classID'] = np.where(data['subjectID'] < 'sub-05', 'control', 'patient')
+    data['fa'] = rng.normal(0.5, 0.05, len(data))
+    data.to_csv('profiles.csv', index=False)
+
+    config = {'workdir': 'checkpoints', 'stages': [
+        {'name': 'profiles', 'function': 'read_table', 'args': {'path': 'profiles.csv'}},
+        {'name': 'cut', 'function': 'cut_nodes', 'inputs': {'data': 'profiles'}, 'args': {'num_nodes': 10}},
+        {'name': 'outliers', 'function': 'outlier_detection', 'inputs': {'data': 'cut'},
+         'args': {'groupby_measure': 'nodeID', 'measures': ['fa'], 'threshold': 90, 'dist_metric': 'euclidean'}},
+        {'name': 'reference', 'function': 'build_reference_data', 'inputs': {'data': 'cut', 'outliers': 'outliers.outliers'}},
+        {'name': 'reference_json', 'function': 'output_reference_json', 'inputs': {'ref_data': 'reference'},
+         'args': {'measures': ['fa'], 'data_dir': 'references', 'filename': 'reference', 'resample_points': 20}},
+        {'name': 'plots', 'function': 'batch_plot_profiles', 'inputs': {'stat': 'cut'},
+         'args': {'diffusion_measures': ['fa'], 'dir_out': 'img', 'img_name': 'profiles'}}]}
+    with open('pipeline.json', 'w') as f:
+        json.dump(config, f)
+
+    assert main(['run', 'pipeline.json', '--threads', '2']) == 0
+    assert os.path.exists('references/reference_af.json')
+    assert os.path.exists('img/profiles_cst_fa_fa.png')
+    with open('checkpoints/outliers/manifest.json') as f:
+        manifest = json.load(f)
+    distances = read_checkpoint(manifest['outputs']['distances']['path'])
+    assert len(distances) == 20
+
+    # rewriting the source with the same content reruns only the first stage: its output hash is unchanged
+    os.utime('profiles.csv', ns=(0, 0))
+    from pybrainlife.pipeline import run_pipeline
+    status = run_pipeline('pipeline.json')
+    assert status['profiles'] == 'ran'
+    assert all(status[f] == 'skipped' for f in ['cut', 'outliers', 'reference', 'reference_json', 'plots'])
+
+    # forcing a stage with changed args reruns everything downstream of it
+    config['stages'][1]['args']['num_nodes'] = 8
+    with open('pipeline.json', 'w') as f:
+        json.dump(config, f)
+    status = run_pipeline('pipeline.json')
+    assert status['profiles'] == 'skipped'
+    assert all(status[f] == 'ran' for f in ['cut', 'outliers', 'reference', 'reference_json', 'plots'])
+
+    # stages whose files outside the workdir are missing rerun, and --force without stages reruns everything
+    os.remove('references/reference_af.json')
+    os.remove('img/profiles_cst_fa_fa.png')
+    status = run_pipeline('pipeline.json')
+    assert status['reference_json'] == 'ran' and status['plots'] == 'ran'
+    assert status['reference'] == 'skipped'
+    assert os.path.exists('references/reference_af.json') and os.path.exists('img/profiles_cst_fa_fa.png')
+    capsys.readouterr()
+    assert main(['run', 'pipeline.json', '--force']) == 0
+    printed = capsys.readouterr().out.split('\n')
+    assert all(f.split()[-1] == 'ran' for f in printed if f)
+    with open('checkpoints/profiles/manifest.json') as f:
+        assert json.load(f)['products'] == []
+
+
+def test_failed_stage_blocks_downstream(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pd.DataFrame({'subjectID': ['1', '2'], 'structureID': 'af', 'nodeID': 1, 'fa': [0.4, 0.5]}).to_csv('profiles.csv', index=False)
+    config = {'workdir': 'checkpoints', 'stages': [
+        {'name': 'missing', 'function': 'read_table', 'args': {'path': 'missing.csv'}},
+        {'name': 'cut', 'function': 'cut_nodes', 'inputs': {'data': 'missing'}, 'args': {'num_nodes': 1}},
+        {'name': 'mean', 'function': 'compute_mean_data', 'inputs': {'data': 'cut'}},
+        {'name': 'profiles', 'function': 'read_table', 'args': {'path': 'profiles.csv'}}]}
+    with open('pipeline.json', 'w') as f:
+        json.dump(config, f)
+
+    assert main(['run', 'pipeline.json']) == 1
+    from pybrainlife.pipeline import run_pipeline
+    status = run_pipeline('pipeline.json')
+    assert status == {'missing': 'failed', 'cut': 'blocked', 'mean': 'blocked', 'profiles': 'skipped'}
+    assert not os.path.exists('checkpoints/cut')
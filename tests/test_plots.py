@@ -0,0 +1,146 @@
+import matplotlib
+import numpy as np
+import pandas as pd
+import pytest
+
+from pybrainlife.vis.plots import singleplot_scatter
+
+matplotlib.use('Agg')
+
+
+@pytest.mark.parametrize('densityMethod', ['', 'hexbin'])
+@pytest.mark.parametrize('logX', [False, True])
+def test_singleplot_scatter_fits_full_data(densityMethod, logX):
+    import matplotlib.pyplot as plt
+
+    rng = np.random.default_rng(0)
+    x_data = pd.DataFrame({'structureID': np.repeat(['s%d' % f for f in range(50)], 40), 'fa': rng.uniform(1, 10, 2000)})
+    y_data = x_data.assign(fa=2 * np.log10(x_data['fa']) + rng.normal(0, 0.2, 2000))
+
+    plt.figure()
+    singleplot_scatter({}, x_data, y_data, 'fa', 'fa', logX, 'structureID', 'structureID', 'append', 'linreg', False, True, False, 5,
+                       '', 'scatter', densityMethod)
+    ax = plt.gca()
+
+    # the trendline and the printed r come from all 2000 points, not the 5% subsample that is drawn
+    X = np.log10(x_data['fa']) if logX else x_data['fa']
+    slope, intercept = np.polyfit(X, y_data['fa'], 1)
+    line = ax.lines[-1]
+    np.testing.assert_allclose(line.get_ydata(), slope * np.asarray(line.get_xdata()) + intercept)
+    texts = [f.get_text() for f in ax.texts]
+    assert 'r = %s' % np.round(np.corrcoef(x_data['fa'], y_data['fa'])[0, 1], 4) in texts
+    assert 'y = %s x + %s' % (np.round(slope, 4), np.round(intercept, 4)) in texts
+    plt.close('all')
+
+
+def test_batch_plot_profiles_matches_plot_profiles(tmp_path):
+    import matplotlib.image as mpimg
+    from pybrainlife.vis.plots import batch_plot_profiles, build_profile_jobs, plot_profiles
+
+    rng = np.random.default_rng(1)
+    stat = pd.DataFrame([('sub-%02d' % s, st, n) for s in range(9) for st in ['af', 'cst'] for n in range(1, 21)],
+                        columns=['subjectID', 'structureID', 'nodeID'])
+    stat['classID'] = np.where(stat['subjectID'] < 'sub-04', 'control', 'patient')
+    stat['colors'] = np.where(stat['classID'] == 'control', 'blue', 'red')
+    stat['fa'] = rng.normal(0.5, 0.05, len(stat))
+    stat['md'] = rng.normal(0.8, 0.1, len(stat))
+
+    # curves as plot_profiles computed them per figure, before the jobs
+    for error_method in ['std', 'sem']:
+        jobs = build_profile_jobs(['af', 'cst'], stat, ['fa', 'md'], 'mean', error_method, '', 'profiles')
+        for job in jobs:
+            for line in job['lines']:
+                group = stat[stat['classID'] == line['classID']]
+                y = group.groupby(['structureID', 'nodeID']).mean(numeric_only=True)[job['measure']][job['structure']]
+                err = group.groupby(['structureID', 'nodeID']).std(numeric_only=True)[job['measure']][job['structure']]
+                if error_method == 'sem':
+                    err = err / np.sqrt(len(group['subjectID'].unique()))
+                np.testing.assert_allclose(line['y'], y)
+                np.testing.assert_allclose(line['err'], err)
+                assert line['color'] == group['colors'].iloc[0]
+            np.testing.assert_array_equal(job['x'], stat['nodeID'].unique())
+
+    # and the saved images are the same
+    plot_profiles(['af', 'cst'], stat, ['fa', 'md'], 'mean', 'sem', str(tmp_path / 'single'), 'profiles')
+    names = batch_plot_profiles(['af', 'cst'], stat, ['fa', 'md'], 'mean', 'sem', str(tmp_path / 'batch'), 'profiles')
+    assert names == ['profiles_af_fa', 'profiles_af_md', 'profiles_cst_fa', 'profiles_cst_md']
+    for name, measure in zip(names, ['fa', 'md'] * 2):
+        single = mpimg.imread(str(tmp_path / 'single' / (name + '_' + measure + '.png')))
+        batch = mpimg.imread(str(tmp_path / 'batch' / (name + '_' + measure + '.png')))
+        np.testing.assert_array_equal(single, batch)
+
+
+# color_distance_scatter as it was before it was vectorized: one rotation and one python comparison per point
+def color_distance_loop(x, y, perfectOrSlope):
+    import math
+
+    m = 1 if perfectOrSlope else np.polyfit(x, y, 1)[0]
+    theta = -math.atan(m)
+    r = np.array([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+    [x_dif, y_dif] = r.dot(np.array([x, y]))
+    one_sd = np.std(np.abs(y_dif))
+    two_sd = one_sd * 2
+
+    return ['one-sd' if one_sd <= f < two_sd else 'two-sd' if f >= two_sd else 'lt-one-sd' for f in np.abs(y_dif)]
+
+
+@pytest.mark.parametrize('perfectOrSlope', [True, False])
+def test_color_distance_scatter_matches_loop(perfectOrSlope):
+    from pybrainlife.vis.plots import DISTANCE_COLORS, color_distance_scatter
+
+    rng = np.random.default_rng(4)
+    x = rng.normal(0.5, 0.1, 3000)
+    y = 0.9 * x + rng.standard_t(3, 3000) * 0.02
+    groups = np.repeat(['af', 'cst', 'ifof'], 1000)
+
+    out = color_distance_scatter(x, y, perfectOrSlope)
+    assert np.asarray(out).tolist() == color_distance_loop(x, y, perfectOrSlope)
+    # the codes pick the colours seaborn used for each category
+    old_colors = dict(zip(['two-sd', 'one-sd', 'lt-one-sd'], ['red', 'green', 'blue']))
+    assert [DISTANCE_COLORS[f] for f in out.codes] == [old_colors[f] for f in np.asarray(out)]
+
+    # groups give the same result as calling the loop once per group
+    out = color_distance_scatter(x, y, perfectOrSlope, groups)
+    for g in ['af', 'cst', 'ifof']:
+        keep = groups == g
+        assert np.asarray(out)[keep].tolist() == color_distance_loop(x[keep], y[keep], perfectOrSlope)
+
+
+def test_singleplot_scatter_colors_follow_shuffled_points():
+    import matplotlib.colors as mcolors
+    import matplotlib.pyplot as plt
+    from pybrainlife.vis.plots import DISTANCE_COLORS, color_distance_scatter
+
+    rng = np.random.default_rng(2)
+    x_data = pd.DataFrame({'structureID': np.repeat(['s%d' % f for f in range(20)], 10), 'fa': rng.uniform(0, 1, 200)})
+    y_data = x_data.assign(fa=x_data['fa'] + rng.normal(0, 0.1, 200))
+
+    plt.figure()
+    singleplot_scatter({}, x_data, y_data, 'fa', 'fa', False, 'structureID', 'structureID', 'append', 'equality', True, True, False, False,
+                       '', 'scatter')
+    points = plt.gca().collections[0]
+
+    # every drawn point is colored by its own distance category, not by the category of the point that was there before shuffling
+    offsets = np.asarray(points.get_offsets())
+    expected = np.array([mcolors.to_rgba(f) for f in np.array(DISTANCE_COLORS)[color_distance_scatter(offsets[:, 0], offsets[:, 1], False).codes]])
+    np.testing.assert_allclose(points.get_facecolors()[:, :3], expected[:, :3], atol=0.05)
+    plt.close('all')
+
+
+def test_singleplot_scatter_log_fit_ignores_non_positive_x():
+    import matplotlib.pyplot as plt
+
+    rng = np.random.default_rng(3)
+    x_data = pd.DataFrame({'structureID': np.repeat(['s%d' % f for f in range(10)], 10), 'fa': rng.uniform(1, 10, 100)})
+    y_data = x_data.assign(fa=np.log10(x_data['fa']) + rng.normal(0, 0.1, 100))
+    x_data.loc[:4, 'fa'] = 0
+
+    plt.figure()
+    singleplot_scatter({}, x_data, y_data, 'fa', 'fa', True, 'structureID', 'structureID', 'append', 'linreg', False, True, False, False,
+                       '', 'scatter')
+    line = plt.gca().lines[-1]
+
+    slope, intercept = np.polyfit(np.log10(x_data['fa'][5:]), y_data['fa'][5:], 1)
+    assert np.isfinite(line.get_ydata()).all()
+    np.testing.assert_allclose(line.get_ydata(), slope * np.asarray(line.get_xdata()) + intercept)
+    plt.close('all')
@@ -1,5 +1,27 @@
+import os
+import subprocess
+import sys
+
 from pybrainlife import __version__
 
 
 def test_version():
     assert __version__ == '0.1.0'
+
+
+def test_collect_import_does_not_load_plotting_libraries():
+    # run in a fresh interpreter so modules imported by other tests don't leak in
+    code = 'import sys, pybrainlife.data.collect; print(",".join(sorted(m for m in ("matplotlib", "seaborn", "sklearn") if m in sys.modules)))'
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ''
+
+
+def test_loading_a_table_does_not_load_jgf(tmp_path):
+    table = tmp_path / 'tractmeasures.csv'
+    table.write_text('structureID,nodeID,fa\naf,1,0.5\n')
+    code = ('import sys; from pybrainlife.data.collect import load_object_file; load_object_file(sys.argv[1]); '
+            'print(",".join(sorted(m for m in ("jgf", "igraph") if m in sys.modules)))')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, '-c', code, str(table)], cwd=root, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ''
@@ -0,0 +1,39 @@
+import numpy as np
+
+from pybrainlife.data.references import load_reference_bundle, merge_reference_jsons, read_reference_json, write_reference_json
+
+
+def test_merge_and_bundle_references(tmp_path):
+    structures = ['lh_arcuate', 'rh_arcuate']
+    for s in structures:
+        write_reference_json(str(tmp_path / ('structural_%s.json' % s)), [{'structurename': s, 'source': 'test', 'thickness': {'mean': np.arange(3.0)}}])
+        write_reference_json(str(tmp_path / ('diffusion_%s.json' % s)), [{'structurename': s, 'source': 'test', 'fa': {'mean': [0.5, 0.6], 'sd': [0.1, 0.1]}}])
+
+    merged = merge_reference_jsons(structures, str(tmp_path / 'structural'), str(tmp_path / 'diffusion'), str(tmp_path / 'merged'),
+                                   str(tmp_path / 'bundle.npz'), n_threads=2)
+
+    expected = [{'structurename': 'rh_arcuate', 'source': 'test', 'thickness': {'mean': [0.0, 1.0, 2.0]}, 'fa': {'mean': [0.5, 0.6], 'sd': [0.1, 0.1]}}]
+    assert merged['rh_arcuate'] == expected
+    assert read_reference_json(str(tmp_path / 'merged_rh_arcuate.json')) == expected
+
+    bundle = load_reference_bundle(str(tmp_path / 'bundle.npz'))
+    assert bundle.structures == structures
+    assert bundle['rh_arcuate'] == expected
+
+def test_read_json_dump_with_nan(tmp_path):
+
+    # reference jsons written by json.dump hold bare NaN
+    import json
+    for f in ['s','d']:
+        with open(str(tmp_path / (f+'_cst.json')),'w') as out_f:
+            json.dump([{'structurename': 'cst', f+'_meas': {'mean': [1.0, float('nan')]}}],out_f)
+
+    reference = read_reference_json(str(tmp_path / 's_cst.json'))
+    assert reference[0]['s_meas']['mean'][0] == 1.0 and np.isnan(reference[0]['s_meas']['mean'][1])
+
+    merged = merge_reference_jsons(['cst'],str(tmp_path / 's'),str(tmp_path / 'd'),str(tmp_path / 'm'))
+    assert np.isnan(merged['cst'][0]['d_meas']['mean'][1])
+
+    # and they are written back in the same format
+    with open(str(tmp_path / 'm_cst.json')) as in_f:
+        assert 'NaN' in in_f.read()
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from pybrainlife.data.reliability import compute_pair_stats, compute_reliability_stats
+from pybrainlife.vis.plots import DISTANCE_CATEGORIES, color_distance_scatter
+
+
+def make_pairs():
+    rng = np.random.default_rng(0)
+    groups = np.repeat(['af', 'cst', 'ifof'], [40, 25, 60])
+    x = rng.normal(0.5, 0.1, len(groups)) + np.repeat([0, 0.2, 0.4], [40, 25, 60])
+    y = 0.8 * x + rng.normal(0.1, 0.03, len(groups))
+    x[7] = np.nan
+
+    return x, y, groups
+
+
+# icc(2,1) from the two-way anova table of one group's n x 2 ratings (shrout & fleiss)
+def direct_icc(x, y):
+    ratings = np.column_stack([x, y])
+    n, k = ratings.shape
+    grand_mean = ratings.mean()
+    ms_rows = k * np.sum((ratings.mean(axis=1) - grand_mean)**2) / (n - 1)
+    ms_cols = n * np.sum((ratings.mean(axis=0) - grand_mean)**2) / (k - 1)
+    ss_error = np.sum((ratings - ratings.mean(axis=1, keepdims=True) - ratings.mean(axis=0) + grand_mean)**2)
+    ms_error = ss_error / ((n - 1) * (k - 1))
+
+    return (ms_rows - ms_error) / (ms_rows + (k - 1) * ms_error + k * (ms_cols - ms_error) / n)
+
+
+def test_pair_stats_match_per_group_formulas():
+    x, y, groups = make_pairs()
+    out = compute_pair_stats(x, y, groups, 'structureID')
+    assert out['structureID'].tolist() == ['af', 'cst', 'ifof']
+
+    for _, row in out.iterrows():
+        keep = (groups == row['structureID']) & ~np.isnan(x)
+        gx, gy = x[keep], y[keep]
+        slope, intercept = np.polyfit(gx, gy, 1)
+        assert row['n'] == keep.sum()
+        np.testing.assert_allclose([row['r'], row['rmse'], row['slope'], row['intercept'], row['icc']],
+                                   [np.corrcoef(gx, gy)[0, 1], np.sqrt(np.mean((gx - gy)**2)), slope, intercept, direct_icc(gx, gy)])
+
+    data = pd.DataFrame({'structureID': groups, 'x': x, 'y': y})
+    pd.testing.assert_frame_equal(compute_reliability_stats(data, data, 'x', 'y', 'structureID'), out)
+
+
+def test_color_distance_matches_per_group_rotation():
+    x, y, groups = make_pairs()
+    keep = ~np.isnan(x)
+    x, y, groups = x[keep], y[keep], groups[keep]
+
+    for perfect in [True, False]:
+        out = color_distance_scatter(x, y, perfect, groups)
+        for g in np.unique(groups):
+            gx, gy = x[groups == g], y[groups == g]
+            # rotate the group's points about its slope (or the line of equality) and bin the distances by their sd
+            theta = -np.arctan(1 if perfect else np.polyfit(gx, gy, 1)[0])
+            distance = np.abs(np.sin(theta) * gx + np.cos(theta) * gy)
+            one_sd = np.std(distance)
+            expected = np.where(distance >= 2 * one_sd, 'two-sd', np.where(distance >= one_sd, 'one-sd', 'lt-one-sd'))
+            assert list(out.categories) == DISTANCE_CATEGORIES
+            assert np.asarray(out)[groups == g].tolist() == expected.tolist()
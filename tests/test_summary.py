@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pybrainlife.data.manipulate import compute_references, output_reference_json
+from pybrainlife.data.summary import SUMMARY_STATISTICS, build_summary_cube, load_summary_cube
+
+
+def make_profiles():
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame([('sub-%02d' % s, st, n) for s in range(12) for st in ['af', 'cst'] for n in range(1, 6)],
+                        columns=['subjectID', 'structureID', 'nodeID'])
+    data['classID'] = np.where(data['subjectID'] < 'sub-04', 'control', 'patient')
+    data['fa'] = rng.normal(0.5, 0.05, len(data))
+    data['md'] = rng.normal(0.8, 0.1, len(data))
+    data.loc[3, 'fa'] = np.nan
+
+    return data
+
+
+def test_cube_matches_groupby(tmp_path):
+    data = make_profiles()
+    cube = build_summary_cube(data, ['fa', 'md'])
+    assert cube.coords['statistic'] == SUMMARY_STATISTICS
+
+    gb = data.groupby(['classID', 'structureID', 'nodeID'])
+    for statistic in ['mean', 'median', 'min', 'max', 'std', 'count']:
+        expected = getattr(gb[['fa', 'md']], statistic)().reset_index()
+        pd.testing.assert_frame_equal(cube.to_frame(statistic), expected, check_dtype=False)
+    np.testing.assert_allclose(cube.sel(classID='patient', structureID='cst', measure='md', statistic='25_percentile'),
+                               gb['md'].quantile(.25)[('patient', 'cst')].values)
+
+    # sem is over the number of subjects of the class, as plot_profiles draws it
+    std = cube.sel(classID='control', structureID='af', measure='fa', statistic='std')
+    np.testing.assert_allclose(cube.sel(classID='control', structureID='af', measure='fa', statistic='sem'), std / np.sqrt(4))
+
+    path = str(tmp_path / 'cube.npz')
+    cube.save(path)
+    loaded = load_summary_cube(path)
+    assert loaded.coords == cube.coords
+    np.testing.assert_array_equal(loaded.values, cube.values)
+
+
+def test_cube_with_selected_statistics():
+    data = make_profiles()
+    cube = build_summary_cube(data, ['fa'], statistics=['sem', 'mean'])
+    full = build_summary_cube(data, ['fa'])
+    assert cube.coords['statistic'] == ['mean', 'sem']
+    np.testing.assert_array_equal(cube.sel(statistic='sem'), full.sel(statistic='sem'))
+
+
+def test_references_need_a_single_class_cube(tmp_path):
+    data = make_profiles()
+    cube = build_summary_cube(data, ['fa', 'md'], group_measure='')
+
+    references_mean, references_sd = compute_references(cube, 'nodeID', 'nodeID', ['fa', 'md'], 'af')
+    expected_mean, expected_sd = compute_references(data[data['structureID'] == 'af'], 'nodeID', 'nodeID', ['fa', 'md'])
+    np.testing.assert_allclose(references_mean[['fa', 'md']], expected_mean[['fa', 'md']])
+    np.testing.assert_allclose(references_sd[['fa', 'md']], expected_sd[['fa', 'md']])
+
+    with pytest.raises(ValueError):
+        compute_references(cube, 'nodeID', 'nodeID', ['fa', 'md'])
+    with pytest.raises(ValueError):
+        compute_references(build_summary_cube(data, ['fa', 'md']), 'nodeID', 'nodeID', ['fa', 'md'], 'af')
+    with pytest.raises(ValueError):
+        output_reference_json(build_summary_cube(data, ['fa', 'md']), ['fa', 'md'], True, 0, 'test', '', 'ref')
+    with pytest.raises(ValueError):
+        output_reference_json(cube, ['fa', 'md'], False, 0, 'test', '', 'ref')
+
+    references = output_reference_json(cube, ['fa', 'md'], True, 0, 'test', '', 'ref')
+    assert references[0]['structurename'] == 'cst'
+    np.testing.assert_allclose(references[0]['md']['mean'], data[data['structureID'] == 'cst'].groupby('nodeID')['md'].mean())